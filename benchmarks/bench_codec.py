@@ -0,0 +1,76 @@
+"""Compare the cache codecs on payload size and encode/decode time.
+
+    python benchmarks/bench_codec.py [--products 20] [--loops 200]
+"""
+import argparse
+import timeit
+from pathlib import Path
+
+from flaskshop.app import create_app
+from flaskshop.corelib import codec
+from flaskshop.database import db
+from flaskshop.product.models import Category, Product
+from flaskshop.random_data import create_products_by_schema
+from flaskshop.settings import TestConfig
+
+
+class BenchConfig(TestConfig):
+    SQLALCHEMY_DATABASE_URI = "sqlite://"
+    SQLALCHEMY_RECORD_QUERIES = False
+    USE_REDIS = False
+
+
+def get_samples():
+    product = Product.query.first()
+    category = Category.get_by_id(product.category_id)
+    page_ctx = Category.get_product_by_category.original_function(
+        Category, category.id, 1
+    )
+    return {"product": product, "category": category, "page context": page_ctx}
+
+
+def bench(samples, loops):
+    rows = []
+    for name, value in samples.items():
+        for codec_name in codec.CODECS:
+            for threshold in (0, 1):
+                c = codec.CODECS[codec_name]
+                data = codec.encode(value, c, compress_threshold=threshold)
+                enc = timeit.timeit(
+                    lambda: codec.encode(value, c, compress_threshold=threshold),
+                    number=loops,
+                )
+                dec = timeit.timeit(lambda: codec.decode(data), number=loops)
+                rows.append(
+                    (
+                        name,
+                        codec_name + ("+zlib" if threshold else ""),
+                        len(data),
+                        enc / loops * 1e6,
+                        dec / loops * 1e6,
+                    )
+                )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=20)
+    parser.add_argument("--loops", type=int, default=200)
+    args = parser.parse_args()
+
+    app = create_app(BenchConfig)
+    with app.test_request_context():
+        db.create_all()
+        create_products_by_schema(
+            Path("placeholders"), how_many=args.products, create_images=False
+        )
+        rows = bench(get_samples(), args.loops)
+
+    print(f"{'value':<14}{'codec':<14}{'bytes':>8}{'encode us':>12}{'decode us':>12}")
+    for row in rows:
+        print("{:<14}{:<14}{:>8}{:>12.1f}{:>12.1f}".format(*row))
+
+
+if __name__ == "__main__":
+    main()
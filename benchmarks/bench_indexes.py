@@ -0,0 +1,216 @@
+"""Latency of the hot endpoint queries without and with the schema indexes.
+
+Seeds a database with plain inserts, drops every index, times the queries
+the endpoints run, creates the indexes again and times them once more.
+
+    python benchmarks/bench_indexes.py [--products 100000] [--lines 1000000]
+        [--loops 50] [--db sqlite:////tmp/bench_indexes.sqlite3]
+"""
+import argparse
+import random
+import time
+
+from flaskshop.app import create_app
+from flaskshop.checkout.models import Cart, CartLine
+from flaskshop.database import db
+from flaskshop.discount.models import SaleProduct
+from flaskshop.order.models import Order, OrderLine
+from flaskshop.product.models import (
+    Category,
+    Collection,
+    Product,
+    ProductCollection,
+    ProductImage,
+    ProductVariant,
+)
+from flaskshop.settings import TestConfig
+
+BATCH = 10000
+CATEGORIES = 200
+USERS = 20000
+
+
+class BenchConfig(TestConfig):
+    SQLALCHEMY_RECORD_QUERIES = False
+    USE_REDIS = False
+    USE_ES = False
+
+
+def insert(model, rows):
+    rows = iter(rows)
+    while True:
+        batch = [row for _, row in zip(range(BATCH), rows)]
+        if not batch:
+            break
+        db.session.execute(model.__table__.insert(), batch)
+    db.session.commit()
+
+
+def seed(products, lines):
+    insert(Category, (dict(title=f"c{i}", parent_id=0) for i in range(CATEGORIES)))
+    insert(
+        Product,
+        (
+            dict(
+                title=f"p{i}",
+                basic_price=price,
+                effective_price=price,
+                discount=0,
+                category_id=random.randint(1, CATEGORIES),
+                product_type_id=random.randint(1, 20),
+            )
+            for i, price in ((i, random.randint(1, 500)) for i in range(products))
+        ),
+    )
+    insert(
+        ProductVariant,
+        (
+            dict(sku=f"{i}-{j}", product_id=i, quantity=10)
+            for i in range(1, products + 1)
+            for j in range(2)
+        ),
+    )
+    insert(
+        ProductImage,
+        (dict(image="i.png", product_id=i) for i in range(1, products + 1)),
+    )
+    insert(Collection, (dict(title=f"col{i}") for i in range(20)))
+    insert(
+        ProductCollection,
+        (
+            dict(collection_id=random.randint(1, 20), product_id=i)
+            for i in range(1, products + 1, 5)
+        ),
+    )
+    insert(
+        SaleProduct,
+        (dict(sale_id=1, product_id=i) for i in range(1, products + 1, 50)),
+    )
+    orders = max(lines // 5, 1)
+    insert(
+        Order,
+        (
+            dict(token=f"t{i}", user_id=random.randint(1, USERS), status=i % 4)
+            for i in range(orders)
+        ),
+    )
+    insert(
+        OrderLine,
+        (
+            dict(
+                order_id=random.randint(1, orders),
+                product_id=random.randint(1, products),
+                variant_id=random.randint(1, products * 2),
+                quantity=1,
+                unit_price_net=1,
+            )
+            for _ in range(lines)
+        ),
+    )
+    insert(Cart, (dict(user_id=i) for i in range(1, USERS + 1)))
+    insert(
+        CartLine,
+        (
+            dict(cart_id=random.randint(1, USERS), variant_id=i, quantity=1)
+            for i in range(1, products * 2, 7)
+        ),
+    )
+    return orders
+
+
+def endpoints(products, orders):
+    def product():
+        product = Product.query.get(random.randint(1, products))
+        return product.variant, product.images
+
+    def category():
+        Category.get_product_by_category.original_function(
+            Category, random.randint(1, CATEGORIES), 1
+        )
+
+    def collection():
+        ProductCollection.get_product_by_collection.original_function(
+            ProductCollection, random.randint(1, 20), 1
+        )
+
+    def cart():
+        return CartLine.query.filter_by(cart_id=random.randint(1, USERS)).all()
+
+    def order():
+        order = Order.query.filter_by(token=f"t{random.randrange(orders)}").first()
+        return OrderLine.query.filter(OrderLine.order_id == order.id).all()
+
+    def account_orders():
+        return Order.get_user_orders(random.randint(1, USERS))
+
+    return {
+        "/products/<id>": (product, ""),
+        "/products/category/<id>?sort_by=price": (category, "sort_by=price"),
+        "/products/collection/<id>": (collection, ""),
+        "/checkout/cart": (cart, ""),
+        "/orders/<token>": (order, ""),
+        "/account/orders": (account_orders, ""),
+    }
+
+
+def analyze():
+    # planner statistics, a live database keeps them up to date by itself
+    db.session.execute(db.text("ANALYZE"))
+    db.session.commit()
+
+
+def measure(app, endpoints, loops):
+    timings = {}
+    for name, (func, query_string) in endpoints.items():
+        spent = 0
+        for _ in range(loops):
+            # a fresh context per call, like a request, so nothing is reused
+            with app.test_request_context(query_string=query_string):
+                start = time.perf_counter()
+                func()
+                spent += time.perf_counter() - start
+            db.session.remove()
+        timings[name] = spent / loops * 1000
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--lines", type=int, default=1000000)
+    parser.add_argument("--loops", type=int, default=50)
+    parser.add_argument("--db", default="sqlite:////tmp/bench_indexes.sqlite3")
+    args = parser.parse_args()
+
+    BenchConfig.SQLALCHEMY_DATABASE_URI = args.db
+    app = create_app(BenchConfig)
+    random.seed(0)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        indexes = [
+            index for table in db.metadata.sorted_tables for index in table.indexes
+        ]
+        for index in indexes:
+            index.drop(db.engine)
+        start = time.perf_counter()
+        orders = seed(args.products, args.lines)
+        print(f"seeded in {time.perf_counter() - start:.0f}s")
+        analyze()
+    hot = endpoints(args.products, orders)
+
+    before = measure(app, hot, args.loops)
+    with app.app_context():
+        for index in indexes:
+            index.create(db.engine)
+        analyze()
+    after = measure(app, hot, args.loops)
+
+    print(f"{'endpoint':<40}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+    for name in hot:
+        speedup = before[name] / after[name] if after[name] else 0
+        print(f"{name:<40}{before[name]:>12.2f}{after[name]:>12.2f}{speedup:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Fixtures of the microbenchmarks: a seeded in-memory database and a fake
+redis, so the numbers only depend on the code.
+"""
+import pytest
+from flask_login import login_user
+
+from flaskshop.app import create_app
+from flaskshop.account.models import User
+from flaskshop.checkout.models import Cart, CartLine
+from flaskshop.corelib import db as corelib_db
+from flaskshop.corelib import mc
+from flaskshop.database import db
+from flaskshop.discount.models import Voucher
+from flaskshop.product.models import Category, Product, ProductVariant
+from flaskshop.random_data import create_scaled_data, create_vouchers
+from flaskshop.settings import TestConfig
+from flaskshop.utils import jinja_global_varibles
+
+pytest.importorskip("pytest_benchmark")
+fakeredis = pytest.importorskip("fakeredis")
+
+# about 4 pages of 16 products in the biggest categories
+UNIT = {"products": 200, "users": 10, "orders": 20, "sales": 2}
+
+
+class BenchConfig(TestConfig):
+    SQLALCHEMY_DATABASE_URI = "sqlite://"
+    SQLALCHEMY_RECORD_QUERIES = False
+    DEBUG = False
+    DEBUG_TB_ENABLED = False
+    PROFILER_ENABLED = False
+    METRICS_ENABLED = False
+    USE_ES = False
+
+
+@pytest.fixture(scope="session")
+def app():
+    _app = create_app(BenchConfig)
+    jinja_global_varibles(_app)
+    with _app.test_request_context():
+        db.create_all()
+        list(create_scaled_data(1, seed=1, unit=UNIT))
+        list(create_vouchers())
+    return _app
+
+
+@pytest.fixture
+def ctx(app):
+    """A request context per benchmark, ``g`` does not leak between them."""
+    with app.test_request_context() as _ctx:
+        yield _ctx
+    db.session.remove()
+
+
+@pytest.fixture
+def redis(app, ctx, monkeypatch):
+    """The app with ``USE_REDIS`` on a fresh fake redis."""
+    r = fakeredis.FakeRedis()
+    monkeypatch.setitem(app.config, "USE_REDIS", True)
+    monkeypatch.setattr(corelib_db, "rdb", r)
+    monkeypatch.setattr(mc, "rdb", r)
+    return r
+
+
+@pytest.fixture
+def product(ctx):
+    return Product.query.filter(Product.discount > 0).first()
+
+
+@pytest.fixture
+def category(ctx):
+    return (
+        Category.query.filter(Category.parent_id == 0)
+        .order_by(Category.id.desc())
+        .first()
+    )
+
+
+@pytest.fixture
+def cart(ctx):
+    """A cart of 5 lines, of a logged in user."""
+    user = User.query.first()
+    login_user(user)
+    cart = Cart.create(user_id=user.id, quantity=5)
+    for variant in ProductVariant.query.order_by(ProductVariant.id).limit(5):
+        CartLine.create(cart_id=cart.id, variant_id=variant.id, quantity=1)
+    yield cart
+    CartLine.query.filter_by(cart_id=cart.id).delete()
+    cart.delete()
+
+
+@pytest.fixture
+def voucher(ctx):
+    return Voucher.get_by_code("DISCOUNT")
@@ -0,0 +1,103 @@
+"""Microbenchmarks of the code every request goes through.
+
+    pytest benchmarks --benchmark-autosave
+    pytest benchmarks --benchmark-compare --benchmark-compare-fail=median:10%
+
+The first run stores a baseline in ``.benchmarks/``, the second compares
+against the latest saved run and fails when a path got more than 10% slower.
+"""
+from flask import render_template
+
+from flaskshop.checkout.models import CartSnapshot
+from flaskshop.corelib import mc
+from flaskshop.product.models import (
+    MC_KEY_CATEGORY_PRODUCTS,
+    Category,
+    Product,
+    get_product_list_context,
+)
+
+
+def test_gen_key(benchmark):
+    gen_key = mc.gen_key_factory(
+        MC_KEY_CATEGORY_PRODUCTS.format("{category_id}", "{page}"),
+        ["cls", "category_id", "page"],
+        None,
+    )
+    assert benchmark(gen_key, Category, 1, 2)[0] == "product:category:1:products:2"
+
+
+def test_cache_hit(benchmark, redis):
+    @mc.cache("bench:{id}", namespace="bench")
+    def compute(id):
+        return {"id": id, "titles": ["a"] * 16}
+
+    compute(1)
+    assert benchmark(compute, 1)["id"] == 1
+
+
+def test_cache_miss(benchmark, redis):
+    @mc.cache("bench:{id}")
+    def compute(id):
+        return {"id": id}
+
+    def miss():
+        redis.flushdb()
+        return compute(1)
+
+    assert benchmark(miss)["id"] == 1
+
+
+def test_serialize_page(benchmark, category):
+    page = Category.get_product_by_category.original_function(Category, category.id, 1)
+
+    def roundtrip():
+        return mc.load_value(mc.dump_value(page))
+
+    assert len(benchmark(roundtrip)["products"]) == len(page["products"])
+
+
+def test_get_props(benchmark, redis, product):
+    product.set_props({"description": "text"})
+    assert benchmark(product._get_props) == {"description": "text"}
+
+
+def test_product_price(benchmark, product):
+    assert benchmark(lambda: product.price) == product.effective_price
+
+
+def test_cart_total(benchmark, cart):
+    def total():
+        # what a request pays once, the snapshot is kept for the rest of it
+        CartSnapshot.forget(cart.id)
+        return cart.total
+
+    assert benchmark(total) > 0
+
+
+def test_vouchered_price(benchmark, cart, voucher):
+    snapshot = CartSnapshot.of(cart)
+    assert benchmark(voucher.get_vouchered_price, snapshot) >= 0
+
+
+def test_product_list_context(benchmark, app, category):
+    children = [child.id for child in category.children] + [category.id]
+    query = Product.query.filter(Product.category_id.in_(children))
+
+    def context():
+        ctx, filtered = get_product_list_context(query, category)
+        return ctx, filtered.limit(16).all()
+
+    with app.test_request_context("/?sort_by=-price&price_from=5"):
+        ctx, products = benchmark(context)
+    assert ctx["now_sorted_by"] == "price"
+    assert products
+
+
+def test_render_category(benchmark, app, category):
+    with app.test_request_context(f"/products/category/{category.id}"):
+        page = Category.get_product_by_category.original_function(
+            Category, category.id, 1
+        )
+        html = benchmark(render_template, "category/index.html", **page)
+    assert category.title in html
@@ -8,7 +8,7 @@ from flask_login import UserMixin
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.types import Enum
 
-from flaskshop.database import Column, Model, db
+from flaskshop.database import Column, Model, db, table_args
 from flaskshop.extensions import bcrypt
 from flaskshop.constant import Permission
 
@@ -89,7 +89,7 @@ class User(Model, UserMixin):
 
 class UserAddress(Model):
     __tablename__ = "account_address"
-    user_id = Column(db.Integer)
+    user_id = Column(db.Integer, index=True)
     province = Column(db.String(256))
     city = Column(db.String(256))
     district = Column(db.String(256))
@@ -120,5 +120,8 @@ class Role(Model):
 
 class UserRole(Model):
     __tablename__ = "account_user_role"
+    __table_args__ = table_args(
+        db.Index("ix_account_user_role_user_role", "user_id", "role_id"),
+    )
     user_id = Column(db.Integer())
     role_id = Column(db.Integer())
@@ -20,6 +20,8 @@ from flaskshop.extensions import (
     migrate,
     bootstrap,
 )
+from flaskshop.corelib import metrics, profiler
+from flaskshop.corelib.db import rdb
 from flaskshop.settings import Config
 from flaskshop.plugin import spec, manager
 from flaskshop.plugin.models import PluginRegistry
@@ -56,12 +58,29 @@ def create_app(config_object=Config):
     register_commands(app)
     jinja_global_varibles(app)
     log_slow_queries(app)
+    profiler.init_app(app)
+    metrics.init_app(app)
     app.wsgi_app = DispatcherMiddleware(app.wsgi_app, {"/dashboard_api": dashboard_api})
     app.oauth = OAuth(app)
     app.mail = Mail(app)
     return app
 
 
+def reset_connections(app, close=True):
+    """Drop the pooled database and redis connections of ``app`` and of the
+    mounted ``dashboard_api``. A forked worker passes ``close=False``, the
+    sockets it inherited are still used by its parent.
+    """
+    for flask_app in (app, dashboard_api):
+        with flask_app.app_context():
+            db.engine.dispose(close=close)
+    if app.config["USE_REDIS"]:
+        if close:
+            rdb.connection_pool.disconnect()
+        else:
+            rdb.connection_pool.reset()
+
+
 def register_extensions(app):
     bcrypt.init_app(app)
     db.init_app(app)
@@ -113,6 +132,13 @@ def register_commands(app):
     app.cli.add_command(commands.seed)
     app.cli.add_command(commands.flushrdb)
     app.cli.add_command(commands.reindex)
+    app.cli.add_command(commands.index_search)
+    app.cli.add_command(commands.rebuild_facets)
+    app.cli.add_command(commands.reprice)
+    app.cli.add_command(commands.hot_sku)
+    app.cli.add_command(commands.reconcile_stock)
+    app.cli.add_command(commands.rebuild_stock)
+    app.cli.add_command(commands.expire_orders)
 
 
 def load_plugins(app):
@@ -1,38 +1,43 @@
-from flask import flash
+from flask import flash, g, has_app_context
 from flask_login import current_user
 
-from flaskshop.database import Column, Model, db
-from flaskshop.product.models import ProductVariant
+from flaskshop.checkout import session_cart
+from flaskshop.database import Column, Model, db, table_args
+from flaskshop.product.models import Product, ProductType, ProductVariant
 from flaskshop.discount.models import Voucher
 from flaskshop.corelib.mc import cache
-from flaskshop.corelib.mc import rdb
+from flaskshop.corelib.mc import invalidate
 
 MC_KEY_CART_BY_USER = "checkout:cart:user_id:{}"
 
 
 class Cart(Model):
     __tablename__ = "checkout_cart"
-    user_id = Column(db.Integer())
+    user_id = Column(db.Integer(), index=True)
     voucher_code = Column(db.String(256))
     quantity = Column(db.Integer())
     shipping_address_id = Column(db.Integer())
     shipping_method_id = Column(db.Integer())
 
+    @property
+    def totals(self):
+        return CartSnapshot.of(self)
+
     @property
     def subtotal(self):
-        return sum(line.subtotal for line in self)
+        return self.totals.subtotal
 
     @property
     def total(self):
-        return self.subtotal + self.shipping_method_price - self.discount_amount
+        return self.totals.total
 
     @property
     def discount_amount(self):
-        return self.voucher.get_vouchered_price(self) if self.voucher_code else 0
+        return self.totals.discount_amount
 
     @property
     def lines(self):
-        return CartLine.query.filter(CartLine.cart_id == self.id).all()
+        return self.totals.lines
 
     @classmethod
     @cache(MC_KEY_CART_BY_USER.format("{user_id}"))
@@ -49,12 +54,15 @@ class Cart(Model):
 
     @classmethod
     def add_to_currentuser_cart(cls, quantity, variant_id):
-        cart = cls.get_current_user_cart()
         variant = ProductVariant.get_by_id(variant_id)
         result, msg = variant.check_enough_stock(quantity)
         if result is False:
             flash(msg, "warning")
             return
+        if session_cart.enabled():
+            session_cart.SessionCart.current(create=True).add(variant_id, quantity)
+            return
+        cart = cls.get_current_user_cart()
         if cart:
             cart.quantity += quantity
             cart.save()
@@ -68,22 +76,14 @@ class Cart(Model):
             CartLine.create(variant_id=variant_id, quantity=quantity, cart_id=cart.id)
 
     def get_product_price(self, product_id):
-        price = 0
-        for line in self:
-            if line.product.id == product_id:
-                price += line.subtotal
-        return price
+        return self.totals.get_product_price(product_id)
 
     def get_category_price(self, category_id):
-        price = 0
-        for line in self:
-            if line.category.id == category_id:
-                price += line.subtotal
-        return price
+        return self.totals.get_category_price(category_id)
 
     @property
     def is_shipping_required(self):
-        return any(line.is_shipping_required for line in self)
+        return self.totals.is_shipping_required
 
     @property
     def shipping_method(self):
@@ -91,9 +91,8 @@ class Cart(Model):
 
     @property
     def shipping_method_price(self):
-        if self.shipping_method:
-            return self.shipping_method.price
-        return 0
+        shipping_method = self.shipping_method
+        return shipping_method.price if shipping_method else 0
 
     @property
     def voucher(self):
@@ -111,7 +110,7 @@ class Cart(Model):
         return len(self.lines)
 
     def update_quantity(self):
-        self.quantity = sum(line.quantity for line in self)
+        self.quantity = self.totals.quantity
         if self.quantity == 0:
             self.delete()
         else:
@@ -120,21 +119,26 @@ class Cart(Model):
 
     @classmethod
     def __flush_insert_event__(cls, target):
-        rdb.delete(MC_KEY_CART_BY_USER.format(current_user.id))
+        invalidate(MC_KEY_CART_BY_USER.format(current_user.id))
 
     @classmethod
     def __flush_after_update_event__(cls, target):
         super().__flush_after_update_event__(target)
-        rdb.delete(MC_KEY_CART_BY_USER.format(current_user.id))
+        invalidate(MC_KEY_CART_BY_USER.format(current_user.id))
+        CartSnapshot.forget(target.id)
 
     @classmethod
     def __flush_delete_event__(cls, target):
         super().__flush_delete_event__(target)
-        rdb.delete(MC_KEY_CART_BY_USER.format(current_user.id))
+        invalidate(MC_KEY_CART_BY_USER.format(current_user.id))
+        CartSnapshot.forget(target.id)
 
 
 class CartLine(Model):
     __tablename__ = "checkout_cartline"
+    __table_args__ = table_args(
+        db.Index("ix_checkout_cartline_cart_variant", "cart_id", "variant_id"),
+    )
     cart_id = Column(db.Integer())
     quantity = Column(db.Integer())
     variant_id = Column(db.Integer())
@@ -142,6 +146,20 @@ class CartLine(Model):
     def __repr__(self):
         return f"CartLine(variant={self.variant}, quantity={self.quantity})"
 
+    @classmethod
+    def __flush_insert_event__(cls, target):
+        CartSnapshot.forget(target.cart_id)
+
+    @classmethod
+    def __flush_after_update_event__(cls, target):
+        super().__flush_after_update_event__(target)
+        CartSnapshot.forget(target.cart_id)
+
+    @classmethod
+    def __flush_delete_event__(cls, target):
+        super().__flush_delete_event__(target)
+        CartSnapshot.forget(target.cart_id)
+
     @property
     def is_shipping_required(self):
         return self.variant.is_shipping_required
@@ -163,6 +181,97 @@ class CartLine(Model):
         return self.variant.price * self.quantity
 
 
+class CartSnapshot:
+    """Lines of a cart with their variants, products and prices, loaded by
+    one query and summed in memory. Vouchers take it in place of the cart.
+
+    One snapshot per cart is kept for the app context, it is dropped when
+    the cart or one of its lines changes.
+    """
+
+    def __init__(self, cart):
+        self.cart = cart
+        rows = (
+            db.session.query(CartLine, ProductVariant, Product, ProductType)
+            .outerjoin(ProductVariant, ProductVariant.id == CartLine.variant_id)
+            .outerjoin(Product, Product.id == ProductVariant.product_id)
+            .outerjoin(ProductType, ProductType.id == Product.product_type_id)
+            .filter(CartLine.cart_id == cart.id)
+            .order_by(CartLine.id)
+            .all()
+        )
+        self.lines = [line for line, _, _, _ in rows]
+        # line.variant, variant.product... are free for the templates
+        for index, model in enumerate((ProductVariant, Product, ProductType), 1):
+            model.remember(row[index] for row in rows if row[index] is not None)
+        self.rows = []
+        self.line_subtotals = {}
+        for line, variant, product, product_type in rows:
+            price = 0
+            if variant is not None:
+                price = variant.price_override or (product and product.price) or 0
+            # effective prices are decimals, basic prices and shipping floats
+            self.line_subtotals[line.id] = float(price) * line.quantity
+            self.rows.append((line, product, product_type))
+        self.shipping_method_price = cart.shipping_method_price
+        self.voucher = cart.voucher
+
+    def __repr__(self):
+        return f"<CartSnapshot cart:{self.cart.id} lines:{len(self.lines)}>"
+
+    @classmethod
+    def of(cls, cart):
+        if not has_app_context():
+            return cls(cart)
+        snapshots = g.setdefault("cart_snapshots", {})
+        if cart.id not in snapshots:
+            snapshots[cart.id] = cls(cart)
+        return snapshots[cart.id]
+
+    @staticmethod
+    def forget(cart_id):
+        if has_app_context():
+            g.get("cart_snapshots", {}).pop(cart_id, None)
+
+    @property
+    def quantity(self):
+        return sum(line.quantity for line in self.lines)
+
+    @property
+    def subtotal(self):
+        return sum(self.line_subtotals.values())
+
+    @property
+    def is_shipping_required(self):
+        return any(
+            product_type is not None and product_type.is_shipping_required
+            for _, _, product_type in self.rows
+        )
+
+    def get_product_price(self, product_id):
+        return sum(
+            self.line_subtotals[line.id]
+            for line, product, _ in self.rows
+            if product is not None and product.id == product_id
+        )
+
+    def get_category_price(self, category_id):
+        return sum(
+            self.line_subtotals[line.id]
+            for line, product, _ in self.rows
+            if product is not None and product.category_id == category_id
+        )
+
+    @property
+    def discount_amount(self):
+        voucher = self.voucher
+        return voucher.get_vouchered_price(self) if voucher else 0
+
+    @property
+    def total(self):
+        return self.subtotal + self.shipping_method_price - float(self.discount_amount)
+
+
 class ShippingMethod(Model):
     __tablename__ = "checkout_shippingmethod"
     title = Column(db.String(256), nullable=False)
@@ -0,0 +1,173 @@
+"""Carts kept in a redis hash until the database needs them.
+
+Adding to the cart is the most frequent write of a browsing visitor, with
+``CART_SESSION_ENABLED`` it is one ``HINCRBY`` on a hash keyed by the
+session, or by the user once logged in, instead of a cart and a line
+written to the database. The hash expires after ``CART_SESSION_TTL`` of
+inactivity. Its lines are merged into the sql cart at login and when the
+checkout starts.
+"""
+from uuid import uuid4
+
+from flask import current_app, session
+from flask_login import current_user
+
+from flaskshop.corelib.db import rdb
+from flaskshop.database import db
+from flaskshop.product.models import ProductVariant
+
+# models imports this module, its classes are looked up when used
+from . import models
+
+MC_KEY_SESSION_CART = "checkout:session_cart:{}"
+
+
+def enabled():
+    return current_app.config["USE_REDIS"] and (
+        current_app.config["CART_SESSION_ENABLED"]
+    )
+
+
+class SessionCartLine:
+    """A cart line for display, made of a variant and a quantity."""
+
+    def __init__(self, variant, quantity):
+        self.variant = variant
+        self.variant_id = variant.id
+        self.quantity = quantity
+
+    @property
+    def product(self):
+        return self.variant.product
+
+    @property
+    def subtotal(self):
+        return float(self.variant.price) * self.quantity
+
+
+class SessionCart:
+    def __init__(self, owner):
+        self.key = MC_KEY_SESSION_CART.format(owner)
+        self.lines = []
+
+    def __repr__(self):
+        return f"<SessionCart {self.key}>"
+
+    @classmethod
+    def for_user(cls, user_id):
+        return cls(f"user:{user_id}")
+
+    @classmethod
+    def for_session(cls, create=False):
+        if "cart_id" not in session:
+            if not create:
+                return None
+            session["cart_id"] = uuid4().hex
+        return cls(f"session:{session['cart_id']}")
+
+    @classmethod
+    def current(cls, create=False):
+        if current_user.is_authenticated:
+            return cls.for_user(current_user.id)
+        return cls.for_session(create)
+
+    def add(self, variant_id, quantity):
+        pipe = rdb.pipeline()
+        pipe.hincrby(self.key, variant_id, quantity)
+        pipe.expire(self.key, current_app.config["CART_SESSION_TTL"])
+        return pipe.execute()[0]
+
+    def items(self):
+        """``{variant_id: quantity}`` of the pending lines."""
+        return {
+            int(variant_id): int(quantity)
+            for variant_id, quantity in rdb.hgetall(self.key).items()
+            if int(quantity) > 0
+        }
+
+    def pop_items(self):
+        pipe = rdb.pipeline()
+        pipe.hgetall(self.key)
+        pipe.delete(self.key)
+        items, _ = pipe.execute()
+        return {int(k): int(v) for k, v in items.items() if int(v) > 0}
+
+    def view(self, base=None):
+        """The pending lines on top of the sql cart ``base``, enough for the
+        cart badge and dropdown. Returns ``base`` when nothing is pending.
+        """
+        items = self.items()
+        if not items:
+            return base
+        if base is not None:
+            for line in base.lines:
+                items[line.variant_id] = items.get(line.variant_id, 0) + line.quantity
+        variants = ProductVariant.warm_related(items)
+        self.lines = [SessionCartLine(v, items[v.id]) for v in variants]
+        return self
+
+    @property
+    def quantity(self):
+        return sum(line.quantity for line in self.lines)
+
+    @property
+    def total(self):
+        return sum(line.subtotal for line in self.lines)
+
+    @property
+    def is_shipping_required(self):
+        return any(line.variant.is_shipping_required for line in self.lines)
+
+
+def merge_into_db(user_id):
+    """Move the pending lines of the session and of ``user_id`` to the sql
+    cart of ``user_id``, with one commit. Returns the sql cart.
+    """
+    items = {}
+    for pending in (SessionCart.for_session(), SessionCart.for_user(user_id)):
+        if pending is None:
+            continue
+        for variant_id, quantity in pending.pop_items().items():
+            items[variant_id] = items.get(variant_id, 0) + quantity
+    if not items:
+        return None
+    try:
+        cart = _add_to_db_cart(user_id, items)
+    except Exception:
+        db.session.rollback()
+        # the hashes are already gone, the lines must not be
+        restore = SessionCart.for_user(user_id)
+        for variant_id, quantity in items.items():
+            restore.add(variant_id, quantity)
+        raise
+    return cart
+
+
+def _add_to_db_cart(user_id, items):
+    Cart, CartLine = models.Cart, models.CartLine
+    cart = Cart.query.filter_by(user_id=user_id).first()
+    if cart is None:
+        cart = Cart(user_id=user_id, quantity=0)
+        db.session.add(cart)
+        db.session.flush()
+    lines = {
+        line.variant_id: line
+        for line in CartLine.query.filter(
+            CartLine.cart_id == cart.id, CartLine.variant_id.in_(items)
+        )
+    }
+    for variant_id, quantity in items.items():
+        if variant_id in lines:
+            lines[variant_id].quantity += quantity
+        else:
+            db.session.add(
+                CartLine(cart_id=cart.id, variant_id=variant_id, quantity=quantity)
+            )
+    cart.quantity = (cart.quantity or 0) + sum(items.values())
+    db.session.commit()
+    return cart
+
+
+def merge_on_login(sender, user, **extra):
+    if enabled():
+        merge_into_db(user.id)
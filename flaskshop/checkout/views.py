@@ -1,9 +1,10 @@
 from flask import Blueprint, render_template, request, redirect, url_for, jsonify, flash
-from flask_login import current_user, login_required
+from flask_login import current_user, login_required, user_logged_in
 from pluggy import HookimplMarker
 from flask_babel import lazy_gettext, format_currency
 import os
 
+from . import session_cart
 from .models import CartLine, Cart, ShippingMethod
 from .forms import NoteForm, VoucherForm
 from flaskshop.account.forms import AddressForm
@@ -36,12 +37,15 @@ def update_cartline(id):
         line.save()
     cart = Cart.query.filter(Cart.user_id == current_user.id).first()
     response["cart"]["numItems"] = cart.update_quantity()
-    response["cart"]["numLines"] = len(cart)
+    totals = cart.totals
+    response["cart"]["numLines"] = len(totals.lines)
     response["subtotal"] = format_currency(
-        line.subtotal, os.environ["BABEL_CURRENCY"], os.environ["BABEL_DEFAULT_LOCALE"]
+        totals.line_subtotals.get(line.id, 0),
+        os.environ["BABEL_CURRENCY"],
+        os.environ["BABEL_DEFAULT_LOCALE"],
     )
     response["total"] = format_currency(
-        cart.total, os.environ["BABEL_CURRENCY"], os.environ["BABEL_DEFAULT_LOCALE"]
+        totals.total, os.environ["BABEL_CURRENCY"], os.environ["BABEL_DEFAULT_LOCALE"]
     )
     return jsonify(response)
 
@@ -115,7 +119,7 @@ def checkout_voucher():
         err_msg = None
         if voucher:
             try:
-                voucher.check_available(cart)
+                voucher.check_available(cart.totals)
             except Exception as e:
                 err_msg = str(e)
         else:
@@ -145,7 +149,10 @@ def flaskshop_load_blueprints(app):
     @login_required
     def before_request():
         """The whole blueprint need to login first"""
-        pass
+        if session_cart.enabled():
+            session_cart.merge_into_db(current_user.id)
+
+    user_logged_in.connect(session_cart.merge_on_login, app)
 
     bp.add_url_rule("/cart", view_func=cart_index)
     bp.add_url_rule(
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 """Click commands."""
+import time
+from datetime import timedelta
 from subprocess import call
 import click
 from flask import current_app
@@ -20,11 +22,18 @@ from flaskshop.random_data import (
     create_vouchers,
     create_dashboard_menus,
     create_roles,
+    create_scaled_data,
 )
+from flaskshop.database import forget_loaded_records
 from flaskshop.extensions import db
+from flaskshop.corelib import metrics
 from flaskshop.corelib.db import rdb
-from flaskshop.public.search import Item
-from flaskshop.product.models import Product
+from flaskshop.public import search
+from flaskshop.public.search import index_outbox
+from flaskshop.product.models import ProductFacet
+from flaskshop.discount.models import update_prices
+from flaskshop.order.models import Order
+from flaskshop.product import stock
 
 HERE = Path(__file__).resolve()
 PROJECT_ROOT = HERE.parent
@@ -153,10 +162,29 @@ def createdb():
 
 @click.command()
 @click.option("--type", default="default", help="which type to seed")
+@click.option(
+    "--scale",
+    default=0,
+    type=int,
+    help="bulk insert N times 1000 products, 200 users and 2000 orders",
+)
+@click.option("--seed", "seed_", default=0, type=int, help="random seed of --scale")
+@click.option("--chunk-size", default=5000, type=int, help="rows per insert")
 @with_appcontext
-def seed(type):
+def seed(type, scale, seed_, chunk_size):
     """Generate random data for test."""
-    if type == "default":
+    if scale:
+        create_generator = chain(
+            create_roles(),
+            create_admin(),
+            create_scaled_data(scale, seed=seed_, chunk_size=chunk_size),
+            create_menus(),
+            create_dashboard_menus(),
+            create_vouchers(),
+        )
+        for msg in create_generator:
+            click.echo(msg)
+    elif type == "default":
         place_holder = Path("placeholders")
         create_products_by_schema(
             placeholder_dir=place_holder, how_many=10, create_images=True
@@ -205,10 +233,114 @@ def flushrdb():
 
 
 @click.command()
+@click.option("--resume", is_flag=True, help="continue the last unfinished build")
+@click.option("--window", default=10000, help="product ids read per query")
+@click.option("--chunk-size", default=500, help="products per bulk request")
 @with_appcontext
-def reindex():
-    """clear elastic-search items."""
-    Item._index.delete(ignore=404)
-    Item.init()
-    products = Product.query.all()
-    Item.bulk_update(products, op_type="create")
+def reindex(resume, window, chunk_size):
+    """rebuild elastic-search items in a new index, then switch to it."""
+    for msg in search.reindex(resume=resume, window=window, chunk_size=chunk_size):
+        click.echo(msg)
+
+
+@click.command()
+@click.option("--batch-size", type=int, help="queued changes per bulk request")
+@click.option("--loop", is_flag=True, help="keep indexing every interval")
+@click.option("--interval", type=float, help="seconds between two runs")
+@with_appcontext
+def index_search(batch_size, loop, interval):
+    """send the queued product changes to elastic-search."""
+    batch_size = batch_size or current_app.config["SEARCH_INDEX_BATCH_SIZE"]
+    interval = interval or current_app.config["SEARCH_INDEX_INTERVAL"]
+    while True:
+        run = index_outbox(batch_size=batch_size)
+        if run["indexed"] or run["failed"] or not loop:
+            click.echo(
+                "indexed {indexed}, failed {failed}, merged {merged} in "
+                "{seconds:.2f}s, lag {lag:.0f}s".format(**run)
+            )
+        metrics.flush()
+        if not loop:
+            break
+        forget_loaded_records()
+        if not run["full"]:
+            # a backlog is drained without waiting
+            time.sleep(interval)
+
+
+@click.command()
+@with_appcontext
+def rebuild_facets():
+    """rebuild the product facet table from product attributes."""
+    count = ProductFacet.rebuild()
+    click.echo(f"{count} products indexed")
+
+
+@click.command()
+@with_appcontext
+def reprice():
+    """recompute the discount and effective price of every product."""
+    count = update_prices()
+    db.session.commit()
+    click.echo(f"{count} products repriced")
+
+
+@click.command()
+@click.argument("variant_ids", nargs=-1, type=int, required=True)
+@click.option("--off", is_flag=True, help="count them in the database again")
+@with_appcontext
+def hot_sku(variant_ids, off):
+    """flag product variants whose stock is counted in redis."""
+    stock.flag_hot(variant_ids, hot=not off)
+    click.echo(f"hot variants: {sorted(stock.hot_variant_ids())}")
+
+
+@click.command()
+@click.option("--loop", is_flag=True, help="keep reconciling every interval")
+@click.option("--interval", type=float, help="seconds between two runs")
+@with_appcontext
+def reconcile_stock(loop, interval):
+    """write the stock allocated in redis back to the database."""
+    interval = interval or current_app.config["STOCK_RECONCILE_INTERVAL"]
+    while True:
+        count = stock.reconcile()
+        if count:
+            click.echo(f"{count} variants reconciled")
+        if not loop:
+            break
+        forget_loaded_records()
+        time.sleep(interval)
+
+
+@click.command()
+@click.option("--variant", "variant_ids", multiple=True, type=int)
+@with_appcontext
+def rebuild_stock(variant_ids):
+    """recount the redis stock of hot variants from the unpaid orders."""
+    variant_ids = stock.rebuild(variant_ids or None)
+    click.echo(f"{len(variant_ids)} variants rebuilt")
+
+
+@click.command()
+@click.option("--ttl", type=int, help="minutes an order may stay unpaid")
+@click.option("--batch-size", type=int, default=500)
+@click.option("--loop", is_flag=True, help="keep expiring every interval")
+@click.option("--interval", type=float, help="seconds between two runs")
+@with_appcontext
+def expire_orders(ttl, batch_size, loop, interval):
+    """cancel unpaid orders past their ttl and release their stock."""
+    if ttl is None:
+        ttl = current_app.config["ORDER_UNPAID_TTL"]
+    if interval is None:
+        interval = current_app.config["ORDER_EXPIRE_INTERVAL"]
+    while True:
+        run = Order.expire_unpaid(timedelta(minutes=ttl), batch_size=batch_size)
+        click.echo(
+            "expired {expired} orders in {batches} batches, {seconds:.2f}s "
+            "({per_second:.0f}/s), lag {lag:.0f}s".format(**run)
+        )
+        metrics.flush()
+        if not loop:
+            break
+        forget_loaded_records()
+        time.sleep(interval)
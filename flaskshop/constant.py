@@ -10,7 +10,7 @@ OrderStatusKinds = enum.Enum(
 )
 OrderEvents = enum.Enum(
     value="OrderEvents",
-    names="draft_created payment_captured payment_failed order_canceled order_delivered order_completed",
+    names="draft_created payment_captured payment_failed order_canceled order_delivered order_completed order_expired",
 )
 DiscountValueTypeKinds = enum.Enum(value="DiscountValueType", names="fixed percent")
 VoucherTypeKinds = enum.Enum(
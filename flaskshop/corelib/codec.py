@@ -0,0 +1,249 @@
+"""Codecs turning cached values into bytes for redis.
+
+Model instances are stored as snapshots of their columns and revived as
+detached instances, no session is needed to read them back. Values the
+snapshot can not describe fall back to the sqlalchemy serializer.
+"""
+import base64
+import enum
+import importlib
+import json
+import logging
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask_sqlalchemy import Pagination
+from sqlalchemy.ext.serializer import loads, dumps
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import instance_state
+
+from flaskshop.corelib.utils import Empty, empty
+from flaskshop.extensions import db
+from flaskshop.settings import Config
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+# header of an encoded value: magic, codec tag, compression flag
+MAGIC = b"\x00FC"
+COMPRESSED = b"z"
+PLAIN = b"-"
+TAG = "__t"
+
+
+class CodecError(Exception):
+    pass
+
+
+_model_classes = {}
+
+
+def _model_class(name):
+    if name not in _model_classes:
+        for mapper in db.Model.registry.mappers:
+            _model_classes[mapper.class_.__name__] = mapper.class_
+    return _model_classes[name]
+
+
+class _Memo:
+    """Shared state of one snapshot, models are written once and then
+    referenced, column names are written once per model class.
+    """
+
+    def __init__(self):
+        self.objects = []
+        self.object_ids = {}
+        self.columns = {}
+
+
+def snapshot(value, memo=None):
+    """Reduce ``value`` to plain lists, dicts and scalars."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    memo = memo or _Memo()
+    if isinstance(value, db.Model):
+        if id(value) in memo.object_ids:
+            return {TAG: "ref", "i": memo.object_ids[id(value)]}
+        memo.object_ids[id(value)] = len(memo.objects)
+        memo.objects.append(value)
+        name = type(value).__name__
+        data = {TAG: "model", "c": name}
+        if name not in memo.columns:
+            keys = [attr.key for attr in type(value).__mapper__.column_attrs]
+            memo.columns[name] = data["k"] = keys
+        data["v"] = [snapshot(getattr(value, k), memo) for k in memo.columns[name]]
+        return data
+    if isinstance(value, dict):
+        if all(isinstance(k, str) and k != TAG for k in value):
+            return {k: snapshot(v, memo) for k, v in value.items()}
+        return {
+            TAG: "dict",
+            "v": [[snapshot(k, memo), snapshot(v, memo)] for k, v in value.items()],
+        }
+    if isinstance(value, list):
+        return [snapshot(v, memo) for v in value]
+    if isinstance(value, tuple):
+        return {TAG: "tuple", "v": [snapshot(v, memo) for v in value]}
+    if isinstance(value, (set, frozenset)):
+        return {TAG: "set", "v": [snapshot(v, memo) for v in value]}
+    if isinstance(value, datetime):
+        return {TAG: "datetime", "v": value.isoformat()}
+    if isinstance(value, date):
+        return {TAG: "date", "v": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {TAG: "decimal", "v": str(value)}
+    if isinstance(value, bytes):
+        return {TAG: "bytes", "v": base64.b64encode(value).decode()}
+    if isinstance(value, enum.Enum):
+        cls = type(value)
+        return {
+            TAG: "enum",
+            "c": f"{cls.__module__}:{cls.__qualname__}",
+            "v": value.name,
+        }
+    if isinstance(value, Pagination):
+        items = snapshot(value.items, memo)
+        return {
+            TAG: "pagination",
+            "v": [value.page, value.per_page, value.total, items],
+        }
+    if isinstance(value, Empty):
+        return {TAG: "empty"}
+    raise CodecError(f"can not snapshot {type(value)}")
+
+
+def revive(data, memo=None):
+    """Revert ``snapshot``."""
+    memo = memo or _Memo()
+    if isinstance(data, list):
+        return [revive(v, memo) for v in data]
+    if not isinstance(data, dict):
+        return data
+    kind = data.get(TAG)
+    if kind is None:
+        return {k: revive(v, memo) for k, v in data.items()}
+    if kind == "model":
+        cls = _model_class(data["c"])
+        keys = memo.columns.setdefault(data["c"], data.get("k"))
+        obj = cls.__mapper__.class_manager.new_instance()
+        memo.objects.append(obj)
+        obj.__dict__.update(zip(keys, (revive(v, memo) for v in data["v"])))
+        make_transient_to_detached(obj)
+        # same as a query load, mutable json columns get wrapped here
+        state = instance_state(obj)
+        state.manager.dispatch.load(state, None)
+        return obj
+    if kind == "ref":
+        return memo.objects[data["i"]]
+    if kind == "dict":
+        return {revive(k, memo): revive(v, memo) for k, v in data["v"]}
+    if kind == "tuple":
+        return tuple(revive(v, memo) for v in data["v"])
+    if kind == "set":
+        return set(revive(v, memo) for v in data["v"])
+    if kind == "datetime":
+        return datetime.fromisoformat(data["v"])
+    if kind == "date":
+        return date.fromisoformat(data["v"])
+    if kind == "decimal":
+        return Decimal(data["v"])
+    if kind == "bytes":
+        return base64.b64decode(data["v"])
+    if kind == "enum":
+        module, name = data["c"].split(":")
+        return getattr(importlib.import_module(module), name)[data["v"]]
+    if kind == "pagination":
+        page, per_page, total, items = data["v"]
+        return Pagination(None, page, per_page, total, revive(items, memo))
+    if kind == "empty":
+        return empty
+    raise CodecError(f"unknown tag {kind}")
+
+
+class SerializerCodec:
+    """The sqlalchemy serializer, pickles anything but is slow and big."""
+
+    tag = b"p"
+
+    def encode(self, value):
+        return dumps(value)
+
+    def decode(self, data):
+        return loads(data)
+
+
+class JsonCodec:
+    tag = b"j"
+
+    def encode(self, value):
+        return json.dumps(snapshot(value), separators=(",", ":")).encode()
+
+    def decode(self, data):
+        return revive(json.loads(data))
+
+
+class MsgpackCodec:
+    tag = b"m"
+
+    def encode(self, value):
+        return msgpack.packb(snapshot(value), use_bin_type=True)
+
+    def decode(self, data):
+        return revive(msgpack.unpackb(data, raw=False, strict_map_key=False))
+
+
+CODECS = {"pickle": SerializerCodec(), "json": JsonCodec()}
+if msgpack is not None:
+    CODECS["msgpack"] = MsgpackCodec()
+_codecs_by_tag = {codec.tag: codec for codec in CODECS.values()}
+
+
+_missing = set()
+
+
+def get_codec(name=None):
+    name = name or Config.CACHE_CODEC
+    if name not in CODECS:
+        if name not in _missing:
+            _missing.add(name)
+            logger.warning(f"cache codec {name} is not available, using json")
+        return CODECS["json"]
+    return CODECS[name]
+
+
+def encode(value, codec=None, compress_threshold=None):
+    """Encode ``value`` with a self describing header."""
+    codec = codec or get_codec()
+    if compress_threshold is None:
+        compress_threshold = Config.CACHE_COMPRESS_THRESHOLD
+    try:
+        data = codec.encode(value)
+    except CodecError:
+        codec = CODECS["pickle"]
+        data = codec.encode(value)
+    flag = PLAIN
+    if compress_threshold and len(data) > compress_threshold:
+        data = zlib.compress(data)
+        flag = COMPRESSED
+    return MAGIC + codec.tag + flag + data
+
+
+def is_encoded(data):
+    return isinstance(data, bytes) and data.startswith(MAGIC)
+
+
+def decode(data):
+    """Revert ``encode``, payloads without header are sqlalchemy pickles."""
+    if not is_encoded(data):
+        return loads(data)
+    start = len(MAGIC)
+    codec = _codecs_by_tag[data[start : start + 1]]  # noqa
+    flag = data[start + 1 : start + 2]  # noqa
+    data = data[start + 2 :]  # noqa
+    if flag == COMPRESSED:
+        data = zlib.decompress(data)
+    return codec.decode(data)
@@ -19,14 +19,16 @@ if not Config.USE_REDIS:
         def __getattr__(self, name):
             pass
 
+        def get(self, *args, **kwargs):
+            return None
+
         def delete(self, *args, **kwargs):
             pass
 
-        def __iter__(self):
-            yield 1
+        def incr(self, *args, **kwargs):
+            pass
 
     rdb = Fake()
-    rdb.keys = Fake
 
 
 class PropsMixin:
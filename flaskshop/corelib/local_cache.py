@@ -1,49 +1,160 @@
-class LocalCache:
-    def __init__(self, size=10000):
-        self.dataset = {}
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from flaskshop.settings import Config
+
+# the named caches of the process, their stats are exported by corelib.metrics
+caches = {}
+
+
+def approx_sizeof(value):
+    """Rough memory footprint of ``value``, containers are walked."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(approx_sizeof(k) + approx_sizeof(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(approx_sizeof(v) for v in value)
+    return size
+
+
+class LRUCache:
+    """Thread-safe LRU cache, every key can expire after its own ttl.
+
+    Besides ``size`` entries it can be bounded to ``max_bytes`` of values.
+    """
+
+    def __init__(self, size=1000, max_bytes=0, name=None):
+        self.dataset = OrderedDict()
         self.size = size
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if name:
+            caches[name] = self
+
+    def __repr__(self):
+        return f"<LRUCache {len(self.dataset)}/{self.size}>"
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def _pop(self, key):
+        item = self.dataset.pop(key, None)
+        if item is not None:
+            self.bytes -= item[2]
+        return item
+
+    def get(self, key):
+        with self.lock:
+            item = self.dataset.get(key)
+            if item is not None:
+                value, expire_at, _ = item
+                if not expire_at or expire_at > time.monotonic():
+                    self.dataset.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._pop(key)
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def set(self, key, value, ttl=0):
+        expire_at = time.monotonic() + ttl if ttl else 0
+        nbytes = approx_sizeof(value) if self.max_bytes else 0
+        with self.lock:
+            self._pop(key)
+            self.dataset[key] = (value, expire_at, nbytes)
+            self.bytes += nbytes
+            while len(self.dataset) > self.size or (
+                self.max_bytes and self.bytes > self.max_bytes and self.dataset
+            ):
+                _, (_, _, evicted_bytes) = self.dataset.popitem(last=False)
+                self.bytes -= evicted_bytes
+                self.evictions += 1
+        return True
+
+    def delete(self, key):
+        with self.lock:
+            self._pop(key)
+        return True
 
     def clear(self):
-        self.dataset.clear()
+        with self.lock:
+            self.dataset.clear()
+            self.bytes = 0
+
+    def stats(self):
+        return {
+            "size": len(self.dataset),
+            "max_size": self.size,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
 
-    def _cache(self, key, value):
-        if len(self.dataset) >= self.size:
-            self.clear()
-        self.dataset[key] = value
+class LocalCache(LRUCache):
+    """Process local cache with a memcache like api."""
+
+    def __init__(self, size=10000, ttl=0, max_bytes=0, name=None):
+        super().__init__(size=size, max_bytes=max_bytes, name=name)
+        self.ttl = ttl
 
     def __repr__(self):
         return "<LocalCache>"
 
-    def get(self, key):
-        return self.dataset.get(key)
-
     def get_multi(self, keys):
-        return dict((k, self.get(k)) for k in keys)
+        with self.lock:
+            return dict((k, self.get(k)) for k in keys)
 
     def get_list(self, keys):
-        return [self.get(k) for k in keys]
+        with self.lock:
+            return [self.get(k) for k in keys]
 
     def set(self, key, value, time=0, compress=True):
-        self._cache(key, value)
+        return super().set(key, value, time or self.ttl)
+
+    def set_multi(self, mapping, time=0, compress=True):
+        with self.lock:
+            for key, value in mapping.items():
+                self.set(key, value, time)
+        return True
+
+    def delete_multi(self, keys):
+        with self.lock:
+            for key in keys:
+                self._pop(key)
         return True
 
     def __getattr__(self, name):
-        if name in ("add", "replace", "delete", "incr", "decr", "prepend", "append"):
+        # writes we don't mirror locally only invalidate the key
+        if name in ("add", "replace", "incr", "decr", "prepend", "append"):
 
             def func(key, *args, **kwargs):
-                self.dataset.pop(key, None)
-                return True
+                return self.delete(key)
 
             return func
-        elif name in ("append_multi", "prepend_multi", "delete_multi"):
+        elif name in ("append_multi", "prepend_multi"):
 
             def func2(keys, *args, **kwargs):
-                for k in keys:
-                    self.dataset.pop(k, None)
-                return True
+                return self.delete_multi(keys)
 
             return func2
         raise AttributeError(name)
 
 
-lc = LocalCache()
+lc = LocalCache(
+    size=Config.LOCAL_CACHE_SIZE,
+    ttl=Config.LOCAL_CACHE_TTL,
+    max_bytes=Config.LOCAL_CACHE_MAX_BYTES,
+    name="props",
+)
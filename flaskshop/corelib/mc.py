@@ -1,14 +1,248 @@
+import os
+import json
+import math
+import time
+import pickle
+import random
 import inspect
 import functools
+from uuid import uuid4
 from pickle import UnpicklingError
 
 from flask import request, current_app
-from sqlalchemy.ext.serializer import loads, dumps
+from sqlalchemy.ext.serializer import loads
 
+from flaskshop.corelib import codec, metrics, profiler
 from flaskshop.corelib.db import rdb
+from flaskshop.corelib.local_cache import LRUCache
 from flaskshop.corelib.utils import Empty, empty
+from flaskshop.settings import Config
 
 BUILTIN_TYPES = (int, bytes, str, float, bool)
+MC_KEY_NS_VERSION = "ns:{}:version"
+# keys of an outdated namespace version are never read again, let them expire
+NS_KEY_EXPIRE = 24 * 60 * 60
+L1_INVALIDATE_CHANNEL = "mc:l1:invalidate"
+MC_KEY_LOCK = "{}:lock"
+# how long a worker may recompute a key before the others stop waiting on it
+LOCK_TIMEOUT = 10
+LOCK_POLL_INTERVAL = 0.05
+# > 1 favors refreshing earlier, < 1 later, see ``_should_refresh``
+EARLY_REFRESH_BETA = 1.0
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# per worker cache in front of redis, it holds the raw redis payloads
+l1 = LRUCache(Config.CACHE_L1_SIZE, name="l1")
+_l1_listener = {"pid": None, "thread": None, "origin": None}
+
+
+def use_l1():
+    return current_app.config["USE_REDIS"] and current_app.config["CACHE_L1_ENABLED"]
+
+
+def _on_l1_invalidate(message):
+    data = json.loads(message["data"])
+    if data["origin"] == _l1_listener["origin"]:
+        return
+    for key in data["keys"]:
+        l1.delete(key)
+
+
+def _publish_l1_invalidate(keys):
+    data = {"origin": _l1_listener["origin"], "keys": list(keys)}
+    rdb.publish(L1_INVALIDATE_CHANNEL, json.dumps(data))
+
+
+def _ensure_l1_listener():
+    """Subscribe to the invalidations of the other workers, once per process."""
+    if _l1_listener["pid"] == os.getpid():
+        return
+    pubsub = rdb.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(**{L1_INVALIDATE_CHANNEL: _on_l1_invalidate})
+    _l1_listener["thread"] = pubsub.run_in_thread(sleep_time=1, daemon=True)
+    _l1_listener["pid"] = os.getpid()
+    _l1_listener["origin"] = uuid4().hex
+    # anything cached before the subscription may have been missed
+    l1.clear()
+
+
+def get_raw(key):
+    """Read the redis payload of ``key``, through the l1 cache if enabled."""
+    if not use_l1():
+        return rdb.get(key)
+    _ensure_l1_listener()
+    r = l1.get(key)
+    if r is None:
+        r = rdb.get(key)
+        if r is not None:
+            l1.set(key, r, current_app.config["CACHE_L1_TTL"])
+    return r
+
+
+def set_raw(key, r, expire=None):
+    rdb.set(key, r, expire)
+    if use_l1():
+        ttl = current_app.config["CACHE_L1_TTL"]
+        l1.set(key, r, min(ttl, expire) if expire else ttl)
+        _publish_l1_invalidate([key])
+
+
+def invalidate(*keys):
+    """Delete cache keys from redis and from the l1 cache of every worker."""
+    rdb.delete(*keys)
+    if use_l1():
+        for key in keys:
+            l1.delete(key)
+        _publish_l1_invalidate(keys)
+
+
+def get_ns_version(namespace):
+    return int(get_raw(MC_KEY_NS_VERSION.format(namespace)) or 0)
+
+
+def ns_key(key, namespace):
+    """Suffix ``key`` with the current version of ``namespace``, which can
+    also be a list of namespaces the key depends on.
+    """
+    if isinstance(namespace, str):
+        return f"{key}:v{get_ns_version(namespace)}"
+    keys = [MC_KEY_NS_VERSION.format(ns) for ns in namespace]
+    if use_l1():
+        versions = [get_raw(k) for k in keys]
+    else:
+        versions = rdb.mget(keys)
+    return f"{key}:v" + ".".join(str(int(v or 0)) for v in versions)
+
+
+def bump_ns(namespace):
+    """Invalidate every key cached under ``namespace`` in O(1)."""
+    key = MC_KEY_NS_VERSION.format(namespace)
+    rdb.incr(key)
+    if use_l1():
+        l1.delete(key)
+        _publish_l1_invalidate([key])
+
+
+def dump_value(r):
+    """Serialize a value the way it is stored in redis, ``None`` included."""
+    if r is None:
+        return codec.encode(empty)
+    if not isinstance(r, BUILTIN_TYPES):
+        return codec.encode(r)
+    return r
+
+
+def load_value(r):
+    """Revert ``dump_value``, a cached ``None`` comes back as ``None``."""
+    if codec.is_encoded(r):
+        r = codec.decode(r)
+    else:
+        # builtin values are stored as is, older values are plain pickles
+        try:
+            r = loads(r)
+        except (TypeError, UnpicklingError):
+            pass
+    if isinstance(r, Empty):
+        r = None
+    return r
+
+
+def _acquire_lock(key):
+    token = uuid4().hex
+    if rdb.set(MC_KEY_LOCK.format(key), token, nx=True, px=int(LOCK_TIMEOUT * 1000)):
+        return token
+    return None
+
+
+def _release_lock(key, token):
+    rdb.eval(RELEASE_LOCK_SCRIPT, 1, MC_KEY_LOCK.format(key), token)
+
+
+def _unwrap(r, soft_expire):
+    """Split a stored value into ``(payload, soft_deadline, compute_time)``."""
+    if not soft_expire:
+        return r, None, 0
+    soft_deadline, delta, payload = pickle.loads(r)
+    return payload, soft_deadline, delta
+
+
+def _should_refresh(soft_deadline, delta):
+    """Probabilistic early expiration, slow to compute keys refresh earlier,
+    so that usually one request recomputes before the soft ttl is reached.
+    """
+    jitter = delta * EARLY_REFRESH_BETA * math.log(1.0 - random.random())
+    return time.time() - jitter >= soft_deadline
+
+
+def _store(key, compute, expire, soft_expire):
+    start = time.monotonic()
+    r = dump_value(compute())
+    if soft_expire:
+        delta = time.monotonic() - start
+        set_raw(key, pickle.dumps((time.time() + soft_expire, delta, r)), expire)
+    else:
+        set_raw(key, r, expire)
+    return r
+
+
+def _wait_for(key, soft_expire):
+    """Wait for the lock owner to store ``key``, ``None`` on timeout."""
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        r = rdb.get(key)
+        if r is not None:
+            return _unwrap(r, soft_expire)[0]
+        if not rdb.exists(MC_KEY_LOCK.format(key)):
+            break
+    return None
+
+
+def fetch(key, compute, expire=None, soft_expire=None, single_flight=False):
+    """Get the payload of ``key``, storing ``compute()`` when it is missing.
+
+    ``expire`` is the hard ttl, the key is gone from redis after it. With a
+    ``soft_expire`` the value is stale after it, one worker recomputes it
+    while the others keep serving the stale value. With ``single_flight``
+    (implied by ``soft_expire``) only one worker computes a missing key,
+    the others wait for its result.
+    """
+    r = get_raw(key)
+    if metrics.enabled():
+        result = "miss" if r is None else "hit"
+        metrics.CACHE_REQUESTS.inc(family=metrics.key_family(key), result=result)
+    if r is not None:
+        payload, soft_deadline, delta = _unwrap(r, soft_expire)
+        if not soft_expire or not _should_refresh(soft_deadline, delta):
+            return payload
+        token = _acquire_lock(key)
+        if token is None:
+            return payload
+        try:
+            return _store(key, compute, expire, soft_expire)
+        finally:
+            _release_lock(key, token)
+
+    if not (single_flight or soft_expire):
+        return _store(key, compute, expire, soft_expire)
+    token = _acquire_lock(key)
+    if token is None:
+        payload = _wait_for(key, soft_expire)
+        if payload is not None:
+            return payload
+        return _store(key, compute, expire, soft_expire)
+    try:
+        r = rdb.get(key)
+        if r is not None:
+            return _unwrap(r, soft_expire)[0]
+        return _store(key, compute, expire, soft_expire)
+    finally:
+        _release_lock(key, token)
 
 
 def gen_key_factory(key_pattern, arg_names, defaults):
@@ -31,7 +265,19 @@ def gen_key_factory(key_pattern, arg_names, defaults):
     return gen_key
 
 
-def cache(key_pattern, expire=None):
+def cache(
+    key_pattern, expire=None, namespace=None, soft_expire=None, single_flight=False
+):
+    """Cache the result of ``f`` in redis under ``key_pattern``.
+
+    With a ``namespace`` pattern (or a list of them) the key carries the
+    namespace version, so ``bump_ns`` drops all the keys of the namespace at
+    once. ``expire`` and ``soft_expire`` are the hard and soft ttl, see
+    ``fetch``.
+    """
+    if namespace and expire is None:
+        expire = NS_KEY_EXPIRE
+
     def deco(f):
         f_spec = inspect.getfullargspec(f)
         arg_names, varargs, varkw, defaults = (
@@ -43,6 +289,8 @@ def cache(key_pattern, expire=None):
         if varargs or varkw:
             raise Exception("do not support varargs")
         gen_key = gen_key_factory(key_pattern, arg_names, defaults)
+        namespaces = [namespace] if isinstance(namespace, str) else namespace or []
+        gen_ns = [gen_key_factory(ns, arg_names, defaults) for ns in namespaces]
 
         @functools.wraps(f)
         def _(*a, **kw):
@@ -51,24 +299,17 @@ def cache(key_pattern, expire=None):
             key, args = gen_key(*a, **kw)
             if not key:
                 return f(*a, **kw)
-            force = kw.pop("force", False)
-            r = rdb.get(key) if not force else None
-            if r is None:
-                r = f(*a, **kw)
-                if r is not None:
-                    if not isinstance(r, BUILTIN_TYPES):
-                        r = dumps(r)
-                    rdb.set(key, r, expire)
+            with profiler.cache_timer(key):
+                if gen_ns:
+                    key = ns_key(key, [gen(*a, **kw)[0] for gen in gen_ns])
+                if kw.pop("force", False):
+                    r = _store(key, lambda: f(*a, **kw), expire, soft_expire)
                 else:
-                    r = dumps(empty)
-                    rdb.set(key, r, expire)
-
-            try:
-                r = loads(r)
-            except (TypeError, UnpicklingError):
-                pass
-            if isinstance(r, Empty):
-                r = None
+                    r = fetch(
+                        key, lambda: f(*a, **kw), expire, soft_expire, single_flight
+                    )
+
+            r = load_value(r)
             if isinstance(r, bytes):
                 r = r.decode()
             return r
@@ -79,7 +320,13 @@ def cache(key_pattern, expire=None):
     return deco
 
 
-def cache_by_args(key_pattern, expire=None):
+def cache_by_args(
+    key_pattern, expire=None, namespace=None, soft_expire=None, single_flight=False
+):
+    """Like ``cache``, the query string of the request is part of the key."""
+    if namespace and expire is None:
+        expire = NS_KEY_EXPIRE
+
     def deco(f):
         f_spec = inspect.getfullargspec(f)
         arg_names, varargs, varkw, defaults = (
@@ -91,6 +338,8 @@ def cache_by_args(key_pattern, expire=None):
         if varargs or varkw:
             raise Exception("do not support varargs")
         gen_key = gen_key_factory(key_pattern, arg_names, defaults)
+        namespaces = [namespace] if isinstance(namespace, str) else namespace or []
+        gen_ns = [gen_key_factory(ns, arg_names, defaults) for ns in namespaces]
 
         @functools.wraps(f)
         def _(*a, **kw):
@@ -100,24 +349,17 @@ def cache_by_args(key_pattern, expire=None):
             if not key:
                 return f(*a, **kw)
             key = key + ":" + request.query_string.decode()
-            force = kw.pop("force", False)
-            r = rdb.get(key) if not force else None
-            if r is None:
-                r = f(*a, **kw)
-                if r is not None:
-                    if not isinstance(r, BUILTIN_TYPES):
-                        r = dumps(r)
-                    rdb.set(key, r, expire)
+            with profiler.cache_timer(key):
+                if gen_ns:
+                    key = ns_key(key, [gen(*a, **kw)[0] for gen in gen_ns])
+                if kw.pop("force", False):
+                    r = _store(key, lambda: f(*a, **kw), expire, soft_expire)
                 else:
-                    r = dumps(empty)
-                    rdb.set(key, r, expire)
-
-            try:
-                r = loads(r)
-            except (TypeError, UnpicklingError):
-                pass
-            if isinstance(r, Empty):
-                r = None
+                    r = fetch(
+                        key, lambda: f(*a, **kw), expire, soft_expire, single_flight
+                    )
+
+            r = load_value(r)
             return r
 
         _.original_function = f
@@ -0,0 +1,422 @@
+"""Counters, gauges and histograms served in the prometheus text format at
+``/metrics``.
+
+Each process keeps its values in memory. With ``METRICS_DIR`` set, every
+process also dumps them to ``<METRICS_DIR>/<pid>.json`` at most every
+``METRICS_FLUSH_INTERVAL`` seconds and at exit, and ``/metrics`` sums the
+files of all the workers, whichever of them serves the scrape. Empty the
+directory when the server restarts, as the files of old workers are kept.
+"""
+import os
+import hmac
+import json
+import time
+import atexit
+import logging
+import threading
+
+from flask import Response, current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+LAG_BUCKETS = (0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+
+logger = logging.getLogger(__name__)
+_lock = threading.Lock()
+_registry = []
+# called before reading the values, they copy in what is counted elsewhere
+_collectors = []
+_flush = {"pid": None, "next": 0}
+# the counters of the workers gone, see ``mark_dead``
+DEAD_WORKERS = "dead.json"
+# set by ``init_app``, the hooks of redis and of the pool run without an app
+_enabled = threading.Event()
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values = {}
+        _registry.append(self)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.name}>"
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        """For the totals counted elsewhere, by a collector."""
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = value
+
+    @staticmethod
+    def merge(value, other):
+        return value + other
+
+
+class Gauge(Counter):
+    """Summed over the live workers, ``mark_dead`` drops the others'."""
+
+    type = "gauge"
+
+
+class Histogram(Metric):
+    """Values are ``[count per bucket..., count above the buckets, sum]``."""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=TIME_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        with _lock:
+            if key not in self.values:
+                self.values[key] = [0] * (len(self.buckets) + 2)
+            counts = self.values[key]
+            counts[i] += 1
+            counts[-1] += value
+
+    @staticmethod
+    def merge(value, other):
+        return [a + b for a, b in zip(value, other)]
+
+
+REQUESTS = Counter(
+    "flaskshop_http_requests_total",
+    "Requests served.",
+    ("endpoint", "method", "status"),
+)
+REQUEST_SECONDS = Histogram(
+    "flaskshop_http_request_duration_seconds",
+    "Time to serve a request.",
+    ("endpoint",),
+)
+REQUEST_QUERIES = Histogram(
+    "flaskshop_http_request_queries",
+    "SQL queries run by a request.",
+    ("endpoint",),
+    COUNT_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    "flaskshop_cache_requests_total",
+    "Lookups of @cache keys, by key family and hit or miss.",
+    ("family", "result"),
+)
+CACHE_SECONDS = Histogram(
+    "flaskshop_cache_duration_seconds",
+    "Time spent in @cache, computing the missing values included.",
+    ("family",),
+)
+REDIS_SECONDS = Histogram(
+    "flaskshop_redis_duration_seconds",
+    "Redis round trips, a pipeline is one.",
+    ("command",),
+)
+DB_POOL_WAIT_SECONDS = Histogram(
+    "flaskshop_db_pool_wait_seconds",
+    "Time to check a connection out of the SQLAlchemy pool.",
+)
+DB_POOL_TIMEOUTS = Counter(
+    "flaskshop_db_pool_timeouts_total",
+    "Pool checkouts given up after the pool timeout.",
+)
+SEARCH_REQUESTS = Counter(
+    "flaskshop_search_index_requests_total",
+    "Elasticsearch index operations, by operation and ok or error.",
+    ("operation", "result"),
+)
+SEARCH_INDEX_LAG_SECONDS = Histogram(
+    "flaskshop_search_index_lag_seconds",
+    "Time from a product change to its indexing by the outbox indexer.",
+    buckets=LAG_BUCKETS,
+)
+ORDERS_EXPIRED = Counter(
+    "flaskshop_orders_expired_total",
+    "Unpaid orders canceled past their ttl by the expiry job.",
+)
+ORDER_EXPIRY_LAG_SECONDS = Histogram(
+    "flaskshop_order_expiry_lag_seconds",
+    "How long the oldest expired order of a run waited past its ttl.",
+    buckets=LAG_BUCKETS,
+)
+LOCAL_CACHE_REQUESTS = Counter(
+    "flaskshop_local_cache_requests_total",
+    "Lookups of the in-process caches, by cache and hit or miss.",
+    ("cache", "result"),
+)
+LOCAL_CACHE_REMOVALS = Counter(
+    "flaskshop_local_cache_removals_total",
+    "Entries dropped by the in-process caches, evicted or expired.",
+    ("cache", "reason"),
+)
+LOCAL_CACHE_ENTRIES = Gauge(
+    "flaskshop_local_cache_entries",
+    "Entries held by the in-process caches.",
+    ("cache",),
+)
+LOCAL_CACHE_BYTES = Gauge(
+    "flaskshop_local_cache_bytes",
+    "Approximate size of the values of the in-process caches.",
+    ("cache",),
+)
+
+
+def enabled():
+    return _enabled.is_set()
+
+
+def collector(f):
+    """Call ``f`` to refresh its metrics before they are read."""
+    _collectors.append(f)
+    return f
+
+
+@collector
+def _local_caches():
+    from flaskshop.corelib.local_cache import caches
+
+    for name, cache in caches.items():
+        stats = cache.stats()
+        LOCAL_CACHE_REQUESTS.set(stats["hits"], cache=name, result="hit")
+        LOCAL_CACHE_REQUESTS.set(stats["misses"], cache=name, result="miss")
+        LOCAL_CACHE_REMOVALS.set(stats["evictions"], cache=name, reason="evicted")
+        LOCAL_CACHE_REMOVALS.set(stats["expirations"], cache=name, reason="expired")
+        LOCAL_CACHE_ENTRIES.set(stats["size"], cache=name)
+        LOCAL_CACHE_BYTES.set(stats["bytes"], cache=name)
+
+
+def key_family(key):
+    """``product:category:12:products`` is in ``product:category:*``, the
+    first two segments of a key until one holds a digit.
+    """
+    family = []
+    for segment in key.split(":")[:2]:
+        if any(c.isdigit() for c in segment):
+            break
+        family.append(segment)
+    return ":".join(family + ["*"])
+
+
+def snapshot():
+    """The values of this process, ``{name: [[labels, value], ...]}``."""
+    for f in _collectors:
+        f()
+    with _lock:
+        return {
+            metric.name: [[list(k), v] for k, v in metric.values.items()]
+            for metric in _registry
+            if metric.values
+        }
+
+
+def _write(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    # readers see the old file or the new one, never half of it
+    os.replace(tmp, path)
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _dump(directory):
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    try:
+        _write(path, snapshot())
+    except OSError as e:
+        # the request being served must not fail for its metrics
+        logger.warning(f"cannot write the metrics to {path}: {e}")
+
+
+def flush(force=False):
+    directory = current_app.config["METRICS_DIR"]
+    if not directory:
+        return
+    now = time.monotonic()
+    if _flush["pid"] != os.getpid():
+        # first flush of this worker, forked after the import
+        _flush["pid"] = os.getpid()
+        os.makedirs(directory, exist_ok=True)
+        atexit.register(_dump, directory)
+    elif not force and now < _flush["next"]:
+        return
+    _flush["next"] = now + current_app.config["METRICS_FLUSH_INTERVAL"]
+    _dump(directory)
+
+
+def _merge(snapshots, gauges=True):
+    merged = {}
+    for metric in _registry:
+        values = merged.setdefault(metric.name, {})
+        if metric.type == "gauge" and not gauges:
+            continue
+        for data in snapshots:
+            for labels, value in data.get(metric.name, ()):
+                labels = tuple(labels)
+                if labels in values:
+                    values[labels] = metric.merge(values[labels], value)
+                else:
+                    values[labels] = value
+    return merged
+
+
+def mark_dead(directory, pid):
+    """Fold the counters of the dead worker ``pid`` into ``dead.json`` and
+    drop its file, its gauges are gone with it. Called by the master.
+    """
+    path = os.path.join(directory, f"{pid}.json")
+    data = _read(path)
+    if data is not None:
+        dead_path = os.path.join(directory, DEAD_WORKERS)
+        merged = _merge([_read(dead_path) or {}, data], gauges=False)
+        _write(
+            dead_path,
+            {
+                name: [[list(k), v] for k, v in values.items()]
+                for name, values in merged.items()
+                if values
+            },
+        )
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def collect():
+    """The values of every worker, summed, with the counters of the dead."""
+    snapshots = [snapshot()]
+    directory = current_app.config["METRICS_DIR"]
+    if directory and os.path.isdir(directory):
+        own = f"{os.getpid()}.json"
+        for name in os.listdir(directory):
+            if name.endswith(".json") and name != own:
+                data = _read(os.path.join(directory, name))
+                if data is not None:
+                    snapshots.append(data)
+    return _merge(snapshots)
+
+
+def _labels(metric, values, **extra):
+    pairs = list(zip(metric.labelnames, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def render():
+    lines = []
+    merged = collect()
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for labels, value in sorted(merged[metric.name].items()):
+            if metric.type != "histogram":
+                lines.append(f"{metric.name}{_labels(metric, labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + ("+Inf",), value[:-1]):
+                cumulative += count
+                le = _labels(metric, labels, le=bound)
+                lines.append(f"{metric.name}_bucket{le} {cumulative}")
+            lines.append(f"{metric.name}_sum{_labels(metric, labels)} {value[-1]}")
+            lines.append(f"{metric.name}_count{_labels(metric, labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def _instrument_pool(engine):
+    """Time ``raw_connection``, the pool checkout of every new connection."""
+    if getattr(engine.raw_connection, "timed", False):
+        return
+    raw_connection = engine.raw_connection
+
+    def timed_raw_connection(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return raw_connection(*args, **kwargs)
+        except TimeoutError:
+            DB_POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - start)
+
+    timed_raw_connection.timed = True
+    engine.raw_connection = timed_raw_connection
+
+
+def _instrument_connected(conn, branch):
+    # the first connection of an engine times the checkouts after it, the
+    # engine is not made before the app uses the database
+    if not branch:
+        _instrument_pool(conn.engine)
+
+
+def metrics_view():
+    token = current_app.config["METRICS_TOKEN"]
+    if token and not hmac.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    ):
+        return Response("", 401, {"WWW-Authenticate": "Bearer"})
+    return Response(render(), mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app):
+    if not app.config["METRICS_ENABLED"]:
+        return
+    from flaskshop.corelib import profiler
+
+    _enabled.set()
+    profiler.instrument_redis()
+    if not event.contains(Engine, "engine_connect", _instrument_connected):
+        event.listen(Engine, "engine_connect", _instrument_connected)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        start = g.pop("metrics_start", None)
+        if start is None:
+            return response
+        endpoint = request.endpoint or "unknown"
+        REQUESTS.inc(
+            endpoint=endpoint, method=request.method, status=response.status_code
+        )
+        REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+        flush()
+        return response
@@ -0,0 +1,187 @@
+"""Per request counts of sql queries, redis calls and time spent in ``@cache``.
+
+Statements are fingerprinted, literals and parameter lists folded, so the
+same query run for every row of a list (an N+1) shows up as one
+fingerprint with a high count. A request repeating a fingerprint at least
+``PROFILER_REPEAT_THRESHOLD`` times is logged. With ``PROFILER_HEADERS``
+the counts are sent back as ``X-Profile-*`` response headers. The timings
+also feed the histograms of ``corelib.metrics``.
+"""
+import re
+import time
+import functools
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from flaskshop.corelib import metrics
+
+_SPACES = re.compile(r"\s+")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PARAM = r"(?:\?|%s|%\(\w+\)s|:\w+)"
+_PARAM_LISTS = re.compile(rf"\(\s*{_PARAM}(?:\s*,\s*{_PARAM})*\s*\)")
+
+# recorders started outside of a request, by ``record``
+_recorders = []
+
+
+def fingerprint(statement):
+    """``statement`` with its literals and ``IN`` lists replaced by ``?``."""
+    statement = _SPACES.sub(" ", statement).strip()
+    statement = _LITERALS.sub("?", statement)
+    return _PARAM_LISTS.sub("(?)", statement)
+
+
+class Profile:
+    """What ran during a request, or during a ``record`` block."""
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.fingerprints = Counter()
+        self.redis_calls = 0
+        self.redis_seconds = 0.0
+        self.cache_calls = 0
+        self.cache_seconds = 0.0
+        self._cache_depth = 0
+
+    def __repr__(self):
+        return f"<Profile {self.queries} queries, {self.redis_calls} redis calls>"
+
+    def repeated(self, threshold):
+        """``(fingerprint, count)`` of the statements run ``threshold`` times
+        or more, most repeated first.
+        """
+        return [(fp, n) for fp, n in self.fingerprints.most_common() if n >= threshold]
+
+
+def _active():
+    profiles = list(_recorders)
+    if has_request_context():
+        profile = g.get("profile")
+        if profile is not None:
+            profiles.append(profile)
+    return profiles
+
+
+@contextmanager
+def record():
+    """Profile the block, request or not, used by the query budget of the
+    tests and handy in a shell.
+    """
+    profile = Profile()
+    _recorders.append(profile)
+    try:
+        yield profile
+    finally:
+        _recorders.remove(profile)
+
+
+@contextmanager
+def cache_timer(key):
+    """Time a ``@cache`` lookup, nested lookups are part of the outer one."""
+    profiles = _active()
+    start = time.perf_counter()
+    for profile in profiles:
+        profile._cache_depth += 1
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if metrics.enabled():
+            metrics.CACHE_SECONDS.observe(elapsed, family=metrics.key_family(key))
+        for profile in profiles:
+            profile._cache_depth -= 1
+            if not profile._cache_depth:
+                profile.cache_calls += 1
+                profile.cache_seconds += elapsed
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    context._profiler_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    profiles = _active()
+    if not profiles:
+        return
+    elapsed = time.perf_counter() - context._profiler_start
+    fp = fingerprint(statement)
+    for profile in profiles:
+        profile.queries += 1
+        profile.query_seconds += elapsed
+        profile.fingerprints[fp] += 1
+
+
+def _timed_redis(f, command=None):
+    @functools.wraps(f)
+    def _(*args, **kwargs):
+        profiles = _active()
+        if not profiles and not metrics.enabled():
+            return f(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            if metrics.enabled():
+                name = command or str(args[1]).split(" ")[0].upper()
+                metrics.REDIS_SECONDS.observe(elapsed, command=name)
+            for profile in profiles:
+                profile.redis_calls += 1
+                profile.redis_seconds += elapsed
+
+    _.profiled = True
+    return _
+
+
+def instrument_redis():
+    """Count every round trip, a pipeline is one call."""
+    from redis.client import Pipeline, Redis
+
+    if getattr(Redis.execute_command, "profiled", False):
+        return
+    Redis.execute_command = _timed_redis(Redis.execute_command)
+    Pipeline.execute = _timed_redis(Pipeline.execute, "PIPELINE")
+
+
+def init_app(app):
+    if not app.config["PROFILER_ENABLED"]:
+        return
+    instrument_redis()
+
+    @app.before_request
+    def start_profile():
+        g.profile = Profile()
+
+    @app.after_request
+    def finish_profile(response):
+        profile = g.pop("profile", None)
+        if profile is None:
+            return response
+        endpoint = request.endpoint or "unknown"
+        if metrics.enabled():
+            metrics.REQUEST_QUERIES.observe(profile.queries, endpoint=endpoint)
+
+        repeated = profile.repeated(app.config["PROFILER_REPEAT_THRESHOLD"])
+        for fp, count in repeated:
+            app.logger.warning(f"N+1 in {endpoint}: {count} x {fp}")
+        if app.config["PROFILER_HEADERS"]:
+            response.headers.update(
+                {
+                    "X-Profile-Queries": str(profile.queries),
+                    "X-Profile-Query-Ms": f"{profile.query_seconds * 1000:.1f}",
+                    "X-Profile-Redis-Calls": str(profile.redis_calls),
+                    "X-Profile-Redis-Ms": f"{profile.redis_seconds * 1000:.1f}",
+                    "X-Profile-Cache-Ms": f"{profile.cache_seconds * 1000:.1f}",
+                }
+            )
+            if repeated:
+                fp, count = repeated[0]
+                response.headers["X-Profile-Repeated"] = f"{count} x {fp[:200]}"
+        return response
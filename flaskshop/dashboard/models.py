@@ -2,6 +2,7 @@ from flask import url_for, request
 
 from flaskshop.database import Column, Model, db
 from flaskshop.constant import SettingValueType
+from flaskshop.public import site
 
 
 class DashboardMenu(Model):
@@ -10,7 +11,7 @@ class DashboardMenu(Model):
     order = Column(db.Integer, default=0)
     endpoint = Column(db.String(256))
     icon_cls = Column(db.String(256))
-    parent_id = Column(db.Integer, default=0)
+    parent_id = Column(db.Integer, default=0, index=True)
 
     def __str__(self):
         return self.title
@@ -72,6 +73,10 @@ class Setting(Model):
     def __repr__(self):
         return f"<{self.__class__.__name__} {self.key}>"
 
+    @classmethod
+    def __flush_event__(cls, target):
+        site.changed()
+
 
 # class Mail_Templates(Model):
 #     __tablename__ = "management_mail_templates"
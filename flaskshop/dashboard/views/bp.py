@@ -47,7 +47,7 @@ from .product import (
     product_create_step2,
     variant_manage,
 )
-from .order import orders, order_detail, send_order, draft_order
+from .order import orders, orders_bulk, order_detail, send_order, draft_order
 from .discount import vouchers, vouchers_manage, sales, sales_manage
 
 impl = HookimplMarker("flaskshop")
@@ -216,6 +216,7 @@ def flaskshop_load_blueprints(app):
         "/products/variant/<id>/edit", view_func=variant_manage, methods=["GET", "POST"]
     )
     bp.add_url_rule("/orders", view_func=orders)
+    bp.add_url_rule("/orders/bulk", view_func=orders_bulk, methods=["POST"])
     bp.add_url_rule("/orders/<id>", view_func=order_detail)
     bp.add_url_rule("/orders/<id>/send", view_func=send_order)
     bp.add_url_rule("/orders/<id>/draft", view_func=draft_order)
@@ -1,5 +1,5 @@
 from datetime import datetime
-from flask import request, render_template
+from flask import request, render_template, redirect, url_for, flash, abort
 from flask_babel import lazy_gettext
 
 from flaskshop.order.models import Order
@@ -55,3 +55,16 @@ def draft_order(id):
     order = Order.get_by_id(id)
     order.draft()
     return render_template("order/detail.html", order=order)
+
+
+def orders_bulk():
+    ids = request.form.getlist("ids", type=int)
+    action = request.form.get("action")
+    if action == "pay":
+        closed = Order.pay_success_many(ids)
+    elif action == "cancel":
+        closed = Order.cancel_many(ids)
+    else:
+        abort(400)
+    flash(lazy_gettext("%(num)s orders updated.", num=len(closed)), "success")
+    return redirect(url_for("dashboard.orders"))
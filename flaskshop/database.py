@@ -1,12 +1,69 @@
 import datetime
 
-from flaskshop.corelib.mc import cache, rdb
+from flask import current_app, g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from flaskshop.corelib.mc import cache, invalidate, rdb, dump_value, load_value
 from .extensions import db
 
 Column = db.Column
 MC_KEY_GET_BY_ID = "global:{}:{}"
 
 
+def after_flush(fn, *ids):
+    """Call ``fn(ids)`` once the running flush is done, for the sql of the
+    flush events: a session can't be used in the middle of its flush. The
+    ids of a whole flush are collected, ``fn`` runs once with all of them.
+    """
+    pending = db.session.info.setdefault("after_flush", {})
+    pending.setdefault(fn, set()).update(ids)
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def _run_after_flush(session, flush_context):
+    # what they run is plain sql, it doesn't flush again
+    while session.info.get("after_flush"):
+        for fn, ids in session.info.pop("after_flush").items():
+            fn(sorted(ids))
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_after_flush(session):
+    session.info.pop("after_flush", None)
+
+
+def table_args(*args):
+    """``__table_args__`` with ``args`` (indexes...) and the model defaults."""
+    return args + (dict(db.Model.__table_args__),)
+
+
+def _normalize_id(record_id):
+    if isinstance(record_id, (str, bytes)) and record_id.isdigit():
+        return int(record_id)
+    if isinstance(record_id, (int, float)):
+        return int(record_id)
+    return None
+
+
+def _loaded_records():
+    """Records bulk loaded by ``get_multi`` during the current request.
+
+    Out of a request, in the long running commands, nothing is kept.
+    """
+    if not has_request_context():
+        return {}
+    if "loaded_records" not in g:
+        g.loaded_records = {}
+    return g.loaded_records
+
+
+def forget_loaded_records():
+    """Drop the records kept by ``get_multi``, between two runs of a loop."""
+    if has_request_context():
+        g.pop("loaded_records", None)
+
+
 class CRUDMixin:
     @classmethod
     def create(cls, **kwargs):
@@ -35,18 +92,80 @@ class CRUDMixin:
         return commit and db.session.commit()
 
     @classmethod
-    @cache(MC_KEY_GET_BY_ID.format("{cls.__name__}", "{record_id}"))
     def get_by_id(cls, record_id):
         """Get record by ID."""
-        if any(
-            (
-                isinstance(record_id, (str, bytes)) and record_id.isdigit(),
-                isinstance(record_id, (int, float)),
-            )
-        ):
-            return cls.query.get(int(record_id))
+        loaded = _loaded_records().get((cls.__name__, _normalize_id(record_id)))
+        if loaded is not None:
+            return loaded
+        return cls._get_by_id(record_id)
+
+    @classmethod
+    @cache(MC_KEY_GET_BY_ID.format("{cls.__name__}", "{record_id}"))
+    def _get_by_id(cls, record_id):
+        record_id = _normalize_id(record_id)
+        if record_id is not None:
+            return cls.query.get(record_id)
         return None
 
+    @classmethod
+    def get_multi(cls, ids):
+        """Get records by IDs with one redis MGET and one SQL query for the misses.
+
+        The result keeps the order of ``ids``, unknown IDs give ``None``.
+        Loaded records are kept for the rest of the request, so the
+        following ``get_by_id`` calls on them are free.
+        """
+        ids = [_normalize_id(id) for id in ids]
+        wanted = list(dict.fromkeys(id for id in ids if id is not None))
+        loaded = _loaded_records()
+        records = {}
+        for id in wanted:
+            if (cls.__name__, id) in loaded:
+                records[id] = loaded[cls.__name__, id]
+        wanted = [id for id in wanted if id not in records]
+
+        use_redis = current_app.config["USE_REDIS"]
+        if wanted and use_redis:
+            keys = [MC_KEY_GET_BY_ID.format(cls.__name__, id) for id in wanted]
+            for id, r in zip(wanted, rdb.mget(keys)):
+                if r is not None:
+                    records[id] = load_value(r)
+
+        missed = [id for id in wanted if id not in records]
+        if missed:
+            found = {obj.id: obj for obj in cls.query.filter(cls.id.in_(missed))}
+            if use_redis:
+                pipe = rdb.pipeline(transaction=False)
+                for id in missed:
+                    key = MC_KEY_GET_BY_ID.format(cls.__name__, id)
+                    pipe.set(key, dump_value(found.get(id)))
+                pipe.execute()
+            for id in missed:
+                records[id] = found.get(id)
+
+        for id, obj in records.items():
+            if obj is not None:
+                loaded[cls.__name__, id] = obj
+        return [records.get(id) for id in ids]
+
+    @classmethod
+    def remember(cls, records):
+        """Keep ``records`` loaded by another query for the rest of the
+        request, the following ``get_by_id`` calls on them are free.
+        """
+        loaded = _loaded_records()
+        for obj in records:
+            loaded[cls.__name__, obj.id] = obj
+
+    @classmethod
+    def forget(cls, ids):
+        """Drop the cached records of ``ids``, for updates made with plain sql."""
+        loaded = _loaded_records()
+        for id in ids:
+            loaded.pop((cls.__name__, _normalize_id(id)), None)
+        if ids:
+            invalidate(*[MC_KEY_GET_BY_ID.format(cls.__name__, id) for id in ids])
+
     @classmethod
     def get_or_create(cls, **kwargs):
         props = cls.get_db_props(kwargs)
@@ -94,11 +213,13 @@ class CRUDMixin:
 
     @classmethod
     def __flush_after_update_event__(cls, target):
-        rdb.delete(MC_KEY_GET_BY_ID.format(cls.__name__, target.id))
+        invalidate(MC_KEY_GET_BY_ID.format(cls.__name__, target.id))
+        _loaded_records().pop((cls.__name__, target.id), None)
 
     @classmethod
     def __flush_delete_event__(cls, target):
-        rdb.delete(MC_KEY_GET_BY_ID.format(cls.__name__, target.id))
+        invalidate(MC_KEY_GET_BY_ID.format(cls.__name__, target.id))
+        _loaded_records().pop((cls.__name__, target.id), None)
 
 
 class Model(CRUDMixin, db.Model):
@@ -3,11 +3,14 @@ import string
 from datetime import datetime
 from decimal import Decimal
 
+from flask import current_app
+from sqlalchemy import func
+
 # flake8: noqa 401
-from flaskshop.corelib.mc import cache, rdb
-from flaskshop.database import Column, Model, db
+from flaskshop.corelib.mc import cache, rdb, bump_ns
+from flaskshop.database import Column, Model, after_flush, db, table_args
 from flaskshop.constant import VoucherTypeKinds, DiscountValueTypeKinds
-from flaskshop.product.models import Product, Category, MC_KEY_PRODUCT_DISCOUNT_PRICE
+from flaskshop.product.models import Product, Category, SearchOutbox, MC_NS_PRICES
 
 
 MC_KEY_SALE_PRODUCT_IDS = "discount:sale:{}:product_ids"
@@ -139,24 +142,6 @@ class Sale(Model):
     def discount_value_type_label(self):
         return DiscountValueTypeKinds(int(self.discount_value_type)).name
 
-    @classmethod
-    def get_discounted_price(cls, product):
-        sale_product = SaleProduct.query.filter_by(product_id=product.id).first()
-        if sale_product:
-            sale = Sale.get_by_id(sale_product.sale_id)
-        else:
-            sale_category = SaleCategory.query.filter_by(
-                category_id=product.category.id
-            ).first()
-            sale = Sale.get_by_id(sale_category.sale_id) if sale_category else None
-        if sale is None:
-            return 0
-        if sale.discount_value_type == DiscountValueTypeKinds.fixed.value:
-            return sale.discount_value
-        elif sale.discount_value_type == DiscountValueTypeKinds.percent.value:
-            price = round((product.basic_price) * sale.discount_value / 100, 2)
-            return Decimal(price).quantize(Decimal("0.00"))
-
     @property
     def categories(self):
         at_ids = (
@@ -219,39 +204,133 @@ class Sale(Model):
         db.session.commit()
 
     @staticmethod
-    def clear_mc(target):
-        # when update sales, need to update product discounts
-        # for (id,) in target.products_ids:
-        #     rdb.delete(MC_KEY_PRODUCT_DISCOUNT_PRICE.format(id))
-
-        # need to process so many states, category update etc.. so delete all
-        keys = rdb.keys(MC_KEY_PRODUCT_DISCOUNT_PRICE.format("*"))
-        for key in keys:
-            rdb.delete(key)
-
-    @classmethod
-    def __flush_insert_event__(cls, target):
-        super().__flush_insert_event__(target)
-        target.clear_mc(target)
+    def update_prices(sale_ids):
+        # the links of a deleted sale are still there, their products get
+        # the discount of another sale or none
+        product_ids = db.select(SaleProduct.product_id).where(
+            SaleProduct.sale_id.in_(sale_ids)
+        )
+        category_ids = db.select(SaleCategory.category_id).where(
+            SaleCategory.sale_id.in_(sale_ids)
+        )
+        update_prices(
+            db.or_(Product.id.in_(product_ids), Product.category_id.in_(category_ids))
+        )
 
     @classmethod
     def __flush_after_update_event__(cls, target):
         super().__flush_after_update_event__(target)
-        target.clear_mc(target)
+        after_flush(Sale.update_prices, target.id)
 
     @classmethod
     def __flush_delete_event__(cls, target):
         super().__flush_delete_event__(target)
-        target.clear_mc(target)
+        after_flush(Sale.update_prices, target.id)
 
 
 class SaleCategory(Model):
     __tablename__ = "discount_sale_category"
+    __table_args__ = table_args(
+        db.Index("ix_discount_sale_category_sale_category", "sale_id", "category_id"),
+    )
     sale_id = Column(db.Integer())
-    category_id = Column(db.Integer())
+    category_id = Column(db.Integer(), index=True)
+
+    @staticmethod
+    def update_prices(category_ids):
+        update_prices(Product.category_id.in_(category_ids))
+
+    @classmethod
+    def __flush_insert_event__(cls, target):
+        super().__flush_insert_event__(target)
+        after_flush(SaleCategory.update_prices, target.category_id)
+
+    @classmethod
+    def __flush_delete_event__(cls, target):
+        super().__flush_delete_event__(target)
+        after_flush(SaleCategory.update_prices, target.category_id)
 
 
 class SaleProduct(Model):
     __tablename__ = "discount_sale_product"
+    __table_args__ = table_args(
+        db.Index("ix_discount_sale_product_sale_product", "sale_id", "product_id"),
+    )
     sale_id = Column(db.Integer())
-    product_id = Column(db.Integer())
+    product_id = Column(db.Integer(), index=True)
+
+    @classmethod
+    def __flush_insert_event__(cls, target):
+        super().__flush_insert_event__(target)
+        after_flush(Product.update_prices, target.product_id)
+
+    @classmethod
+    def __flush_delete_event__(cls, target):
+        super().__flush_delete_event__(target)
+        after_flush(Product.update_prices, target.product_id)
+
+
+def _sale_discount(link, condition):
+    """Discount of the first sale ``link`` gives to the product being updated."""
+    amount = db.case(
+        (
+            Sale.discount_value_type == DiscountValueTypeKinds.fixed.value,
+            Sale.discount_value,
+        ),
+        (
+            Sale.discount_value_type == DiscountValueTypeKinds.percent.value,
+            # postgres only rounds numerics to a precision, not floats
+            func.round(
+                db.cast(
+                    Product.basic_price * Sale.discount_value / 100, db.Numeric(10, 2)
+                ),
+                2,
+            ),
+        ),
+    )
+    return (
+        db.select(amount)
+        .join_from(link, Sale, Sale.id == link.sale_id)
+        .where(condition)
+        .order_by(link.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+def update_prices(condition=None, batch_size=1000, bump_all=True):
+    """Store the discount and the effective price of the products matching
+    ``condition``, all of them by default, with set based updates.
+
+    A product sale wins over a category sale, like it always did. Plain sql
+    skips the flush events, so the cached products are dropped and the
+    search index is told here. A sale change drops every cached price,
+    ``bump_all=False`` only the listings of the repriced products.
+    """
+    query = db.session.query(Product.id)
+    if condition is not None:
+        query = query.filter(condition)
+    product_ids = [id for id, in query]
+    table = Product.__table__
+    discount = func.coalesce(
+        _sale_discount(SaleProduct, SaleProduct.product_id == Product.id),
+        _sale_discount(SaleCategory, SaleCategory.category_id == Product.category_id),
+        0,
+    )
+    for start in range(0, len(product_ids), batch_size):
+        batch = table.c.id.in_(product_ids[start : start + batch_size])  # noqa
+        db.session.execute(table.update().where(batch).values(discount=discount))
+        db.session.execute(
+            table.update()
+            .where(batch)
+            .values(effective_price=table.c.basic_price - table.c.discount)
+        )
+        if current_app.config["USE_ES"]:
+            SearchOutbox.record(product_ids[start : start + batch_size])  # noqa
+    if product_ids:
+        Product.forget(product_ids)
+        if bump_all:
+            bump_ns(MC_NS_PRICES)
+        else:
+            Product.clear_listings(product_ids)
+    return len(product_ids)
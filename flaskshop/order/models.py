@@ -1,9 +1,16 @@
-from flask import url_for
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app, url_for
 from flask_login import current_user
+from sqlalchemy import func
+from sqlalchemy.orm.attributes import set_committed_value
 from uuid import uuid4
 
-from flaskshop.database import Column, Model, db
+from flaskshop.corelib import metrics
+from flaskshop.database import Column, Model, db, table_args
 from flaskshop.account.models import User, UserAddress
+from flaskshop.product import stock
 from flaskshop.product.models import ProductVariant
 from flaskshop.constant import (
     OrderStatusKinds,
@@ -17,9 +24,12 @@ from flaskshop.discount.models import Voucher
 
 class Order(Model):
     __tablename__ = "order_order"
+    __table_args__ = table_args(
+        db.Index("ix_order_order_status_created_at", "status", "created_at"),
+    )
     token = Column(db.String(128), unique=True)
     shipping_address = Column(db.String(256))
-    user_id = Column(db.Integer())
+    user_id = Column(db.Integer(), index=True)
     total_net = Column(db.Float)
     discount_amount = Column(db.Float, default=0)
     discount_name = Column(db.String(128))
@@ -35,17 +45,14 @@ class Order(Model):
 
     @classmethod
     def create_whole_order(cls, cart, note=None):
-        # Step1, certify stock, voucher
-        to_update_variants = []
+        # Step1, certify voucher
         to_update_orderlines = []
-        total_net = 0
-        for line in cart.lines:
-            variant = ProductVariant.get_by_id(line.variant.id)
-            result, msg = variant.check_enough_stock(line.quantity)
-            if result is False:
-                return result, msg
-            variant.quantity_allocated += line.quantity
-            to_update_variants.append(variant)
+        quantities = {}
+        totals = cart.totals
+        lines = totals.lines
+        for line in lines:
+            variant = line.variant
+            quantities[variant.id] = quantities.get(variant.id, 0) + line.quantity
             orderline = OrderLine(
                 variant_id=variant.id,
                 quantity=line.quantity,
@@ -56,17 +63,28 @@ class Order(Model):
                 is_shipping_required=variant.is_shipping_required,
             )
             to_update_orderlines.append(orderline)
-            total_net += orderline.get_total()
+        total_net = totals.subtotal
 
         voucher = None
         if cart.voucher_code:
             voucher = Voucher.get_by_code(cart.voucher_code)
             try:
-                voucher.check_available(cart)
+                voucher.check_available(totals)
             except Exception as e:
                 return False, str(e)
 
-        # Step2, create Order obj
+        # Step2, reserve stock, the whole cart at once
+        failures = stock.reserve(quantities)
+        if failures:
+            db.session.rollback()
+            variants = ProductVariant.get_multi(failures)
+            return False, "; ".join(
+                f"{variant.display_product()} has not enough stock"
+                for variant in variants
+                if variant is not None
+            )
+
+        # Step3, create Order obj, committed with the reservation
         try:
             shipping_method_id = None
             shipping_method_title = None
@@ -82,7 +100,7 @@ class Order(Model):
                     cart.shipping_address_id
                 ).full_address
 
-            order = cls.create(
+            order = cls(
                 user_id=current_user.id,
                 token=str(uuid4()),
                 shipping_method_id=shipping_method_id,
@@ -92,32 +110,34 @@ class Order(Model):
                 status=OrderStatusKinds.unfulfilled.value,
                 total_net=total_net,
             )
+            db.session.add(order)
+            db.session.flush()
+
+            # Step4, process others
+            if note:
+                order_note = OrderNote(
+                    order_id=order.id, user_id=current_user.id, content=note
+                )
+                db.session.add(order_note)
+            if voucher:
+                order.voucher_id = voucher.id
+                order.discount_amount = totals.discount_amount
+                order.discount_name = voucher.title
+                voucher.used += 1
+                db.session.add(voucher)
+            for orderline in to_update_orderlines:
+                orderline.order_id = order.id
+                db.session.add(orderline)
+            for line in lines:
+                db.session.delete(line)
+            db.session.delete(cart)
+
+            db.session.commit()
         except Exception as e:
+            # the redis part of the reservation is not rolled back with sql
+            db.session.rollback()
+            stock.cancel_reservation(quantities)
             return False, str(e)
-
-        # Step3, process others
-        if note:
-            order_note = OrderNote(
-                order_id=order.id, user_id=current_user.id, content=note
-            )
-            db.session.add(order_note)
-        if voucher:
-            order.voucher_id = voucher.id
-            order.discount_amount = voucher.get_vouchered_price(cart)
-            order.discount_name = voucher.title
-            voucher.used += 1
-            db.session.add(order)
-            db.session.add(voucher)
-        for variant in to_update_variants:
-            db.session.add(variant)
-        for orderline in to_update_orderlines:
-            orderline.order_id = order.id
-            db.session.add(orderline)
-        for line in cart.lines:
-            db.session.delete(line)
-        db.session.delete(cart)
-
-        db.session.commit()
         return order, "success"
 
     def get_absolute_url(self):
@@ -165,7 +185,9 @@ class Order(Model):
 
     @property
     def lines(self):
-        return OrderLine.query.filter(OrderLine.order_id == self.id).all()
+        lines = OrderLine.query.filter(OrderLine.order_id == self.id).all()
+        ProductVariant.warm_related(line.variant_id for line in lines)
+        return lines
 
     @property
     def notes(self):
@@ -180,41 +202,179 @@ class Order(Model):
         return OrderPayment.query.filter_by(order_id=self.id).first()
 
     def pay_success(self, payment):
-        self.status = OrderStatusKinds.fulfilled.value
-        # to resolve another instance with key is already present in this session
-        local_obj = db.session.merge(self)
-        db.session.add(local_obj)
-
-        for line in self.lines:
-            variant = line.variant
-            variant.quantity_allocated -= line.quantity
-            variant.quantity -= line.quantity
-            db.session.add(variant)
+        if self.pay_success_many([self.id]):
+            set_committed_value(self, "status", OrderStatusKinds.fulfilled.value)
 
-        db.session.commit()
+    def cancel(self):
+        if self.cancel_many([self.id]):
+            set_committed_value(self, "status", OrderStatusKinds.canceled.value)
 
-        OrderEvent.create(
-            order_id=self.id,
-            user_id=self.user_id,
-            type_=OrderEvents.payment_captured.value,
+    @classmethod
+    def pay_success_many(cls, order_ids, on_closed=None):
+        """Settle the unfulfilled orders among ``order_ids``, their items
+        leave the stock. Returns the ids of the settled orders.
+        """
+        return cls._close_many(
+            order_ids,
+            OrderStatusKinds.fulfilled.value,
+            OrderEvents.payment_captured.value,
+            sold=True,
+            on_closed=on_closed,
         )
 
-    def cancel(self):
-        self.status = OrderStatusKinds.canceled.value
-        db.session.add(self)
+    @classmethod
+    def cancel_many(cls, order_ids):
+        """Cancel the unfulfilled orders among ``order_ids``, their items
+        go back to the stock. Returns the ids of the canceled orders.
+        """
+        return cls._close_many(
+            order_ids,
+            OrderStatusKinds.canceled.value,
+            OrderEvents.order_canceled.value,
+            sold=False,
+        )
 
-        for line in self.lines:
-            variant = line.variant
-            variant.quantity_allocated -= line.quantity
-            db.session.add(variant)
+    @classmethod
+    def expire_unpaid(cls, ttl, batch_size=500, payment_timeout=None):
+        """Cancel the orders left unpaid for longer than ``ttl``, oldest first
+        and a batch per transaction. An order whose payment started less than
+        ``payment_timeout`` ago is kept, the gateway may still notify it.
+        Returns the metrics of the run.
+        """
+        started = time.monotonic()
+        now = datetime.utcnow()
+        deadline = now - ttl
+        if payment_timeout is None:
+            payment_timeout = timedelta(minutes=current_app.config["PAYMENT_TIMEOUT"])
+        paying = db.exists().where(
+            OrderPayment.order_id == cls.id,
+            OrderPayment.status == PaymentStatusKinds.waiting.value,
+            OrderPayment.updated_at > now - payment_timeout,
+        )
+        expired_query = cls.query.filter(
+            cls.status == OrderStatusKinds.unfulfilled.value,
+            cls.created_at < deadline,
+            ~paying,
+        )
+        oldest = expired_query.with_entities(func.min(cls.created_at)).scalar()
+        expired = batches = 0
+        while True:
+            ids = [
+                id
+                for id, in expired_query.with_entities(cls.id)
+                .order_by(cls.created_at)
+                .limit(batch_size)
+            ]
+            if not ids:
+                break
+            expired += len(
+                cls._close_many(
+                    ids,
+                    OrderStatusKinds.canceled.value,
+                    OrderEvents.order_expired.value,
+                    sold=False,
+                    # a payment may have started since the ids were read
+                    condition=~paying,
+                )
+            )
+            batches += 1
+        seconds = time.monotonic() - started
+        lag = (deadline - oldest).total_seconds() if oldest else 0
+        metrics.ORDERS_EXPIRED.inc(expired)
+        if expired:
+            metrics.ORDER_EXPIRY_LAG_SECONDS.observe(lag)
+        return dict(
+            expired=expired,
+            batches=batches,
+            seconds=seconds,
+            per_second=expired / seconds if seconds else 0,
+            # how long the oldest order waited past its ttl
+            lag=lag,
+        )
 
+    @classmethod
+    def _close_many(
+        cls,
+        order_ids,
+        status,
+        event,
+        sold,
+        condition=None,
+        on_closed=None,
+        batch_size=500,
+    ):
+        """Move unfulfilled orders to ``status`` with a few statements per
+        batch whatever the number of lines, in one transaction with the
+        stock and the order events. Only the orders matching ``condition``
+        move, ``on_closed(ids)`` runs in the transaction before the commit.
+        """
+        order_ids = list(dict.fromkeys(order_ids))
+        unfulfilled = OrderStatusKinds.unfulfilled.value
+        variant = ProductVariant.__table__
+        closed = []
+        quantities = {}
+        for start in range(0, len(order_ids), batch_size):
+            batch = order_ids[start : start + batch_size]  # noqa
+            # locked, a concurrent notification of the same order waits here
+            query = db.session.query(cls.id, cls.user_id).filter(
+                cls.id.in_(batch), cls.status == unfulfilled
+            )
+            if condition is not None:
+                query = query.filter(condition)
+            orders = query.with_for_update().all()
+            if not orders:
+                continue
+            ids = [id for id, _ in orders]
+            db.session.execute(
+                cls.__table__.update()
+                .where(cls.id.in_(ids), cls.status == unfulfilled)
+                .values(status=status)
+            )
+            # a correlated sum rather than UPDATE ... FROM, which sqlite lacks
+            sold_quantity = (
+                db.select(func.sum(OrderLine.quantity))
+                .where(
+                    OrderLine.order_id.in_(ids),
+                    OrderLine.variant_id == variant.c.id,
+                )
+                .scalar_subquery()
+            )
+            values = dict(
+                quantity_allocated=variant.c.quantity_allocated - sold_quantity
+            )
+            if sold:
+                values["quantity"] = variant.c.quantity - sold_quantity
+            lines = (
+                db.select(OrderLine.variant_id)
+                .where(OrderLine.order_id.in_(ids))
+                .distinct()
+            )
+            db.session.execute(
+                variant.update().where(variant.c.id.in_(lines)).values(values)
+            )
+            for variant_id, quantity in (
+                db.session.query(OrderLine.variant_id, func.sum(OrderLine.quantity))
+                .filter(OrderLine.order_id.in_(ids))
+                .group_by(OrderLine.variant_id)
+            ):
+                quantities[variant_id] = quantities.get(variant_id, 0) + quantity
+            db.session.execute(
+                OrderEvent.__table__.insert(),
+                [
+                    dict(order_id=id, user_id=user_id, type=event)
+                    for id, user_id in orders
+                ],
+            )
+            closed.extend(ids)
+        if on_closed is not None:
+            on_closed(closed)
         db.session.commit()
 
-        OrderEvent.create(
-            order_id=self.id,
-            user_id=self.user_id,
-            type_=OrderEvents.order_canceled.value,
-        )
+        cls.forget(closed)
+        stock.forget_variants(quantities)
+        if not sold:
+            stock.released(quantities)
+        return closed
 
     def complete(self):
         self.update(status=OrderStatusKinds.completed.value)
@@ -251,7 +411,7 @@ class OrderLine(Model):
     quantity = Column(db.Integer())
     unit_price_net = Column(db.Float)
     is_shipping_required = Column(db.Boolean(), default=True)
-    order_id = Column(db.Integer())
+    order_id = Column(db.Integer(), index=True)
     variant_id = Column(db.Integer())
     product_id = Column(db.Integer())
 
@@ -265,7 +425,7 @@ class OrderLine(Model):
 
 class OrderNote(Model):
     __tablename__ = "order_note"
-    order_id = Column(db.Integer)
+    order_id = Column(db.Integer, index=True)
     user_id = Column(db.Integer)
     content = Column(db.Text)
     is_public = Column(db.Boolean, default=True)
@@ -273,7 +433,7 @@ class OrderNote(Model):
 
 class OrderPayment(Model):
     __tablename__ = "order_payment"
-    order_id = Column(db.Integer)
+    order_id = Column(db.Integer, index=True)
     status = Column(db.Integer)
     total = Column(db.Float)
     delivery = Column(db.Float)
@@ -285,11 +445,53 @@ class OrderPayment(Model):
     paid_at = Column(db.DateTime())
 
     def pay_success(self, paid_at):
-        self.paid_at = paid_at
-        self.status = PaymentStatusKinds.confirmed.value
-        self.save(commit=False)
-        order = Order.get_by_id(self.order_id)
-        order.pay_success(payment=self)
+        settled = self.pay_success_many([self.payment_no], paid_at)
+        set_committed_value(self, "paid_at", paid_at)
+        if settled:
+            set_committed_value(self, "status", PaymentStatusKinds.confirmed.value)
+
+    @classmethod
+    def pay_success_many(cls, payment_nos, paid_at):
+        """Confirm the payments of ``payment_nos`` and settle their orders
+        in the same transaction. Returns the ids of the settled orders.
+
+        A payment of an order that can't be settled any more, expired
+        meanwhile, is not confirmed: it keeps its status with ``paid_at``
+        set and is logged, to be refunded.
+        """
+        payment_nos = list(payment_nos)
+        confirmed = PaymentStatusKinds.confirmed.value
+        payments = (
+            db.session.query(cls.id, cls.order_id, cls.payment_no)
+            .filter(cls.payment_no.in_(payment_nos), cls.status != confirmed)
+            .all()
+        )
+        if not payments:
+            return []
+        ids = [id for id, _, _ in payments]
+        refunds = []
+
+        def confirm(settled):
+            refunds.extend(p for p in payments if p.order_id not in settled)
+            table = cls.__table__
+            db.session.execute(
+                table.update().where(table.c.id.in_(ids)).values(paid_at=paid_at)
+            )
+            db.session.execute(
+                table.update()
+                .where(table.c.order_id.in_(settled), table.c.id.in_(ids))
+                .values(status=confirmed)
+            )
+
+        settled = Order.pay_success_many(
+            (order_id for _, order_id, _ in payments), on_closed=confirm
+        )
+        for _, order_id, payment_no in refunds:
+            current_app.logger.warning(
+                "payment %s of the closed order %s to refund", payment_no, order_id
+            )
+        cls.forget(ids)
+        return settled
 
     @property
     def status_human(self):
@@ -298,6 +500,6 @@ class OrderPayment(Model):
 
 class OrderEvent(Model):
     __tablename__ = "order_event"
-    order_id = Column(db.Integer())
+    order_id = Column(db.Integer(), index=True)
     user_id = Column(db.Integer())
     type_ = Column("type", db.Integer())
@@ -74,10 +74,8 @@ def ali_notify():
     signature = data.pop("sign")
     success = zhifubao.verify_order(data, signature)
     if success:
-        order_payment = OrderPayment.query.filter_by(
-            payment_no=data["out_trade_no"]
-        ).first()
-        order_payment.pay_success(paid_at=data["gmt_payment"])
+        paid_at = datetime.strptime(data["gmt_payment"], "%Y-%m-%d %H:%M:%S")
+        OrderPayment.pay_success_many([data["out_trade_no"]], paid_at=paid_at)
     return "", 200
 
 
@@ -1,12 +1,11 @@
-from decimal import Decimal
 import itertools
 
 from flask import url_for, request, current_app
 from sqlalchemy.ext.mutable import MutableDict
-from sqlalchemy import desc
+from sqlalchemy import desc, func
 
-from flaskshop.database import Column, Model, db
-from flaskshop.corelib.mc import cache, cache_by_args, rdb
+from flaskshop.database import Column, Model, after_flush, db, table_args
+from flaskshop.corelib.mc import cache, cache_by_args, invalidate, bump_ns
 from flaskshop.corelib.db import PropsItem
 from flaskshop.settings import Config
 
@@ -14,11 +13,20 @@ from flaskshop.settings import Config
 MC_KEY_FEATURED_PRODUCTS = "product:featured:{}"
 MC_KEY_PRODUCT_IMAGES = "product:product:{}:images"
 MC_KEY_PRODUCT_VARIANT = "product:product:{}:variant"
-MC_KEY_PRODUCT_DISCOUNT_PRICE = "product:product:{}:discount_price"
 MC_KEY_ATTRIBUTE_VALUES = "product:attribute:values:{}"
 MC_KEY_COLLECTION_PRODUCTS = "product:collection:{}:products:{}"
 MC_KEY_CATEGORY_PRODUCTS = "product:category:{}:products:{}"
 MC_KEY_CATEGORY_CHILDREN = "product:category:{}:children"
+MC_KEY_CATEGORY_ATTR_FILTER = "product:category:{}:attr_filter"
+MC_KEY_COLLECTION_ATTR_FILTER = "product:collection:{}:attr_filter"
+# namespaces are versioned, bumping one invalidates all of its keys
+MC_NS_FEATURED_PRODUCTS = "product:featured"
+MC_NS_PRICES = "product:prices"
+MC_NS_COLLECTION_PRODUCTS = "product:collection:{}:products"
+MC_NS_CATEGORY_PRODUCTS = "product:category:{}:products"
+MC_NS_PRODUCT_TYPES = "product:types"
+# listings are served stale after it while one worker recomputes them
+LISTING_SOFT_EXPIRE = 5 * 60
 
 
 class Product(Model):
@@ -29,9 +37,12 @@ class Product(Model):
     sold_count = Column(db.Integer(), default=0)
     review_count = Column(db.Integer(), default=0)
     basic_price = Column(db.Float())
-    category_id = Column(db.Integer())
+    # maintained by ``flaskshop.discount.models.update_prices``
+    discount = Column(db.DECIMAL(10, 2), default=0)
+    effective_price = Column(db.DECIMAL(10, 2), index=True)
+    category_id = Column(db.Integer(), index=True)
     is_featured = Column(db.Boolean(), default=False)
-    product_type_id = Column(db.Integer())
+    product_type_id = Column(db.Integer(), index=True)
     attributes = Column(MutableDict.as_mutable(db.JSON()))
     description = Column(db.Text())
     if Config.USE_REDIS:
@@ -76,16 +87,13 @@ class Product(Model):
         return False
 
     @property
-    @cache(MC_KEY_PRODUCT_DISCOUNT_PRICE.format("{self.id}"))
     def discounted_price(self):
-        from flaskshop.discount.models import Sale
-
-        return Sale.get_discounted_price(self)
+        return self.discount or 0
 
     @property
     def price(self):
         if self.is_discounted:
-            return round(Decimal(self.basic_price) - self.discounted_price, 2)
+            return self.effective_price
         return self.basic_price
 
     @property
@@ -103,14 +111,14 @@ class Product(Model):
 
     @property
     def attribute_map(self):
-        items = {
-            ProductAttribute.get_by_id(k): AttributeChoiceValue.get_by_id(v)
-            for k, v in self.attributes.items()
-        }
-        return items
+        return get_attribute_map(self.attributes)
 
     @classmethod
-    @cache(MC_KEY_FEATURED_PRODUCTS.format("{num}"))
+    @cache(
+        MC_KEY_FEATURED_PRODUCTS.format("{num}"),
+        namespace=[MC_NS_FEATURED_PRODUCTS, MC_NS_PRICES],
+        single_flight=True,
+    )
     def get_featured_product(cls, num=8):
         return cls.query.filter_by(is_featured=True).limit(num).all()
 
@@ -167,25 +175,59 @@ class Product(Model):
 
     @staticmethod
     def clear_mc(target):
-        rdb.delete(MC_KEY_PRODUCT_DISCOUNT_PRICE.format(target.id))
-        keys = rdb.keys(MC_KEY_FEATURED_PRODUCTS.format("*"))
-        for key in keys:
-            rdb.delete(key)
+        bump_ns(MC_NS_FEATURED_PRODUCTS)
+
+    @staticmethod
+    def update_prices(product_ids):
+        from flaskshop.discount.models import update_prices
+
+        update_prices(Product.id.in_(product_ids), bump_all=False)
 
     @staticmethod
     def clear_category_cache(target):
-        keys = rdb.keys(MC_KEY_CATEGORY_PRODUCTS.format(target.category_id, "*"))
-        for key in keys:
-            rdb.delete(key)
+        category_ids = {target.category_id}
+        # the product may just have been moved out of another category
+        category_ids.update(db.inspect(target).attrs.category_id.history.deleted or ())
+        after_flush(Product.clear_category_listings, *(category_ids - {None}))
+
+    @staticmethod
+    def clear_category_listings(category_ids):
+        # a parent category lists the products of its children
+        parent_ids = db.session.query(Category.parent_id).filter(
+            Category.id.in_(category_ids), Category.parent_id.isnot(None)
+        )
+        for category_id in set(category_ids).union(id for id, in parent_ids):
+            bump_ns(MC_NS_CATEGORY_PRODUCTS.format(category_id))
+
+    @staticmethod
+    def clear_listings(product_ids):
+        """Drop the cached listings showing ``product_ids``, after a reprice."""
+        bump_ns(MC_NS_FEATURED_PRODUCTS)
+        category_ids = (
+            db.session.query(Product.category_id)
+            .filter(Product.id.in_(product_ids), Product.category_id.isnot(None))
+            .distinct()
+        )
+        Product.clear_category_listings([id for id, in category_ids])
+        Product.clear_collection_cache(product_ids)
+
+    @staticmethod
+    def clear_collection_cache(product_ids):
+        collection_ids = ProductCollection.query.with_entities(
+            ProductCollection.collection_id
+        ).filter(ProductCollection.product_id.in_(product_ids))
+        for (collection_id,) in collection_ids.distinct():
+            bump_ns(MC_NS_COLLECTION_PRODUCTS.format(collection_id))
 
     @classmethod
     def __flush_insert_event__(cls, target):
         super().__flush_insert_event__(target)
-
+        target.clear_mc(target)
+        target.clear_category_cache(target)
+        after_flush(Product.update_prices, target.id)
+        after_flush(ProductFacet.sync, target.id)
         if current_app.config["USE_ES"]:
-            from flaskshop.public.search import Item
-
-            Item.add(target)
+            after_flush(SearchOutbox.record, target.id)
 
     @classmethod
     def __flush_before_update_event__(cls, target):
@@ -199,25 +241,31 @@ class Product(Model):
         super().__flush_after_update_event__(target)
         target.clear_mc(target)
         target.clear_category_cache(target)
+        after_flush(Product.clear_collection_cache, target.id)
+        attrs = db.inspect(target).attrs
+        if attrs.basic_price.history.has_changes() or (
+            attrs.category_id.history.has_changes()
+        ):
+            after_flush(Product.update_prices, target.id)
+        if attrs.attributes.history.has_changes():
+            after_flush(ProductFacet.sync, target.id)
         if current_app.config["USE_ES"]:
-            from flaskshop.public.search import Item
-
-            Item.update_item(target)
+            after_flush(SearchOutbox.record, target.id)
 
     @classmethod
     def __flush_delete_event__(cls, target):
-        from flaskshop.public.search import Item
-
         super().__flush_delete_event__(target)
         target.clear_mc(target)
         target.clear_category_cache(target)
-        Item.delete(target)
+        after_flush(ProductFacet.remove, target.id)
+        if current_app.config["USE_ES"]:
+            after_flush(SearchOutbox.record, target.id)
 
 
 class Category(Model):
     __tablename__ = "product_category"
     title = Column(db.String(256), nullable=False)
-    parent_id = Column(db.Integer(), default=0)
+    parent_id = Column(db.Integer(), default=0, index=True)
     background_img = Column(db.String(255))
 
     def __str__(self):
@@ -245,15 +293,26 @@ class Category(Model):
         return Category.get_by_id(self.parent_id)
 
     @property
+    @cache(
+        MC_KEY_CATEGORY_ATTR_FILTER.format("{self.id}"),
+        namespace=[MC_NS_CATEGORY_PRODUCTS.format("{self.id}"), MC_NS_PRODUCT_TYPES],
+    )
     def attr_filter(self):
-        attr_filter = set()
-        for product in self.products:
-            for attr in product.product_type.product_attributes:
-                attr_filter.add(attr)
-        return attr_filter
+        all_category_ids = [child.id for child in self.children] + [self.id]
+        return get_attr_filter(
+            Product.query.filter(Product.category_id.in_(all_category_ids))
+        )
 
     @classmethod
-    @cache_by_args(MC_KEY_CATEGORY_PRODUCTS.format("{category_id}", "{page}"))
+    @cache_by_args(
+        MC_KEY_CATEGORY_PRODUCTS.format("{category_id}", "{page}"),
+        namespace=[
+            MC_NS_CATEGORY_PRODUCTS.format("{category_id}"),
+            MC_NS_PRODUCT_TYPES,
+            MC_NS_PRICES,
+        ],
+        soft_expire=LISTING_SOFT_EXPIRE,
+    )
     def get_product_by_category(cls, category_id, page):
         category = Category.get_by_id(category_id)
         all_category_ids = [child.id for child in category.children] + [category.id]
@@ -285,10 +344,8 @@ class Category(Model):
 
     @staticmethod
     def clear_mc(target):
-        rdb.delete(MC_KEY_CATEGORY_CHILDREN.format(target.id))
-        keys = rdb.keys(MC_KEY_CATEGORY_PRODUCTS.format(target.id, "*"))
-        for key in keys:
-            rdb.delete(key)
+        invalidate(MC_KEY_CATEGORY_CHILDREN.format(target.id))
+        bump_ns(MC_NS_CATEGORY_PRODUCTS.format(target.id))
 
     @classmethod
     def __flush_after_update_event__(cls, target):
@@ -305,16 +362,45 @@ class ProductTypeAttributes(Model):
     """存储的产品的属性是包括用户可选和不可选"""
 
     __tablename__ = "product_type_attribute"
+    __table_args__ = table_args(
+        db.Index(
+            "ix_product_type_attribute_type_attribute",
+            "product_type_id",
+            "product_attribute_id",
+        ),
+    )
     product_type_id = Column(db.Integer())
-    product_attribute_id = Column(db.Integer())
+    product_attribute_id = Column(db.Integer(), index=True)
+
+    @classmethod
+    def __flush_insert_event__(cls, target):
+        super().__flush_insert_event__(target)
+        bump_ns(MC_NS_PRODUCT_TYPES)
+
+    @classmethod
+    def __flush_after_update_event__(cls, target):
+        super().__flush_after_update_event__(target)
+        bump_ns(MC_NS_PRODUCT_TYPES)
+
+    @classmethod
+    def __flush_delete_event__(cls, target):
+        super().__flush_delete_event__(target)
+        bump_ns(MC_NS_PRODUCT_TYPES)
 
 
 class ProductTypeVariantAttributes(Model):
     """存储的产品SKU的属性是可以给用户去选择的"""
 
     __tablename__ = "product_type_variant_attribute"
+    __table_args__ = table_args(
+        db.Index(
+            "ix_product_type_variant_attribute_type_attribute",
+            "product_type_id",
+            "product_attribute_id",
+        ),
+    )
     product_type_id = Column(db.Integer())
-    product_attribute_id = Column(db.Integer())
+    product_attribute_id = Column(db.Integer(), index=True)
 
 
 class ProductType(Model):
@@ -411,6 +497,11 @@ class ProductType(Model):
         db.session.delete(self)
         db.session.commit()
 
+    @classmethod
+    def __flush_delete_event__(cls, target):
+        super().__flush_delete_event__(target)
+        bump_ns(MC_NS_PRODUCT_TYPES)
+
 
 class ProductVariant(Model):
     __tablename__ = "product_variant"
@@ -419,7 +510,7 @@ class ProductVariant(Model):
     price_override = Column(db.Float, default=0.00)
     quantity = Column(db.Integer(), default=0)
     quantity_allocated = Column(db.Integer(), default=0)
-    product_id = Column(db.Integer(), default=0)
+    product_id = Column(db.Integer(), default=0, index=True)
     attributes = Column(MutableDict.as_mutable(db.JSON()))
 
     def __str__(self):
@@ -428,6 +519,15 @@ class ProductVariant(Model):
     def display_product(self):
         return f"{self.product} ({str(self)})"
 
+    @classmethod
+    def warm_related(cls, variant_ids):
+        """Bulk load variants with their products and categories."""
+        variants = [v for v in cls.get_multi(variant_ids) if v is not None]
+        products = [p for p in Product.get_multi(v.product_id for v in variants) if p]
+        Category.get_multi(p.category_id for p in products)
+        ProductType.get_multi(p.product_type_id for p in products)
+        return variants
+
     @property
     def sku_id(self):
         return self.sku.split("-")[1]
@@ -465,20 +565,18 @@ class ProductVariant(Model):
 
     @property
     def attribute_map(self):
-        items = {
-            ProductAttribute.get_by_id(k): AttributeChoiceValue.get_by_id(v)
-            for k, v in self.attributes.items()
-        }
-        return items
+        return get_attribute_map(self.attributes)
 
     def check_enough_stock(self, quantity):
-        if self.stock < quantity:
+        from flaskshop.product.stock import available
+
+        if available(self) < quantity:
             return False, f"{self.display_product()} has not enough stock"
         return True, "success"
 
     @staticmethod
     def clear_mc(target):
-        rdb.delete(MC_KEY_PRODUCT_VARIANT.format(target.product_id))
+        invalidate(MC_KEY_PRODUCT_VARIANT.format(target.product_id))
 
     @classmethod
     def __flush_insert_event__(cls, target):
@@ -586,18 +684,20 @@ class ProductAttribute(Model):
     @classmethod
     def __flush_after_update_event__(cls, target):
         super().__flush_after_update_event__(target)
-        rdb.delete(MC_KEY_ATTRIBUTE_VALUES.format(target.id))
+        invalidate(MC_KEY_ATTRIBUTE_VALUES.format(target.id))
+        bump_ns(MC_NS_PRODUCT_TYPES)
 
     @classmethod
     def __flush_delete_event__(cls, target):
         super().__flush_delete_event__(target)
-        rdb.delete(MC_KEY_ATTRIBUTE_VALUES.format(target.id))
+        invalidate(MC_KEY_ATTRIBUTE_VALUES.format(target.id))
+        bump_ns(MC_NS_PRODUCT_TYPES)
 
 
 class AttributeChoiceValue(Model):
     __tablename__ = "product_attribute_value"
     title = Column(db.String(256), nullable=False)
-    attribute_id = Column(db.Integer())
+    attribute_id = Column(db.Integer(), index=True)
 
     def __str__(self):
         return self.title
@@ -611,14 +711,14 @@ class ProductImage(Model):
     __tablename__ = "product_image"
     image = Column(db.String(256))
     order = Column(db.Integer())
-    product_id = Column(db.Integer())
+    product_id = Column(db.Integer(), index=True)
 
     def __str__(self):
         return url_for("static", filename=self.image, _external=True)
 
     @staticmethod
     def clear_mc(target):
-        rdb.delete(MC_KEY_PRODUCT_IMAGES.format(target.product_id))
+        invalidate(MC_KEY_PRODUCT_IMAGES.format(target.product_id))
 
     @classmethod
     def __flush_insert_event__(cls, target):
@@ -659,12 +759,16 @@ class Collection(Model):
         return Product.query.filter(Product.id.in_(id for id, in at_ids)).all()
 
     @property
+    @cache(
+        MC_KEY_COLLECTION_ATTR_FILTER.format("{self.id}"),
+        namespace=[MC_NS_COLLECTION_PRODUCTS.format("{self.id}"), MC_NS_PRODUCT_TYPES],
+    )
     def attr_filter(self):
-        attr_filter = set()
-        for product in self.products:
-            for attr in product.product_type.product_attributes:
-                attr_filter.add(attr)
-        return attr_filter
+        return get_attr_filter(
+            Product.query.join(
+                ProductCollection, ProductCollection.product_id == Product.id
+            ).filter(ProductCollection.collection_id == self.id)
+        )
 
     def update_products(self, new_products):
         origin_ids = (
@@ -699,19 +803,32 @@ class Collection(Model):
 
 class ProductCollection(Model):
     __tablename__ = "product_collection_product"
-    product_id = Column(db.Integer())
+    __table_args__ = table_args(
+        db.Index(
+            "ix_product_collection_product_collection_product",
+            "collection_id",
+            "product_id",
+        ),
+    )
+    product_id = Column(db.Integer(), index=True)
     collection_id = Column(db.Integer())
 
     @classmethod
-    @cache_by_args(MC_KEY_COLLECTION_PRODUCTS.format("{collection_id}", "{page}"))
+    @cache_by_args(
+        MC_KEY_COLLECTION_PRODUCTS.format("{collection_id}", "{page}"),
+        namespace=[
+            MC_NS_COLLECTION_PRODUCTS.format("{collection_id}"),
+            MC_NS_PRODUCT_TYPES,
+            MC_NS_PRICES,
+        ],
+        soft_expire=LISTING_SOFT_EXPIRE,
+    )
     def get_product_by_collection(cls, collection_id, page):
         collection = Collection.get_by_id(collection_id)
-        at_ids = (
-            ProductCollection.query.with_entities(ProductCollection.product_id)
-            .filter(ProductCollection.collection_id == collection.id)
-            .all()
+        product_ids = db.select(ProductCollection.product_id).where(
+            ProductCollection.collection_id == collection.id
         )
-        query = Product.query.filter(Product.id.in_(id for id, in at_ids))
+        query = Product.query.filter(Product.id.in_(product_ids))
         ctx, query = get_product_list_context(query, collection)
         pagination = query.paginate(page, per_page=16)
         del pagination.query
@@ -720,9 +837,7 @@ class ProductCollection(Model):
 
     @staticmethod
     def clear_mc(target):
-        keys = rdb.keys(MC_KEY_COLLECTION_PRODUCTS.format(target.collection_id, "*"))
-        for key in keys:
-            rdb.delete(key)
+        bump_ns(MC_NS_COLLECTION_PRODUCTS.format(target.collection_id))
 
     @classmethod
     def __flush_insert_event__(cls, target):
@@ -739,6 +854,166 @@ class ProductCollection(Model):
         target.clear_mc(target)
 
 
+class ProductFacet(Model):
+    """``Product.attributes`` spread over indexed rows, one per attribute
+    value, listings filter and count on them instead of scanning json.
+    """
+
+    __tablename__ = "product_facet"
+    __table_args__ = table_args(
+        db.Index("ix_product_facet_value", "attribute_id", "value_id", "product_id"),
+    )
+    product_id = Column(db.Integer(), index=True)
+    attribute_id = Column(db.Integer())
+    value_id = Column(db.Integer())
+
+    @staticmethod
+    def rows_of(product_id, attributes):
+        rows = []
+        for attribute_id, value_id in (attributes or {}).items():
+            try:
+                rows.append(
+                    dict(
+                        product_id=product_id,
+                        attribute_id=int(attribute_id),
+                        value_id=int(value_id),
+                    )
+                )
+            except (TypeError, ValueError):
+                continue
+        return rows
+
+    @classmethod
+    def remove(cls, product_ids):
+        table = cls.__table__
+        db.session.execute(table.delete().where(table.c.product_id.in_(product_ids)))
+
+    @classmethod
+    def sync(cls, product_ids):
+        """Rewrite the rows of ``product_ids`` from their attributes."""
+        if not product_ids:
+            return
+        cls.remove(product_ids)
+        query = db.session.query(Product.id, Product.attributes).filter(
+            Product.id.in_(product_ids)
+        )
+        rows = []
+        for product_id, attributes in query:
+            rows.extend(cls.rows_of(product_id, attributes))
+        if rows:
+            db.session.execute(cls.__table__.insert(), rows)
+
+    @classmethod
+    def rebuild(cls, batch_size=1000):
+        """Fill the table from scratch, for existing data."""
+        db.session.execute(cls.__table__.delete())
+        query = (
+            db.session.query(Product.id, Product.attributes)
+            .order_by(Product.id)
+            .yield_per(batch_size)
+        )
+        rows = []
+        count = 0
+        for product_id, attributes in query:
+            rows.extend(cls.rows_of(product_id, attributes))
+            count += 1
+            if len(rows) >= batch_size:
+                db.session.execute(cls.__table__.insert(), rows)
+                rows = []
+        if rows:
+            db.session.execute(cls.__table__.insert(), rows)
+        db.session.commit()
+        return count
+
+    @classmethod
+    def filter_products(cls, query, selected):
+        """Narrow a product query to the ``{attribute_id: value_id}`` selected."""
+        for attribute_id, value_id in selected.items():
+            product_ids = db.select(cls.product_id).where(
+                cls.attribute_id == attribute_id, cls.value_id == value_id
+            )
+            query = query.filter(Product.id.in_(product_ids))
+        return query
+
+    @classmethod
+    def count_values(cls, query, selected):
+        """Products of ``query`` per value id.
+
+        An attribute is counted with the selection of the other attributes
+        only, so its other values show what picking them instead would give.
+        """
+        counts = {}
+        groups = [(None, selected)]
+        groups.extend(
+            (attribute_id, {k: v for k, v in selected.items() if k != attribute_id})
+            for attribute_id in selected
+        )
+        for attribute_id, others in groups:
+            product_ids = (
+                cls.filter_products(query, others)
+                .with_entities(Product.id)
+                .order_by(None)
+            )
+            counting = db.session.query(cls.value_id, func.count(cls.product_id))
+            counting = counting.filter(cls.product_id.in_(product_ids.statement))
+            if attribute_id is None:
+                counting = counting.filter(cls.attribute_id.notin_(list(selected)))
+            else:
+                counting = counting.filter(cls.attribute_id == attribute_id)
+            counts.update(counting.group_by(cls.value_id))
+        return counts
+
+
+class SearchOutbox(Model):
+    """Products to send to elasticsearch, queued in the transaction of their
+    change and drained by ``flask index-search``, see ``public.search``.
+    """
+
+    __tablename__ = "search_outbox"
+    product_id = Column(db.Integer(), index=True)
+    attempts = Column(db.Integer(), default=0)
+    retry_at = Column(db.DateTime(), index=True)
+
+    @classmethod
+    def record(cls, product_ids):
+        """Queue ``product_ids``, in the transaction of their change."""
+        rows = [dict(product_id=product_id) for product_id in product_ids]
+        if rows:
+            db.session.execute(cls.__table__.insert(), rows)
+
+
+class StockBatch(Model):
+    """Batches of hot stock deltas written by ``stock.reconcile``, recorded
+    in the transaction that writes them so that no batch is written twice.
+    """
+
+    __tablename__ = "stock_batch"
+    batch_id = Column(db.String(36), unique=True)
+
+
+def get_attr_filter(product_query):
+    """Attributes of all the product types in ``product_query``, one query."""
+    type_ids = product_query.with_entities(Product.product_type_id).distinct()
+    query = (
+        ProductAttribute.query.join(
+            ProductTypeAttributes,
+            ProductTypeAttributes.product_attribute_id == ProductAttribute.id,
+        )
+        .filter(ProductTypeAttributes.product_type_id.in_(type_ids.statement))
+        .distinct()
+    )
+    return set(query.all())
+
+
+def get_attribute_map(attributes):
+    """Map attribute ids to value ids, both loaded with one multi get."""
+    if not attributes:
+        return {}
+    keys = ProductAttribute.get_multi(attributes.keys())
+    values = AttributeChoiceValue.get_multi(attributes.values())
+    return dict(zip(keys, values))
+
+
 def get_product_list_context(query, obj):
     """
     obj: collection or category, to get it`s attr_filter.
@@ -747,12 +1022,13 @@ def get_product_list_context(query, obj):
     price_from = request.args.get("price_from", None, type=int)
     price_to = request.args.get("price_to", None, type=int)
     if price_from:
-        query = query.filter(Product.basic_price > price_from)
+        query = query.filter(Product.effective_price > price_from)
     if price_to:
-        query = query.filter(Product.basic_price < price_to)
+        query = query.filter(Product.effective_price < price_to)
     args_dict.update(price_from=price_from, price_to=price_to)
 
     sort_by_choices = {"title": "title", "price": "price"}
+    sort_by_columns = {"title": Product.title, "price": Product.effective_price}
     arg_sort_by = request.args.get("sort_by", "")
     is_descending = False
     if arg_sort_by.startswith("-"):
@@ -760,9 +1036,9 @@ def get_product_list_context(query, obj):
         arg_sort_by = arg_sort_by[1:]
     if arg_sort_by in sort_by_choices:
         if is_descending:
-            query = query.order_by(desc(getattr(Product, arg_sort_by)))
+            query = query.order_by(desc(sort_by_columns[arg_sort_by]))
         else:
-            query = query.order_by(getattr(Product, arg_sort_by))
+            query = query.order_by(sort_by_columns[arg_sort_by])
     now_sorted_by = arg_sort_by or "title"
     args_dict.update(
         sort_by_choices=sort_by_choices,
@@ -772,12 +1048,17 @@ def get_product_list_context(query, obj):
 
     args_dict.update(default_attr={})
     attr_filter = obj.attr_filter
+    selected = {}
     for attr in attr_filter:
-        value = request.args.get(attr.title)
+        value = request.args.get(attr.title, type=int)
         if value:
-            query = query.filter(Product.attributes.__getitem__(str(attr.id)) == value)
-            args_dict["default_attr"].update({attr.title: int(value)})
-    args_dict.update(attr_filter=attr_filter)
+            selected[attr.id] = value
+            args_dict["default_attr"].update({attr.title: value})
+    args_dict.update(
+        attr_filter=attr_filter,
+        facet_counts=ProductFacet.count_values(query, selected),
+    )
+    query = ProductFacet.filter_products(query, selected)
 
     if request.args:
         args_dict.update(clear_filter=True)
@@ -0,0 +1,359 @@
+"""Stock reservations made of conditional updates.
+
+The availability check and the allocation are the same ``UPDATE``, so two
+checkouts racing for the last items can not both get them, and no row is
+read and locked ahead of its write.
+
+Variants flagged hot are counted in redis instead, their rows would take
+every checkout of a flash sale. A lua script checks and decrements their
+counters for a whole cart at once and records the allocations in a deltas
+hash, ``reconcile`` writes the deltas to ``product_variant`` exactly once
+and ``rebuild`` recounts everything from the database when redis lost it.
+"""
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from flask import current_app
+from sqlalchemy import bindparam, func
+from sqlalchemy.exc import IntegrityError
+
+from flaskshop.constant import OrderStatusKinds
+from flaskshop.corelib.db import rdb
+from flaskshop.corelib.mc import RELEASE_LOCK_SCRIPT, invalidate
+from flaskshop.database import db
+from flaskshop.product.models import (
+    MC_KEY_PRODUCT_VARIANT,
+    ProductVariant,
+    StockBatch,
+)
+
+MC_KEY_HOT_VARIANTS = "stock:hot"
+MC_KEY_AVAILABLE = "stock:variant:{}:available"
+# allocations made in redis and not written to the database yet
+MC_KEY_DELTAS = "stock:deltas"
+MC_KEY_DELTAS_FLUSHING = "stock:deltas:flushing"
+MC_KEY_DELTAS_BATCH = "stock:deltas:flushing:batch"
+# one reconcile at a time, longer runs let the next one in
+MC_KEY_RECONCILE_LOCK = "stock:reconcile:lock"
+RECONCILE_LOCK_TIMEOUT = 60
+# written batches are remembered that long
+BATCH_RETENTION = timedelta(days=7)
+
+RESERVED, SHORT, MISSING = 0, 1, 2
+# KEYS: deltas, counters; ARGV: variant id and quantity pairs
+RESERVE_SCRIPT = """
+local missing, short = {2}, {1}
+for i = 1, #KEYS - 1 do
+    local available = redis.call("get", KEYS[i + 1])
+    if not available then
+        table.insert(missing, i)
+    elseif tonumber(available) < tonumber(ARGV[2 * i]) then
+        table.insert(short, i)
+    end
+end
+if #missing > 1 then return missing end
+if #short > 1 then return short end
+for i = 1, #KEYS - 1 do
+    redis.call("decrby", KEYS[i + 1], ARGV[2 * i])
+    redis.call("hincrby", KEYS[1], ARGV[2 * i - 1], ARGV[2 * i])
+end
+return {0}
+"""
+# KEYS: deltas, counters; ARGV: "1" to take back the deltas, then pairs
+RETURN_SCRIPT = """
+for i = 1, #KEYS - 1 do
+    if redis.call("exists", KEYS[i + 1]) == 1 then
+        redis.call("incrby", KEYS[i + 1], ARGV[2 * i + 1])
+    end
+    if ARGV[1] == "1" then
+        redis.call("hincrby", KEYS[1], ARGV[2 * i], -ARGV[2 * i + 1])
+    end
+end
+"""
+# KEYS: counter, deltas, flushing deltas; ARGV: variant id, available in db
+INIT_SCRIPT = """
+local pending = tonumber(redis.call("hget", KEYS[2], ARGV[1]) or 0)
+    + tonumber(redis.call("hget", KEYS[3], ARGV[1]) or 0)
+redis.call("set", KEYS[1], tonumber(ARGV[2]) - pending, "NX")
+return redis.call("get", KEYS[1])
+"""
+# KEYS: deltas, flushing deltas, their batch id; ARGV: a new batch id
+HANDOFF_SCRIPT = """
+if redis.call("exists", KEYS[2]) == 0 then
+    if redis.call("exists", KEYS[1]) == 0 then return false end
+    redis.call("rename", KEYS[1], KEYS[2])
+end
+redis.call("set", KEYS[3], ARGV[1], "NX")
+return redis.call("get", KEYS[3])
+"""
+
+
+def forget_variants(variant_ids):
+    """Drop the cached variants and variant lists after a plain sql update."""
+    variant_ids = list(variant_ids)
+    if not variant_ids:
+        return
+    product_ids = (
+        db.session.query(ProductVariant.product_id)
+        .filter(ProductVariant.id.in_(variant_ids))
+        .distinct()
+    )
+    keys = [MC_KEY_PRODUCT_VARIANT.format(id) for id, in product_ids]
+    if keys:
+        invalidate(*keys)
+    ProductVariant.forget(variant_ids)
+
+
+def use_hot_skus():
+    return current_app.config["USE_REDIS"] and (
+        current_app.config["STOCK_HOT_SKUS_ENABLED"]
+    )
+
+
+def hot_variant_ids():
+    if not use_hot_skus():
+        return set()
+    return {int(id) for id in rdb.smembers(MC_KEY_HOT_VARIANTS)}
+
+
+def flag_hot(variant_ids, hot=True):
+    """Move variants to or from the redis counters."""
+    variant_ids = list(variant_ids)
+    if not variant_ids:
+        return
+    if hot:
+        rdb.sadd(MC_KEY_HOT_VARIANTS, *variant_ids)
+        return
+    rdb.srem(MC_KEY_HOT_VARIANTS, *variant_ids)
+    # their pending allocations go to the database before the counters go
+    reconcile()
+    rdb.delete(*[MC_KEY_AVAILABLE.format(id) for id in variant_ids])
+
+
+def _split(quantities, hot_ids):
+    hot = {id: n for id, n in quantities.items() if id in hot_ids}
+    cold = {id: n for id, n in quantities.items() if id not in hot_ids}
+    return hot, cold
+
+
+def _init_counters(variant_ids):
+    rows = db.session.query(
+        ProductVariant.id, ProductVariant.quantity - ProductVariant.quantity_allocated
+    ).filter(ProductVariant.id.in_(variant_ids))
+    script = rdb.register_script(INIT_SCRIPT)
+    for variant_id, available in rows:
+        keys = [
+            MC_KEY_AVAILABLE.format(variant_id),
+            MC_KEY_DELTAS,
+            MC_KEY_DELTAS_FLUSHING,
+        ]
+        script(keys, [variant_id, available or 0])
+
+
+def _reserve_hot(quantities):
+    ids = sorted(quantities)
+    keys = [MC_KEY_DELTAS] + [MC_KEY_AVAILABLE.format(id) for id in ids]
+    args = [value for id in ids for value in (id, quantities[id])]
+    script = rdb.register_script(RESERVE_SCRIPT)
+    code, *indexes = script(keys, args)
+    if code == MISSING:
+        _init_counters([ids[i - 1] for i in indexes])
+        code, *indexes = script(keys, args)
+    if code == RESERVED:
+        return {}
+    # unknown variants are still missing, they fail as well
+    return {ids[i - 1]: quantities[ids[i - 1]] for i in indexes}
+
+
+def _return_hot(quantities, take_back_deltas):
+    if not quantities:
+        return
+    ids = sorted(quantities)
+    keys = [MC_KEY_DELTAS] + [MC_KEY_AVAILABLE.format(id) for id in ids]
+    args = ["1" if take_back_deltas else "0"]
+    args.extend(value for id in ids for value in (id, quantities[id]))
+    rdb.register_script(RETURN_SCRIPT)(keys, args)
+
+
+def available(variant):
+    """Stock left for ``variant``, from its counter when it is hot."""
+    if variant.id not in hot_variant_ids():
+        return variant.stock
+    r = rdb.get(MC_KEY_AVAILABLE.format(variant.id))
+    if r is None:
+        _init_counters([variant.id])
+        r = rdb.get(MC_KEY_AVAILABLE.format(variant.id))
+    return int(r or 0)
+
+
+def _allocate(variant_id, quantity):
+    table = ProductVariant.__table__
+    result = db.session.execute(
+        table.update()
+        .where(
+            table.c.id == variant_id,
+            table.c.quantity - table.c.quantity_allocated >= quantity,
+        )
+        .values(quantity_allocated=table.c.quantity_allocated + quantity)
+    )
+    return result.rowcount == 1
+
+
+def _release_cold(quantities):
+    table = ProductVariant.__table__
+    for variant_id, quantity in sorted(quantities.items()):
+        db.session.execute(
+            table.update()
+            .where(table.c.id == variant_id)
+            .values(quantity_allocated=table.c.quantity_allocated - quantity)
+        )
+    forget_variants(quantities)
+
+
+def release(quantities):
+    """Give back ``{variant_id: quantity}`` allocated by ``reserve``."""
+    hot, cold = _split(quantities, hot_variant_ids())
+    _return_hot(hot, take_back_deltas=True)
+    _release_cold(cold)
+
+
+def released(quantities):
+    """Tell the hot counters about allocations released with plain sql."""
+    hot, _ = _split(quantities, hot_variant_ids())
+    _return_hot(hot, take_back_deltas=False)
+
+
+def cancel_reservation(quantities):
+    """Undo ``reserve`` after its transaction rolled back, which already
+    undid the database part but not the redis one.
+    """
+    hot, _ = _split(quantities, hot_variant_ids())
+    _return_hot(hot, take_back_deltas=True)
+
+
+def reserve(quantities):
+    """Allocate ``{variant_id: quantity}`` in the current transaction.
+
+    It is all or nothing: the failures are returned as ``{variant_id:
+    quantity}`` and then nothing stays allocated. The caller commits, or
+    calls ``cancel_reservation`` if it rolls back instead.
+    """
+    hot, cold = _split(quantities, hot_variant_ids())
+    failures = _reserve_hot(hot) if hot else {}
+    if failures:
+        return failures
+    reserved = {}
+    # the same order in every transaction, so two carts can not deadlock
+    for variant_id, quantity in sorted(cold.items()):
+        if _allocate(variant_id, quantity):
+            reserved[variant_id] = quantity
+        else:
+            failures[variant_id] = quantity
+    if failures:
+        _return_hot(hot, take_back_deltas=True)
+        if reserved:
+            _release_cold(reserved)
+    else:
+        forget_variants(reserved)
+    return failures
+
+
+def reconcile(batch_size=500):
+    """Write the pending hot allocations to ``product_variant``.
+
+    The deltas are renamed away with a batch id, which is recorded in the
+    transaction writing them. A crash before they are deleted has the next
+    run find the batch written and only delete them. Returns the number of
+    variants written, 0 when another run holds the lock.
+    """
+    token = uuid4().hex
+    locked = rdb.set(
+        MC_KEY_RECONCILE_LOCK, token, nx=True, px=RECONCILE_LOCK_TIMEOUT * 1000
+    )
+    if not locked:
+        return 0
+    try:
+        return _reconcile(batch_size)
+    finally:
+        rdb.register_script(RELEASE_LOCK_SCRIPT)([MC_KEY_RECONCILE_LOCK], [token])
+
+
+def _reconcile(batch_size):
+    keys = [MC_KEY_DELTAS, MC_KEY_DELTAS_FLUSHING, MC_KEY_DELTAS_BATCH]
+    batch_id = rdb.register_script(HANDOFF_SCRIPT)(keys, [uuid4().hex])
+    if batch_id is None:
+        # nothing pending
+        return 0
+    batch_id = batch_id.decode()
+    rows = [
+        dict(variant_id=int(id), delta=int(delta))
+        for id, delta in rdb.hgetall(MC_KEY_DELTAS_FLUSHING).items()
+        if int(delta)
+    ]
+    written = db.session.query(
+        StockBatch.query.filter_by(batch_id=batch_id).exists()
+    ).scalar()
+    if not written:
+        table = ProductVariant.__table__
+        statement = (
+            table.update()
+            .where(table.c.id == bindparam("variant_id"))
+            .values(quantity_allocated=table.c.quantity_allocated + bindparam("delta"))
+        )
+        for start in range(0, len(rows), batch_size):
+            db.session.execute(statement, rows[start : start + batch_size])  # noqa
+        StockBatch.query.filter(
+            StockBatch.created_at < datetime.utcnow() - BATCH_RETENTION
+        ).delete(synchronize_session=False)
+        db.session.add(StockBatch(batch_id=batch_id))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # a run that outlived its lock wrote the batch meanwhile
+            db.session.rollback()
+            written = True
+    rdb.delete(MC_KEY_DELTAS_FLUSHING, MC_KEY_DELTAS_BATCH)
+    forget_variants(row["variant_id"] for row in rows)
+    return 0 if written else len(rows)
+
+
+def rebuild(variant_ids=None):
+    """Recount hot variants from the database, after redis lost its data.
+
+    A variant has allocated what its unpaid orders hold; that is written
+    to ``product_variant`` and the counters restart from it. Checkouts of
+    these variants should be paused meanwhile. Returns the variant ids.
+    """
+    from flaskshop.order.models import Order, OrderLine
+
+    variant_ids = sorted(hot_variant_ids() if variant_ids is None else variant_ids)
+    if not variant_ids:
+        return []
+    table = ProductVariant.__table__
+    allocated = (
+        db.select(func.coalesce(func.sum(OrderLine.quantity), 0))
+        .join_from(OrderLine, Order, Order.id == OrderLine.order_id)
+        .where(
+            OrderLine.variant_id == table.c.id,
+            Order.status == OrderStatusKinds.unfulfilled.value,
+        )
+        .scalar_subquery()
+    )
+    db.session.execute(
+        table.update()
+        .where(table.c.id.in_(variant_ids))
+        .values(quantity_allocated=allocated)
+    )
+    db.session.commit()
+    forget_variants(variant_ids)
+
+    rows = db.session.query(
+        ProductVariant.id, ProductVariant.quantity - ProductVariant.quantity_allocated
+    ).filter(ProductVariant.id.in_(variant_ids))
+    pipe = rdb.pipeline()
+    pipe.hdel(MC_KEY_DELTAS, *variant_ids)
+    pipe.hdel(MC_KEY_DELTAS_FLUSHING, *variant_ids)
+    for variant_id, stock in rows:
+        pipe.set(MC_KEY_AVAILABLE.format(variant_id), stock or 0)
+    pipe.execute()
+    return variant_ids
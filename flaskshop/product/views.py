@@ -1,9 +1,10 @@
 # -*- coding: utf-8 -*-
 """Product views."""
-from flask import Blueprint, render_template, request, jsonify
-from flask_login import login_required
+from flask import Blueprint, render_template, request, jsonify, current_app
+from flask_login import current_user
 from pluggy import HookimplMarker
 
+from flaskshop.checkout import session_cart
 from flaskshop.checkout.models import Cart
 
 from .models import Product, Category, ProductCollection, ProductVariant
@@ -20,9 +21,10 @@ def show(id, form=None):
     return render_template("products/details.html", product=product, form=form)
 
 
-@login_required
 def product_add_to_cart(id):
     """this method return to the show method and use a form instance for display validater errors"""
+    if not current_user.is_authenticated and not session_cart.enabled():
+        return current_app.login_manager.unauthorized()
     product = Product.get_by_id(id)
     form = AddCartForm(request.form, product=product)
 
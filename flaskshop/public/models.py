@@ -1,9 +1,10 @@
 from flask import url_for
 
 from flaskshop.database import Column, Model, db
-from flaskshop.corelib.mc import cache, rdb
+from flaskshop.corelib.mc import cache, invalidate
 from flaskshop.corelib.db import PropsItem
 from flaskshop.settings import Config
+from flaskshop.public import site
 
 MC_KEY_MENU_ITEMS = "public:site:{}:{}"
 MC_KEY_MENU_ITEM_CHILDREN = "public:menuitem:{}:children"
@@ -19,7 +20,7 @@ class MenuItem(Model):
     collection_id = Column(db.Integer(), default=0)
     position = Column(db.Integer(), default=0)  # item在site中的位置, 1是top，2是bottom
     page_id = Column(db.Integer(), default=0)
-    parent_id = Column(db.Integer(), default=0)
+    parent_id = Column(db.Integer(), default=0, index=True)
 
     def __str__(self):
         return self.title
@@ -52,6 +53,10 @@ class MenuItem(Model):
     def first_level_items(cls):
         return cls.query.filter(cls.parent_id == 0).order_by("order").all()
 
+    @classmethod
+    def __flush_event__(cls, target):
+        site.changed()
+
 
 class Page(Model):
     __tablename__ = "public_page"
@@ -82,8 +87,13 @@ class Page(Model):
     def __str__(self):
         return self.title
 
+    @classmethod
+    def __flush_event__(cls, target):
+        # menu items link to pages by url
+        site.changed()
+
     @classmethod
     def __flush_after_update_event__(cls, target):
         super().__flush_after_update_event__(target)
-        rdb.delete(MC_KEY_PAGE_ID.format(target.id))
-        rdb.delete(MC_KEY_PAGE_ID.format(target.slug))
+        invalidate(MC_KEY_PAGE_ID.format(target.id))
+        invalidate(MC_KEY_PAGE_ID.format(target.slug))
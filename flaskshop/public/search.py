@@ -1,14 +1,44 @@
+import json
+import time
+import functools
+from collections import defaultdict
+from datetime import datetime, timedelta
+from itertools import islice
+
 from elasticsearch_dsl import Boolean, Document, Integer, Float, Date, Text
 from elasticsearch_dsl.connections import connections
 from elasticsearch.helpers import parallel_bulk
 from elasticsearch.exceptions import NotFoundError, ConflictError
 from flask_sqlalchemy import Pagination
 
+from flaskshop.corelib import metrics
+from flaskshop.corelib.db import rdb
+from flaskshop.database import db
+from flaskshop.product.models import Product, ProductImage, SearchOutbox
 from flaskshop.settings import Config
 
 connections.create_connection(hosts=Config.ES_HOSTS, http_auth=None)
 
 SERACH_FIELDS = ["title^10", "description^5"]
+# seconds before retrying a failed product, doubled at every attempt
+RETRY_DELAY = 5
+MAX_RETRY_DELAY = 600
+
+
+def counted(f):
+    """Count the calls of an index operation and its errors."""
+
+    @functools.wraps(f)
+    def _(*args, **kwargs):
+        try:
+            rv = f(*args, **kwargs)
+        except Exception:
+            metrics.SEARCH_REQUESTS.inc(operation=f.__name__, result="error")
+            raise
+        metrics.SEARCH_REQUESTS.inc(operation=f.__name__, result="ok")
+        return rv
+
+    return _
 
 
 def get_item_data(item):
@@ -24,6 +54,40 @@ def get_item_data(item):
     }
 
 
+def _descriptions(products):
+    if not Config.USE_REDIS:
+        return {p.id: p.description for p in products}
+    # the props of every product in one MGET, skipping the local cache
+    rows = rdb.mget([p._props_db_key for p in products]) if products else []
+    return {
+        p.id: json.loads(row).get("description") if row else None
+        for p, row in zip(products, rows)
+    }
+
+
+def get_items_data(products):
+    """``get_item_data`` of many products, with one query for their images
+    and one redis call for their descriptions.
+    """
+    ids = [p.id for p in products]
+    first_imgs = {}
+    images = ProductImage.query.filter(ProductImage.product_id.in_(ids))
+    for image in images.order_by(ProductImage.id):
+        first_imgs.setdefault(image.product_id, str(image))
+    descriptions = _descriptions(products)
+    for item in products:
+        yield {
+            "id": item.id,
+            "title": item.title,
+            "description": descriptions[item.id],
+            "first_img": first_imgs.get(item.id, ""),
+            "basic_price": item.basic_price,
+            "price": item.price,
+            "on_sale": item.on_sale,
+            "is_discounted": item.is_discounted,
+        }
+
+
 class Item(Document):
     id = Integer()
     title = Text()
@@ -39,12 +103,14 @@ class Item(Document):
         name = "flaskshop"
 
     @classmethod
+    @counted
     def add(cls, item):
         obj = cls(**get_item_data(item))
         obj.save()
         return obj
 
     @classmethod
+    @counted
     def update_item(cls, item):
         try:
             obj = cls.get(item.id)
@@ -60,6 +126,7 @@ class Item(Document):
         return True
 
     @classmethod
+    @counted
     def delete(cls, item):
         rs = cls.get(item.id)
         if rs:
@@ -68,18 +135,19 @@ class Item(Document):
         return False
 
     @classmethod
+    @counted
     def bulk_update(cls, items, chunk_size=5000, op_type="update", **kwargs):
         index = cls._index._name
         _type = cls._doc_type.name
         obj = [
             {
                 "_op_type": op_type,
-                "_id": f"{doc.id}",
+                "_id": f"{data['id']}",
                 "_index": index,
                 "_type": _type,
-                "_source": get_item_data(doc),
+                "_source": data,
             }
-            for doc in items
+            for data in get_items_data(list(items))
         ]
         client = cls.get_es()
         rs = list(parallel_bulk(client, obj, chunk_size=chunk_size, **kwargs))
@@ -99,3 +167,218 @@ class Item(Document):
         s = s if order_by is None else s.sort(order_by)
         rs = s.execute()
         return Pagination(query, page, per_page, rs.hits.total, rs)
+
+
+def building_indexes(es):
+    """The versioned indexes ``reindex`` is filling, not behind the alias yet."""
+    alias = Item._index._name
+    indexes = es.indices.get_alias(index=f"{alias}-*")
+    return sorted(
+        name for name, info in indexes.items() if alias not in info["aliases"]
+    )
+
+
+def _outbox_actions(product_ids, indexes):
+    """Index the current row of every product, delete the ones gone."""
+    products = Product.query.filter(Product.id.in_(product_ids)).all()
+    sources = {data["id"]: data for data in get_items_data(products)}
+    for product_id in product_ids:
+        source = sources.get(product_id)
+        for index in indexes:
+            action = {"_index": index, "_id": f"{product_id}"}
+            if source is None:
+                action["_op_type"] = "delete"
+            else:
+                action.update(_op_type="index", _source=source)
+            yield action
+
+
+def _retry_delay(attempts):
+    return timedelta(seconds=min(RETRY_DELAY * 2**attempts, MAX_RETRY_DELAY))
+
+
+def index_outbox(batch_size=500, thread_count=4, chunk_size=500):
+    """Send a batch of the queued product changes to elasticsearch.
+
+    A product queued several times is indexed once, the queued rows up to
+    the batch are dropped when it succeeds. A failed one is retried after a
+    growing delay. The indexes a ``reindex`` is building get the changes
+    too. Returns the metrics of the run.
+    """
+    started = time.monotonic()
+    now = datetime.utcnow()
+    rows = (
+        db.session.query(
+            SearchOutbox.id,
+            SearchOutbox.product_id,
+            SearchOutbox.attempts,
+            SearchOutbox.created_at,
+        )
+        .filter(db.or_(SearchOutbox.retry_at.is_(None), SearchOutbox.retry_at <= now))
+        .order_by(SearchOutbox.id)
+        .limit(batch_size)
+        .all()
+    )
+    queued = {}
+    for _, product_id, attempts, created_at in rows:
+        previous = queued.get(product_id, (0, created_at))
+        queued[product_id] = (max(previous[0], attempts or 0), previous[1])
+    failed = set()
+    if queued:
+        es = Item.get_es()
+        indexes = [Item._index._name] + building_indexes(es)
+        results = parallel_bulk(
+            es,
+            _outbox_actions(list(queued), indexes),
+            thread_count=thread_count,
+            chunk_size=chunk_size,
+            raise_on_error=False,
+            raise_on_exception=False,
+        )
+        for ok, result in results:
+            op_type, info = result.popitem()
+            # deleting a product never indexed is fine
+            if not ok and not (op_type == "delete" and info.get("status") == 404):
+                failed.add(int(info["_id"]))
+
+    table = SearchOutbox.__table__
+    # the changes queued while indexing stay for the next batch
+    upto = table.c.id <= (rows[-1].id if rows else 0)
+    indexed = [product_id for product_id in queued if product_id not in failed]
+    if indexed:
+        db.session.execute(table.delete().where(upto, table.c.product_id.in_(indexed)))
+    retries = defaultdict(list)
+    for product_id in failed:
+        retries[queued[product_id][0]].append(product_id)
+    for attempts, product_ids in retries.items():
+        db.session.execute(
+            table.update()
+            .where(upto, table.c.product_id.in_(product_ids))
+            .values(attempts=attempts + 1, retry_at=now + _retry_delay(attempts))
+        )
+    db.session.commit()
+
+    for product_id in indexed:
+        lag = (now - queued[product_id][1]).total_seconds()
+        metrics.SEARCH_INDEX_LAG_SECONDS.observe(lag)
+    if indexed:
+        metrics.SEARCH_REQUESTS.inc(len(indexed), operation="outbox", result="ok")
+    if failed:
+        metrics.SEARCH_REQUESTS.inc(len(failed), operation="outbox", result="error")
+    oldest = db.session.query(db.func.min(SearchOutbox.created_at)).scalar()
+    return dict(
+        indexed=len(indexed),
+        failed=len(failed),
+        merged=len(rows) - len(queued),
+        full=len(rows) == batch_size,
+        seconds=time.monotonic() - started,
+        # how long the oldest change still queued has waited
+        lag=(datetime.utcnow() - oldest).total_seconds() if oldest else 0,
+    )
+
+
+def _checkpoint(es, index):
+    """The last product id copied into ``index``, kept in its ``_meta``."""
+    mappings = es.indices.get_mapping(index=index)[index]["mappings"]
+    return mappings.get("_meta", {}).get("checkpoint", 0)
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _swap_alias(es, index):
+    """Point the alias to ``index`` in one request, drop the previous ones."""
+    alias = Item._index._name
+    actions = [{"add": {"index": index, "alias": alias}}]
+    previous = []
+    if es.indices.exists_alias(name=alias):
+        previous = [name for name in es.indices.get_alias(name=alias) if name != index]
+        actions += [{"remove": {"index": name, "alias": alias}} for name in previous]
+    elif es.indices.exists(index=alias):
+        # the plain index of the versions before the aliases
+        actions.append({"remove_index": {"index": alias}})
+    es.indices.update_aliases(body={"actions": actions})
+    for name in previous:
+        es.indices.delete(index=name, ignore=404)
+
+
+def reindex(resume=False, window=10000, chunk_size=500, thread_count=4):
+    """Build a new versioned index of all the products, then swap the alias
+    searched by ``Item`` to it, the live index serves until the end.
+
+    Products are streamed in windows of ids, the last one copied is saved in
+    the index so ``resume`` continues the newest unfinished build. Changes
+    made meanwhile are sent to it by ``index_outbox``. Yields the progress.
+    """
+    es = Item.get_es()
+    alias = Item._index._name
+    building = building_indexes(es)
+    if resume and building:
+        index = building.pop()
+        last = _checkpoint(es, index)
+        yield f"Resuming {index} after product {last}"
+    else:
+        index = f"{alias}-{datetime.utcnow():%Y%m%d%H%M%S%f}"
+        body = Item._index.to_dict()
+        # refreshed once at the end, not every second while loading
+        body["settings"] = dict(body.get("settings", {}), refresh_interval="-1")
+        es.indices.create(index=index, body=body)
+        last = 0
+        yield f"Created {index}"
+    for name in building:
+        es.indices.delete(index=name, ignore=404)
+
+    top = db.session.query(db.func.max(Product.id)).scalar() or 0
+    while last < top:
+        upto = min(last + window, top)
+        products = (
+            Product.query.filter(Product.id > last, Product.id <= upto)
+            .order_by(Product.id)
+            .yield_per(chunk_size)
+        )
+        actions = (
+            # a newer version sent by index_outbox meanwhile wins
+            {
+                "_op_type": "create",
+                "_index": index,
+                "_id": f"{data['id']}",
+                "_source": data,
+            }
+            for chunk in _chunks(products, chunk_size)
+            for data in get_items_data(chunk)
+        )
+        results = parallel_bulk(
+            es,
+            actions,
+            thread_count=thread_count,
+            chunk_size=chunk_size,
+            raise_on_error=False,
+            raise_on_exception=False,
+        )
+        failed = [
+            info
+            for ok, result in results
+            for info in result.values()
+            if not ok and info.get("status") != 409
+        ]
+        # the window is sent, its products can go
+        db.session.expunge_all()
+        if failed:
+            raise RuntimeError(
+                f"{len(failed)} products failed after {last}, first: {failed[0]}, "
+                "continue with --resume"
+            )
+        es.indices.put_mapping(index=index, body={"_meta": {"checkpoint": upto}})
+        last = upto
+        yield f"Products: {last}/{top}"
+
+    es.indices.put_settings(index=index, body={"index": {"refresh_interval": None}})
+    es.indices.refresh(index=index)
+    _swap_alias(es, index)
+    yield f"{alias} now points to {index}"
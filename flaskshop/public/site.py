@@ -0,0 +1,112 @@
+"""Site settings and menus rendered by every page, kept per process.
+
+They are loaded once and served from memory until the ``MC_NS_SITE``
+namespace version moves. Any committed write of a setting, a menu item or
+a page moves it. Checking the version is one redis GET, or none with the
+l1 cache on, and a page render runs no sql for them.
+"""
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from flaskshop.constant import SiteDefaultSettings
+from flaskshop.corelib.mc import bump_ns, get_ns_version
+from flaskshop.database import db
+
+MC_NS_SITE = "public:site"
+
+_lock = threading.Lock()
+_snapshot = None
+# bumps of this process, the only ones seen when redis is off
+_local_version = 0
+
+
+class SiteSetting:
+    def __init__(self, setting):
+        self.key = setting.key
+        self.name = setting.name
+        self.value = setting.value
+        self.value_type = setting.value_type
+
+    def __repr__(self):
+        return f"<SiteSetting {self.key}>"
+
+
+class SiteMenuItem:
+    """What the templates read of a menu item."""
+
+    def __init__(self, item, children=()):
+        self.id = item.id
+        self.title = item.title
+        self.url = item.url
+        self.children = list(children)
+
+    def __str__(self):
+        return self.title
+
+
+def _load():
+    from flaskshop.dashboard.models import Setting
+    from flaskshop.public.models import MenuItem
+
+    settings = {s.key: s for s in Setting.query.all()}
+    for key, value in SiteDefaultSettings.items():
+        if key not in settings:
+            settings[key] = Setting.create(key=key, **value)
+
+    items = MenuItem.query.order_by(MenuItem.order).all()
+    children = {}
+    for item in items:
+        children.setdefault(item.parent_id, []).append(SiteMenuItem(item))
+    menus = {1: [], 2: []}
+    for item in items:
+        if item.parent_id == 0 and item.position in menus:
+            menus[item.position].append(SiteMenuItem(item, children.get(item.id, ())))
+    return dict(
+        settings={key: SiteSetting(s) for key, s in settings.items()},
+        top_menu=menus[1],
+        bottom_menu=menus[2],
+    )
+
+
+def _version():
+    return _local_version, get_ns_version(MC_NS_SITE)
+
+
+def get_site():
+    """``settings``, ``top_menu`` and ``bottom_menu`` for the templates."""
+    global _snapshot
+    version = _version()
+    snapshot = _snapshot
+    if snapshot is None or snapshot[0] != version:
+        with _lock:
+            if _snapshot is None or _snapshot[0] != version:
+                # the version is read first, a write racing the load reloads
+                _snapshot = (version, _load())
+            snapshot = _snapshot
+    return snapshot[1]
+
+
+def bump():
+    global _local_version
+    _local_version += 1
+    bump_ns(MC_NS_SITE)
+
+
+def changed():
+    """Bump once the current transaction commits, not before: other
+    processes would reload the old rows under the new version.
+    """
+    db.session.info["site_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_after_commit(session):
+    if session.info.pop("site_changed", False):
+        bump()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session):
+    session.info.pop("site_changed", None)
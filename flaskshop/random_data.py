@@ -1,15 +1,25 @@
 import itertools
 import random
 import unicodedata
-from uuid import uuid4
+from array import array
+from collections import defaultdict
+from datetime import datetime, timedelta
+from uuid import UUID, uuid4
+from pathlib import Path
 import os
 
 from decimal import Decimal
 from faker import Factory
 from faker.providers import BaseProvider
+from sqlalchemy import bindparam, text
 from sqlalchemy.sql.expression import func
 
+from flaskshop.corelib.mc import bump_ns
+from flaskshop.database import db
+from flaskshop.extensions import bcrypt
 from flaskshop.product.models import (
+    MC_NS_CATEGORY_PRODUCTS,
+    MC_NS_FEATURED_PRODUCTS,
     Category,
     ProductType,
     Product,
@@ -21,12 +31,13 @@ from flaskshop.product.models import (
     ProductTypeVariantAttributes,
     Collection,
     ProductCollection,
+    ProductFacet,
 )
 from flaskshop.public.models import MenuItem
 from flaskshop.account.models import User, UserAddress, Role, UserRole
 from flaskshop.checkout.models import ShippingMethod
 from flaskshop.order.models import Order, OrderLine, OrderPayment
-from flaskshop.discount.models import Voucher, Sale, SaleProduct
+from flaskshop.discount.models import Voucher, Sale, SaleProduct, update_prices
 from flaskshop.dashboard.models import DashboardMenu
 from flaskshop.settings import Config
 from flaskshop.constant import (
@@ -624,3 +635,451 @@ def create_vouchers():
         yield f"Voucher #{voucher.id}"
     else:
         yield "Value voucher already exists"
+
+
+"""
+Bulk data for scale tests
+"""
+
+# rows per ``--scale`` unit, 500 units are 500k products and ~5M order lines
+SCALE_UNIT = {"products": 1000, "users": 200, "orders": 2000, "sales": 2}
+# generated subcategories of every category of the schema
+SCALE_SUBCATEGORIES = 3
+SCALE_PASSWORD = "password"
+
+
+class BulkWriter:
+    """Buffer rows per model and insert each buffer with one executemany."""
+
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+        self.rows = defaultdict(list)
+
+    def add(self, model, row):
+        self.rows[model].append(row)
+
+    def full(self, model):
+        return len(self.rows[model]) >= self.chunk_size
+
+    def flush(self):
+        for model, rows in self.rows.items():
+            if rows:
+                db.session.execute(model.__table__.insert(), rows)
+        self.rows.clear()
+        db.session.commit()
+
+
+class VariantPool:
+    """The inserted variants in flat arrays, order lines are drawn from it."""
+
+    def __init__(self, first_id, catalog, titles):
+        self.first_id = first_id
+        self.catalog = catalog
+        self.titles = titles
+        self.product_ids = array("l")
+        self.prices = array("d")
+        # enough to rebuild the name and the sku of a variant
+        self.kinds = array("B")
+        self.title_indexes = array("H")
+        self.positions = array("B")
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def append(self, product_id, price, kind, title_index, position):
+        self.product_ids.append(product_id)
+        self.prices.append(price)
+        self.kinds.append(kind)
+        self.title_indexes.append(title_index)
+        self.positions.append(position)
+
+    def line(self, rnd):
+        """The ``OrderLine`` fields of a random variant."""
+        index = rnd.randrange(len(self))
+        product_id = self.product_ids[index]
+        kind = self.catalog[self.kinds[index]]
+        position = self.positions[index]
+        sku = f"{product_id}-{position}"
+        title = kind["variants"][position][1] or sku
+        return {
+            "product_name": f"{self.titles[self.title_indexes[index]]} ({title})",
+            "product_sku": sku,
+            "product_id": product_id,
+            "variant_id": self.first_id + index,
+            "unit_price_net": self.prices[index],
+            "is_shipping_required": kind["shipping"],
+        }
+
+
+def _next_id(model):
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+
+def _sync_sequences(*models):
+    """Move the postgres sequences past the ids inserted explicitly."""
+    if db.engine.dialect.name != "postgresql":
+        return
+    for model in models:
+        table = model.__tablename__
+        db.session.execute(
+            text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"coalesce(max(id), 1)) FROM {table}"
+            )
+        )
+    db.session.commit()
+
+
+def _uuid(rnd, id):
+    # random but unique, another run with the same seed gets other ids
+    return str(UUID(int=rnd.getrandbits(96) << 32 | id, version=4))
+
+
+def _address_pool(how_many):
+    return [
+        {
+            "province": fake.state(),
+            "city": fake.city(),
+            "district": fake.city_suffix(),
+            "address": fake.street_address(),
+            "contact_name": fake.name(),
+            "contact_phone": fake.phone_number(),
+        }
+        for dummy in range(how_many)
+    ]
+
+
+def create_scaled_data(
+    scale, seed=0, chunk_size=5000, placeholder_dir=None, unit=SCALE_UNIT
+):
+    """Bulk insert ``scale`` units of products, users, orders and sales.
+
+    A ``seed`` gives the same data on the same database. The rows go in
+    ``chunk_size`` at a time with explicit ids and skip the flush events,
+    the prices, the facets and the cached listings are updated at the end.
+    """
+    if not ShippingMethod.query.count():
+        yield from create_shipping_methods()
+    rnd = random.Random(seed)
+    fake.seed_instance(seed)
+    writer = BulkWriter(chunk_size)
+    catalog = _scaled_catalog(placeholder_dir or Path("placeholders"))
+    yield f"{len(catalog)} product types in {_scaled_categories(catalog)} categories"
+    products, variants = yield from _scaled_products(
+        rnd, writer, catalog, scale * unit["products"]
+    )
+    users, addresses = yield from _scaled_users(rnd, writer, scale * unit["users"])
+    yield from _scaled_orders(
+        rnd, writer, scale * unit["orders"], users, variants, addresses
+    )
+    yield from _scaled_sales(rnd, writer, scale * unit["sales"], products)
+    _sync_sequences(
+        Product,
+        ProductVariant,
+        ProductImage,
+        User,
+        UserAddress,
+        Order,
+        OrderLine,
+        OrderPayment,
+        Sale,
+    )
+    bump_ns(MC_NS_FEATURED_PRODUCTS)
+    for category_id in _scaled_categories(catalog, ids=True):
+        bump_ns(MC_NS_CATEGORY_PRODUCTS.format(category_id))
+    yield "Done, run `flask reindex` to search the new products"
+
+
+def _scaled_catalog(placeholder_dir):
+    """The product types of the schema with everything a product needs."""
+    catalog = []
+    for product_type, schema in create_product_types_by_schema(DEFAULT_SCHEMA):
+        category = get_or_create_category(schema["category"], placeholder_dir)
+        categories = [category]
+        for dummy in range(SCALE_SUBCATEGORIES):
+            categories.append(
+                Category.get_or_create(
+                    title=f"{category.title} {fake.word().title()}",
+                    parent_id=category.id,
+                    background_img=category.background_img,
+                )[0]
+            )
+        variant_values = [
+            [(attribute, value) for value in attribute.values]
+            for attribute in product_type.variant_attributes
+        ]
+        images = Config.STATIC_DIR / placeholder_dir / schema["images_dir"]
+        catalog.append(
+            {
+                "type_id": product_type.id,
+                "categories": categories,
+                "attributes": [
+                    (attribute.id, [value.id for value in attribute.values])
+                    for attribute in product_type.product_attributes
+                ],
+                # one variant without attributes for the types without any
+                "variants": [
+                    (
+                        {str(attr.id): str(value.id) for attr, value in combination},
+                        " / ".join(value.title for _, value in combination) or None,
+                    )
+                    for combination in itertools.product(*variant_values)
+                ],
+                "different_prices": schema.get("different_variant_prices", False),
+                "shipping": product_type.is_shipping_required,
+                "images": sorted(
+                    str(path.relative_to(Config.STATIC_DIR))
+                    for path in images.iterdir()
+                )
+                if images.is_dir()
+                else [],
+            }
+        )
+    return catalog
+
+
+def _scaled_categories(catalog, ids=False):
+    """The categories of the catalog and their parents, or their count."""
+    category_ids = set()
+    for kind in catalog:
+        for category in kind["categories"]:
+            category_ids.update([category.id, category.parent_id])
+    category_ids.discard(0)
+    return category_ids if ids else len(category_ids)
+
+
+def _scaled_products(rnd, writer, catalog, how_many):
+    titles = [fake.company() for dummy in range(1000)]
+    descriptions = ["\n\n".join(fake.paragraphs(5)) for dummy in range(20)]
+    product_id = first_product_id = _next_id(Product)
+    variant_id = _next_id(ProductVariant)
+    image_id = _next_id(ProductImage)
+    variants = VariantPool(variant_id, catalog, titles)
+    for count in range(1, how_many + 1):
+        kind_index = rnd.randrange(len(catalog))
+        kind = catalog[kind_index]
+        title_index = rnd.randrange(len(titles))
+        price = round(rnd.uniform(1, 100), 2)
+        attributes = {
+            str(attribute_id): str(rnd.choice(value_ids))
+            for attribute_id, value_ids in kind["attributes"]
+        }
+        writer.add(
+            Product,
+            {
+                "id": product_id,
+                "title": titles[title_index],
+                "basic_price": price,
+                "discount": 0,
+                "effective_price": price,
+                "category_id": rnd.choice(kind["categories"]).id,
+                "is_featured": rnd.random() < 0.1,
+                "product_type_id": kind["type_id"],
+                "attributes": attributes,
+                "description": rnd.choice(descriptions),
+            },
+        )
+        for row in ProductFacet.rows_of(product_id, attributes):
+            writer.add(ProductFacet, row)
+        if kind["images"]:
+            for order in range(rnd.randrange(1, 5)):
+                image = rnd.choice(kind["images"])
+                writer.add(
+                    ProductImage,
+                    {
+                        "id": image_id,
+                        "image": image,
+                        "order": order,
+                        "product_id": product_id,
+                    },
+                )
+                image_id += 1
+        overrides = [0.0] * len(kind["variants"])
+        if kind["different_prices"]:
+            overrides = sorted(
+                (round(price + rnd.uniform(0.01, 10), 2) for dummy in overrides),
+                reverse=True,
+            )
+        for position, (attrs, title) in enumerate(kind["variants"]):
+            writer.add(
+                ProductVariant,
+                {
+                    "id": variant_id,
+                    "sku": f"{product_id}-{position}",
+                    "title": title,
+                    "price_override": overrides[position],
+                    "quantity": rnd.randint(1, 50),
+                    "quantity_allocated": 0,
+                    "product_id": product_id,
+                    "attributes": attrs,
+                },
+            )
+            variants.append(
+                product_id,
+                overrides[position] or price,
+                kind_index,
+                title_index,
+                position,
+            )
+            variant_id += 1
+        product_id += 1
+        if writer.full(Product) or count == how_many:
+            writer.flush()
+            yield f"Products: {count}/{how_many}"
+    return (first_product_id, product_id), variants
+
+
+def _scaled_users(rnd, writer, how_many):
+    # bcrypt is slow on purpose, every user gets the same hash
+    password = bcrypt.generate_password_hash(SCALE_PASSWORD).decode("UTF-8")
+    first_names = [fake.first_name() for dummy in range(200)]
+    last_names = [fake.last_name() for dummy in range(200)]
+    addresses = _address_pool(500)
+    user_id = first_user_id = _next_id(User)
+    address_id = _next_id(UserAddress)
+    for count in range(1, how_many + 1):
+        first_name, last_name = rnd.choice(first_names), rnd.choice(last_names)
+        writer.add(
+            User,
+            {
+                "id": user_id,
+                "username": f"{first_name}{last_name}{user_id}",
+                "email": get_email(first_name, last_name).replace("@", f".{user_id}@"),
+                "_password": password,
+                "is_active": True,
+                "reset_password_uid": _uuid(rnd, user_id),
+            },
+        )
+        writer.add(
+            UserAddress, {"id": address_id, "user_id": user_id, **rnd.choice(addresses)}
+        )
+        user_id += 1
+        address_id += 1
+        if writer.full(User) or count == how_many:
+            writer.flush()
+            yield f"Users: {count}/{how_many} with the password {SCALE_PASSWORD}"
+    return (first_user_id, user_id), addresses
+
+
+def _scaled_orders(rnd, writer, how_many, users, variants, addresses):
+    methods = ShippingMethod.query.all()
+    statuses = [status.value for status in OrderStatusKinds]
+    payment_statuses = [status.value for status in PaymentStatusKinds]
+    now = datetime.utcnow()
+    order_id = _next_id(Order)
+    line_id = _next_id(OrderLine)
+    payment_id = _next_id(OrderPayment)
+    # what the unfulfilled orders hold, per variant
+    held = defaultdict(int)
+    for count in range(1, how_many + 1):
+        total = 0
+        quantities = []
+        for dummy in range(rnd.randint(1, 9)):
+            line = variants.line(rnd)
+            quantity = rnd.randint(1, 4)
+            writer.add(
+                OrderLine,
+                {"id": line_id, "order_id": order_id, "quantity": quantity, **line},
+            )
+            total += quantity * line["unit_price_net"]
+            quantities.append((line["variant_id"], quantity))
+            line_id += 1
+        method = rnd.choice(methods)
+        address = rnd.choice(addresses)
+        # spread over a year for the dashboard and the order listings
+        created_at = now - timedelta(seconds=rnd.randrange(365 * 24 * 3600))
+        user_id = rnd.randrange(*users)
+        status = rnd.choice(statuses)
+        if status == OrderStatusKinds.unfulfilled.value:
+            for variant_id, quantity in quantities:
+                held[variant_id] += quantity
+        writer.add(
+            Order,
+            {
+                "id": order_id,
+                "token": _uuid(rnd, order_id),
+                "shipping_address": "<br>".join(
+                    address[field]
+                    for field in (
+                        "province",
+                        "city",
+                        "district",
+                        "address",
+                        "contact_name",
+                        "contact_phone",
+                    )
+                ),
+                "user_id": user_id,
+                "total_net": round(total, 2),
+                "shipping_price_net": method.price,
+                "status": status,
+                "shipping_method_name": method.title,
+                "shipping_method_id": method.id,
+                "created_at": created_at,
+                "updated_at": created_at,
+            },
+        )
+        writer.add(
+            OrderPayment,
+            {
+                "id": payment_id,
+                "order_id": order_id,
+                "status": rnd.choice(payment_statuses),
+                "total": round(total, 2),
+                "delivery": method.price,
+                "customer_ip_address": f"10.{rnd.randrange(256)}.{rnd.randrange(256)}.1",
+                "created_at": created_at,
+                "updated_at": created_at,
+            },
+        )
+        order_id += 1
+        payment_id += 1
+        if writer.full(Order) or count == how_many:
+            writer.flush()
+            yield f"Orders: {count}/{how_many}"
+    yield from _hold_stock(writer.chunk_size, held)
+
+
+def _hold_stock(chunk_size, held):
+    # allocated on top of the seeded stock, as if checked out before it came
+    table = ProductVariant.__table__
+    statement = (
+        table.update()
+        .where(table.c.id == bindparam("variant_id"))
+        .values(
+            quantity=table.c.quantity + bindparam("held"),
+            quantity_allocated=table.c.quantity_allocated + bindparam("held"),
+        )
+    )
+    rows = [dict(variant_id=id, held=n) for id, n in sorted(held.items())]
+    for start in range(0, len(rows), chunk_size):
+        db.session.execute(statement, rows[start : start + chunk_size])  # noqa
+    db.session.commit()
+    if rows:
+        yield f"Stock held by unfulfilled orders: {len(rows)} variants"
+
+
+def _scaled_sales(rnd, writer, how_many, products):
+    sale_id = first_sale_id = _next_id(Sale)
+    product_ids = range(*products)
+    for count in range(1, how_many + 1):
+        writer.add(
+            Sale,
+            {
+                "id": sale_id,
+                "title": f"Happy {fake.word()} day!",
+                "discount_value_type": DiscountValueTypeKinds.percent.value,
+                "discount_value": rnd.choice([10, 20, 30, 40, 50]),
+            },
+        )
+        for product_id in rnd.sample(product_ids, min(20, len(product_ids))):
+            writer.add(SaleProduct, {"sale_id": sale_id, "product_id": product_id})
+        sale_id += 1
+    if how_many:
+        writer.flush()
+        on_sale = db.select(SaleProduct.product_id).where(
+            SaleProduct.sale_id >= first_sale_id
+        )
+        repriced = update_prices(Product.id.in_(on_sale))
+        db.session.commit()
+        yield f"Sales: {how_many} on {repriced} products"
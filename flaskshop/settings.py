@@ -21,6 +21,32 @@ class Config:
     REDIS_URL = os.getenv(
         "REDIS_URI",
     )
+    # process local cache of the props items, 0 means unlimited ttl/bytes.
+    # the ttl bounds how long a worker serves props changed by another worker
+    LOCAL_CACHE_SIZE = int(os.getenv("LOCAL_CACHE_SIZE", 10000))
+    LOCAL_CACHE_TTL = int(os.getenv("LOCAL_CACHE_TTL", 30))  # unit is second
+    LOCAL_CACHE_MAX_BYTES = int(os.getenv("LOCAL_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+    # how cached values are stored: msgpack, json or pickle
+    CACHE_CODEC = os.getenv("CACHE_CODEC", "msgpack")
+    CACHE_COMPRESS_THRESHOLD = int(os.getenv("CACHE_COMPRESS_THRESHOLD", 2048))
+    # per worker in-process cache in front of redis for the @cache keys,
+    # workers invalidate each other over redis pub/sub
+    CACHE_L1_ENABLED = int(os.getenv("CACHE_L1_ENABLED", 0)) == 1
+    CACHE_L1_SIZE = int(os.getenv("CACHE_L1_SIZE", 1000))
+    CACHE_L1_TTL = int(os.getenv("CACHE_L1_TTL", 30))  # unit is second
+    # stock of the variants flagged hot (flask hot-sku) is counted in redis,
+    # `flask reconcile-stock --loop` writes it back to the database
+    STOCK_HOT_SKUS_ENABLED = int(os.getenv("STOCK_HOT_SKUS_ENABLED", 0)) == 1
+    STOCK_RECONCILE_INTERVAL = int(os.getenv("STOCK_RECONCILE_INTERVAL", 5))
+    # add to cart writes a redis hash, merged to the database at login/checkout
+    CART_SESSION_ENABLED = int(os.getenv("CART_SESSION_ENABLED", 0)) == 1
+    CART_SESSION_TTL = int(os.getenv("CART_SESSION_TTL", 7 * 24 * 3600))
+    # unpaid orders give their stock back after this, see `flask expire-orders`
+    ORDER_UNPAID_TTL = int(os.getenv("ORDER_UNPAID_TTL", 30))  # unit is minute
+    ORDER_EXPIRE_INTERVAL = int(os.getenv("ORDER_EXPIRE_INTERVAL", 60))
+    # an order whose payment started less than this ago isn't expired, the
+    # gateway may still notify it
+    PAYMENT_TIMEOUT = int(os.getenv("PAYMENT_TIMEOUT", 15))  # unit is minute
 
     GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
     GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
@@ -28,13 +54,31 @@ class Config:
 
     # Elasticsearch
     # if elasticsearch is enabled, the home page will have a search bar
-    # and while add a product, the search index will get update
+    # and the changed products are indexed
     USE_ES = int(os.getenv("USE_ES", 0)) == 1
     ES_HOSTS = [os.getenv("ESEARCH_URI")]
+    # product changes are queued in the search_outbox table with the change,
+    # `flask index-search --loop` sends them to elasticsearch in bulk
+    SEARCH_INDEX_INTERVAL = int(os.getenv("SEARCH_INDEX_INTERVAL", 5))
+    SEARCH_INDEX_BATCH_SIZE = int(os.getenv("SEARCH_INDEX_BATCH_SIZE", 500))
     # SQLALCHEMY
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     DATABASE_QUERY_TIMEOUT = 0.1  # log the slow database query, and unit is second
     SQLALCHEMY_RECORD_QUERIES = True
+    # count the queries and redis calls of every request, see corelib.profiler
+    PROFILER_ENABLED = int(os.getenv("PROFILER_ENABLED", 1)) == 1
+    # send the counts as X-Profile-* response headers
+    PROFILER_HEADERS = int(os.getenv("PROFILER_HEADERS", 0)) == 1
+    # a statement run this many times in one request is logged as an N+1
+    PROFILER_REPEAT_THRESHOLD = int(os.getenv("PROFILER_REPEAT_THRESHOLD", 10))
+    # prometheus metrics at /metrics, see corelib.metrics
+    METRICS_ENABLED = int(os.getenv("METRICS_ENABLED", 1)) == 1
+    # shared by the workers of a multi-process server, the metrics of one
+    # worker only when empty
+    METRICS_DIR = os.getenv("METRICS_DIR", "")
+    METRICS_FLUSH_INTERVAL = int(os.getenv("METRICS_FLUSH_INTERVAL", 5))
+    # when set, /metrics wants an "Authorization: Bearer <token>" header
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
     # Dir
     APP_DIR = Path(__file__).parent  # This directory
     PROJECT_ROOT = APP_DIR.parent
@@ -94,6 +138,7 @@ class DevConfig(Config):
     DEBUG_TB_PROFILER_ENABLED = True
     MAIL_DEBUG = DEBUG_TB_ENABLED
     AUTHLIB_INSECURE_TRANSPORT = True
+    PROFILER_HEADERS = True
     SQLALCHEMY_DATABASE_URI = os.getenv(
         "DB_URI_DEV",
         "sqlite:///" + str((Path(__file__).parent.parent / "database-test.sqlite3")),
@@ -104,6 +149,9 @@ class ProdConfig(Config):
     ENV = "production"
     DEBUG = False
     DEBUG_TB_ENABLED = False
+    # opt in, /metrics is public unless METRICS_TOKEN is set
+    PROFILER_ENABLED = int(os.getenv("PROFILER_ENABLED", 0)) == 1
+    METRICS_ENABLED = int(os.getenv("METRICS_ENABLED", 0)) == 1
     SQLALCHEMY_DATABASE_URI = os.getenv("DB_URI_PROD")
 
 
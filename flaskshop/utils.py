@@ -7,11 +7,10 @@ from flask_sqlalchemy import get_debug_queries
 from flask import flash, request, current_app
 from urllib.parse import urlencode
 
-from flaskshop.public.models import MenuItem
+from flaskshop.public.site import get_site
+from flaskshop.checkout import session_cart
 from flaskshop.checkout.models import Cart
-from flaskshop.dashboard.models import Setting
 from flaskshop.plugin.utils import template_hook
-from flaskshop.constant import SiteDefaultSettings
 
 
 def flash_errors(form, category="warning"):
@@ -51,33 +50,15 @@ def jinja_global_varibles(app):
     @app.context_processor
     def inject_cart():
         current_user_cart = Cart.get_current_user_cart()
+        if session_cart.enabled():
+            pending = session_cart.SessionCart.current()
+            if pending is not None:
+                current_user_cart = pending.view(current_user_cart)
         return dict(current_user_cart=current_user_cart)
 
     @app.context_processor
-    def inject_menus():
-        top_menu = (
-            MenuItem.query.filter(MenuItem.position == 1)
-            .filter(MenuItem.parent_id == 0)
-            .order_by(MenuItem.order)
-            .all()
-        )
-        bottom_menu = (
-            MenuItem.query.filter(MenuItem.position == 2)
-            .filter(MenuItem.parent_id == 0)
-            .order_by(MenuItem.order)
-            .all()
-        )
-        return dict(top_menu=top_menu, bottom_menu=bottom_menu)
-
-    @app.context_processor
-    def inject_site_setting():
-        settings = {}
-        for key, value in SiteDefaultSettings.items():
-            obj = Setting.query.filter_by(key=key).first()
-            if not obj:
-                obj = Setting.create(key=key, **value)
-            settings[key] = obj
-        return dict(settings=settings)
+    def inject_site():
+        return get_site()
 
     def get_sort_by_url(field, descending=False):
         request_get = request.args.copy()
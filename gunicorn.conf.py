@@ -0,0 +1,62 @@
+"""Gunicorn settings of the production server, ``gunicorn autoapp:app``.
+
+The app is imported once by the master and the workers are forked from it,
+sharing the imported modules copy-on-write. Each worker then drops the
+database and redis connections it inherited and opens its own.
+
+``kill -HUP <master>`` restarts the workers gracefully. With the app
+preloaded that keeps the code of the master, deploy new code with a
+restart of the container, or set ``WEB_PRELOAD=0`` to have HUP load it.
+"""
+import multiprocessing
+import os
+from pathlib import Path
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+# the usual 2 per core + 1, the workers mostly wait on the database
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+# more than 1 serves the requests of a worker from a thread pool (gthread)
+threads = int(os.getenv("WEB_THREADS", 1))
+worker_class = "gthread" if threads > 1 else "sync"
+preload_app = int(os.getenv("WEB_PRELOAD", 1)) == 1
+timeout = int(os.getenv("WEB_TIMEOUT", 30))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("WEB_KEEPALIVE", 5))
+# recycle the workers after that many requests, 0 never does
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+accesslog = os.getenv("WEB_ACCESS_LOG", "-")
+errorlog = "-"
+
+
+def on_starting(server):
+    # the metrics files of the previous run belong to dead workers
+    metrics_dir = os.getenv("METRICS_DIR")
+    if metrics_dir and os.path.isdir(metrics_dir):
+        for path in Path(metrics_dir).glob("*.json"):
+            path.unlink()
+
+
+def when_ready(server):
+    if preload_app:
+        from autoapp import app
+        from flaskshop.app import reset_connections
+
+        # no connection of the master is shared with the workers
+        reset_connections(app)
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from autoapp import app
+        from flaskshop.app import reset_connections
+
+        reset_connections(app, close=False)
+
+
+def child_exit(server, worker):
+    metrics_dir = os.getenv("METRICS_DIR")
+    if metrics_dir and os.path.isdir(metrics_dir):
+        from flaskshop.corelib.metrics import mark_dead
+
+        mark_dead(metrics_dir, worker.pid)
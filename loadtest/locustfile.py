@@ -0,0 +1,210 @@
+"""Weighted user journeys over the paths that load the shop the most.
+
+- ``Browser`` lists categories with filters and sorting, opens products and
+  asks the price of their variants.
+- ``Buyer`` logs in, adds to the cart, changes a line and goes through the
+  shipping, voucher and note steps to ``test_pay``.
+- ``Admin`` opens the dashboard.
+- ``Searcher`` searches, with ``LOADTEST_SEARCH=1`` only as it needs
+  elasticsearch.
+
+Seed the database and the fixtures first, see ``loadtest/seed.py``, then::
+
+    locust --config loadtest/locust.conf --host http://127.0.0.1:5000 \\
+        --csv loadtest/results/$(git rev-parse --short HEAD)
+    python -m loadtest.report loadtest/results/<base> loadtest/results/<head>
+
+``LOADTEST_FIXTURES`` is the fixtures file, ``loadtest/fixtures.json`` by
+default.
+"""
+import json
+import os
+import random
+import re
+from itertools import count
+from pathlib import Path
+
+from locust import HttpUser, SequentialTaskSet, between, task
+
+FIXTURES = json.loads(
+    Path(
+        os.getenv("LOADTEST_FIXTURES", Path(__file__).parent / "fixtures.json")
+    ).read_text()
+)
+SORTS = ["", "title", "-title", "price", "-price"]
+WORDS = ["shirt", "coffee", "candy", "book", "music", "new"]
+CSRF_TOKEN = re.compile(r'<meta name="csrf-token" content="([^"]+)"')
+CART_LINE = re.compile(r"/checkout/update_cart/(\d+)")
+SHIPPING_METHOD = re.compile(r'name="shipping_method" value="(\d+)"')
+ORDER_TOKEN = re.compile(r"/orders/([0-9a-f-]{36})")
+# users log in round robin, two buyers share a user only past len(users)
+_next_user = count()
+
+
+def csrf_token(response):
+    match = CSRF_TOKEN.search(response.text)
+    return match.group(1) if match else ""
+
+
+def login(client, username, password):
+    page = client.get("/account/login")
+    client.post(
+        "/account/login",
+        {"csrf_token": csrf_token(page), "username": username, "password": password},
+        name="/account/login [POST]",
+    )
+
+
+class Browser(HttpUser):
+    weight = 10
+    wait_time = between(1, 3)
+
+    @task(2)
+    def home(self):
+        self.client.get("/")
+
+    @task(4)
+    def category(self):
+        category_id, pages = random.choice(list(FIXTURES["categories"].items()))
+        params = {"page": random.randint(1, pages), "sort_by": random.choice(SORTS)}
+        if random.random() < 0.3:
+            # fewer pages once filtered, the first always exists
+            params["page"] = 1
+            params["price_from"] = random.randint(0, 50)
+            params["price_to"] = params["price_from"] + random.randint(10, 100)
+        self.client.get(
+            f"/products/category/{category_id}",
+            params=params,
+            name="/products/category/[id]",
+        )
+
+    @task(4)
+    def product(self):
+        product_id, variants = random.choice(list(FIXTURES["products"].items()))
+        self.client.get(f"/products/{product_id}", name="/products/[id]")
+        self.client.get(
+            f"/products/api/variant_price/{random.choice(variants)}",
+            name="/products/api/variant_price/[id]",
+        )
+
+    @task(1)
+    def page(self):
+        self.client.get("/page/about")
+
+
+class Checkout(SequentialTaskSet):
+    """One purchase, from the product page to the payment."""
+
+    def on_start(self):
+        self.token = ""
+
+    @task
+    def add_to_cart(self):
+        product_id, variants = random.choice(list(FIXTURES["products"].items()))
+        page = self.client.get(f"/products/{product_id}", name="/products/[id]")
+        self.client.post(
+            f"/products/{product_id}/add",
+            {
+                "csrf_token": csrf_token(page),
+                "variant": random.choice(variants),
+                "quantity": random.randint(1, 2),
+            },
+            name="/products/[id]/add",
+        )
+
+    @task
+    def update_cartline(self):
+        cart = self.client.get("/checkout/cart")
+        self.token = csrf_token(cart)
+        lines = CART_LINE.findall(cart.text)
+        if not lines:
+            self.interrupt()
+        self.client.post(
+            f"/checkout/update_cart/{random.choice(lines)}",
+            {"csrf_token": self.token, "quantity": random.randint(1, 3)},
+            name="/checkout/update_cart/[id]",
+        )
+
+    @task
+    def shipping(self):
+        page = self.client.get("/checkout/shipping")
+        methods = SHIPPING_METHOD.findall(page.text)
+        if not methods:
+            self.interrupt()
+        self.client.post(
+            "/checkout/shipping",
+            {
+                "csrf_token": self.token,
+                "address_sel": "new",
+                "shipping_method": random.choice(methods),
+                "province": "Province",
+                "city": "City",
+                "district": "District",
+                "address": "1 Load Street",
+                "contact_name": "Load Test",
+                "contact_phone": "0123456789",
+            },
+            name="/checkout/shipping [POST]",
+        )
+
+    @task
+    def voucher(self):
+        if random.random() < 0.3:
+            self.client.post(
+                "/checkout/voucher",
+                {"csrf_token": self.token, "code": random.choice(FIXTURES["vouchers"])},
+            )
+
+    @task
+    def note(self):
+        self.client.get("/checkout/note")
+        response = self.client.post(
+            "/checkout/note",
+            {"csrf_token": self.token, "note": "load test"},
+            name="/checkout/note [POST]",
+        )
+        match = ORDER_TOKEN.search(response.url)
+        if match:
+            self.client.get(
+                f"/orders/pay/{match.group(1)}/testpay",
+                name="/orders/pay/[token]/testpay",
+            )
+        self.interrupt()
+
+
+class Buyer(HttpUser):
+    weight = 3
+    wait_time = between(1, 3)
+    tasks = [Checkout]
+
+    def on_start(self):
+        users = FIXTURES["users"]
+        email = users[next(_next_user) % len(users)]
+        login(self.client, email, FIXTURES["password"])
+
+
+class Admin(HttpUser):
+    weight = 1
+    wait_time = between(2, 5)
+
+    def on_start(self):
+        login(self.client, **FIXTURES["admin"])
+
+    @task
+    def dashboard(self):
+        self.client.get("/dashboard/")
+
+
+if os.getenv("LOADTEST_SEARCH") == "1":
+
+    class Searcher(HttpUser):
+        weight = 3
+        wait_time = between(1, 3)
+
+        @task
+        def search(self):
+            self.client.get(
+                "/search",
+                params={"q": random.choice(WORDS), "page": random.randint(1, 2)},
+                name="/search",
+            )
@@ -0,0 +1,65 @@
+"""Per endpoint percentiles of locust runs, compared to a base run.
+
+    python -m loadtest.report loadtest/results/<head>
+    python -m loadtest.report loadtest/results/<base> loadtest/results/<head>
+
+The arguments are the ``--csv`` prefixes given to locust.
+"""
+import argparse
+import csv
+
+COLUMNS = [("p50", "50%"), ("p95", "95%"), ("p99", "99%"), ("rps", "Requests/s")]
+
+
+def load(prefix):
+    """``{(method, name): {column: value}}`` of ``<prefix>_stats.csv``."""
+    with open(f"{prefix}_stats.csv", newline="") as f:
+        return {
+            (row["Type"], row["Name"]): {
+                column: float(row[field] or 0) for column, field in COLUMNS
+            }
+            | {"failures": int(row["Failure Count"])}
+            for row in csv.DictReader(f)
+        }
+
+
+def _cell(value, compare, base=None):
+    if not compare:
+        return f"{value:>9.1f}"
+    if not base:
+        # a new endpoint, or nothing to divide by
+        return f"{value:>9.1f} {'':>7}"
+    return f"{value:>9.1f} {(value - base) / base:>+7.0%}"
+
+
+def report(head, base=None):
+    width = max(len(f"{method} {name}") for method, name in head)
+    header = f"{'endpoint':<{width}}" + "".join(
+        f"{column:>9}" + ("" if base is None else " " * 8) for column, _ in COLUMNS
+    )
+    lines = [header + f"{'failures':>10}"]
+    for key, stats in sorted(head.items(), key=lambda item: item[0][1]):
+        before = (base or {}).get(key) or {}
+        lines.append(
+            f"{' '.join(key).strip():<{width}}"
+            + "".join(
+                _cell(stats[column], base is not None, before.get(column))
+                for column, _ in COLUMNS
+            )
+            + f"{stats['failures']:>10}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("runs", nargs="+", metavar="prefix", help="[base] head")
+    args = parser.parse_args()
+    if len(args.runs) > 2:
+        parser.error("at most a base and a head run")
+    runs = [load(prefix) for prefix in args.runs]
+    print(report(runs[-1], runs[0] if len(runs) == 2 else None))
+
+
+if __name__ == "__main__":
+    main()
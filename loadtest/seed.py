@@ -0,0 +1,130 @@
+"""Seed the database of a load test and write the ids the users pick from.
+
+    FLASK_ENV=development python -m loadtest.seed --reset --products 50 --users 100
+
+``--products`` is per product type of ``random_data.DEFAULT_SCHEMA``. The
+seeded users, all with the password ``password``, the admin, the products,
+their variants and the pages of the categories go to ``loadtest/fixtures.json``, read by
+the locustfile.
+"""
+import argparse
+import json
+import math
+import os
+from itertools import chain
+from pathlib import Path
+
+from sqlalchemy import func
+
+from flaskshop.app import create_app
+from flaskshop.account.models import User
+from flaskshop.database import db
+from flaskshop.product.models import Category, Product, ProductVariant
+from flaskshop.random_data import (
+    create_admin,
+    create_dashboard_menus,
+    create_menus,
+    create_products_by_schema,
+    create_roles,
+    create_shipping_methods,
+    create_users,
+    create_vouchers,
+)
+from flaskshop.settings import config
+
+FIXTURES = Path(__file__).parent / "fixtures.json"
+USER_PASSWORD = "password"
+# products per page of Category.get_product_by_category
+PER_PAGE = 16
+
+
+def seed(products, users):
+    create_products_by_schema(
+        placeholder_dir=Path("placeholders"), how_many=products, create_images=False
+    )
+    for msg in chain(
+        create_users(users),
+        create_roles(),
+        create_admin(),
+        create_menus(),
+        create_shipping_methods(),
+        create_dashboard_menus(),
+        create_vouchers(),
+    ):
+        print(msg)
+
+
+def category_pages():
+    """``{category_id: pages}`` of the category listings, their children
+    included, 16 products per page.
+    """
+    counts = dict(
+        db.session.query(Product.category_id, func.count()).group_by(
+            Product.category_id
+        )
+    )
+    totals = {}
+    for category_id, parent_id in db.session.query(Category.id, Category.parent_id):
+        count = counts.get(category_id, 0)
+        totals[category_id] = totals.get(category_id, 0) + count
+        if parent_id:
+            totals[parent_id] = totals.get(parent_id, 0) + count
+    return {
+        str(category_id): max(1, math.ceil(total / PER_PAGE))
+        for category_id, total in totals.items()
+    }
+
+
+def dump_fixtures(path):
+    variants = {}
+    for variant_id, product_id in db.session.query(
+        ProductVariant.id, ProductVariant.product_id
+    ):
+        variants.setdefault(product_id, []).append(variant_id)
+    admin = os.getenv("ADMIN_USER", "admin")
+    fixtures = {
+        "users": [
+            email
+            for (email,) in db.session.query(User.email).filter(User.username != admin)
+        ],
+        "password": USER_PASSWORD,
+        "admin": {"username": admin, "password": os.getenv("ADMIN_PASSWD", "admin")},
+        "products": {
+            str(product_id): variants.get(product_id, [])
+            for (product_id,) in db.session.query(Product.id)
+            if variants.get(product_id)
+        },
+        "categories": category_pages(),
+        "vouchers": ["DISCOUNT", "FREESHIPPING"],
+    }
+    path.write_text(json.dumps(fixtures, indent=2))
+    return fixtures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=10)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--reset", action="store_true", help="drop the tables first")
+    parser.add_argument("--fixtures", type=Path, default=FIXTURES)
+    parser.add_argument(
+        "--no-seed", action="store_true", help="only write the fixtures"
+    )
+    args = parser.parse_args()
+
+    app = create_app(config[os.getenv("FLASK_ENV", "development")])
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+            db.create_all()
+        if not args.no_seed:
+            seed(args.products, args.users)
+        fixtures = dump_fixtures(args.fixtures)
+    print(
+        f"{len(fixtures['products'])} products and {len(fixtures['users'])} users "
+        f"in {args.fixtures}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""Serve the app for a load test on one machine, without a redis server.
+
+    USE_REDIS=1 python -m loadtest.serve --port 5000
+
+Redis is replaced by an in-process fakeredis shared by the threads of the
+server, so it runs a single process. Load test gunicorn against a real
+redis to measure the production setup.
+"""
+import argparse
+import os
+
+import fakeredis
+import redis
+
+_server = fakeredis.FakeServer()
+
+
+def _fake_from_url(cls, url, **kwargs):
+    return fakeredis.FakeRedis(server=_server)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+
+    # before flaskshop makes its client from REDIS_URI
+    redis.Redis.from_url = classmethod(_fake_from_url)
+    from flaskshop.app import create_app
+    from flaskshop.settings import config
+
+    app = create_app(config[os.getenv("FLASK_ENV", "development")])
+    app.run(args.host, args.port, threaded=True, use_reloader=False)
+
+
+if __name__ == "__main__":
+    main()
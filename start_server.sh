@@ -2,4 +2,5 @@
 echo Run db upgrade
 flask db upgrade
 echo Running app
-flask run -h 0.0.0.0
+# settings in gunicorn.conf.py, exec to receive the signals of docker
+exec gunicorn autoapp:app
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""Cart model tests."""
+import pytest
+
+from flaskshop.checkout.models import Cart, CartLine, ShippingMethod
+from flaskshop.constant import DiscountValueTypeKinds, VoucherTypeKinds
+from flaskshop.database import db
+from flaskshop.discount.models import Voucher
+from flaskshop.product.models import Product, ProductType, ProductVariant
+
+
+def _cart(**kwargs):
+    # plain insert, the cart events want a logged in user
+    result = db.session.execute(Cart.__table__.insert().values(**kwargs))
+    db.session.commit()
+    return Cart.query.get(result.inserted_primary_key[0])
+
+
+@pytest.mark.usefixtures("db")
+class TestCartSnapshot:
+    """Cart totals tests."""
+
+    def setup_cart(self, **kwargs):
+        ProductType.create(title="shipped", is_shipping_required=True)
+        shirt = Product.create(title="shirt", basic_price=10, category_id=1)
+        hat = Product.create(title="hat", basic_price=5, category_id=2)
+        variants = [
+            ProductVariant.create(sku="1-1", product_id=shirt.id, quantity=9),
+            ProductVariant.create(
+                sku="1-2", product_id=shirt.id, quantity=9, price_override=12
+            ),
+            ProductVariant.create(sku="2-1", product_id=hat.id, quantity=9),
+        ]
+        cart = _cart(quantity=4, **kwargs)
+        for variant, quantity in zip(variants, (1, 2, 1)):
+            CartLine.create(cart_id=cart.id, variant_id=variant.id, quantity=quantity)
+        return cart, shirt, hat
+
+    def test_totals(self, query_budget):
+        shipping = ShippingMethod.create(title="post", price=3)
+        Voucher.create(
+            title="hats",
+            code="HAT",
+            type_=VoucherTypeKinds.category.value,
+            category_id=2,
+            discount_value_type=DiscountValueTypeKinds.fixed.value,
+            discount_value=2,
+        )
+        cart, shirt, _ = self.setup_cart(
+            shipping_method_id=shipping.id, voucher_code="HAT"
+        )
+
+        db.session.expire_all()
+        cart = Cart.query.get(cart.id)
+        # the lines, the shipping method and the voucher
+        with query_budget(3):
+            totals = cart.totals
+            assert totals.subtotal == 10 + 24 + 5
+            assert cart.get_product_price(shirt.id) == 34
+            assert cart.discount_amount == 2
+            assert cart.total == 39 + 3 - 2
+            assert [line.variant.price for line in cart.lines] == [10, 12, 5]
+        assert cart.totals is totals
+
+    def test_line_change_drops_the_snapshot(self):
+        cart, _, _ = self.setup_cart()
+        totals = cart.totals
+        cart.lines[0].update(quantity=3)
+        assert cart.totals is not totals
+        assert cart.subtotal == 30 + 24 + 5
+        assert cart.totals.quantity == 6
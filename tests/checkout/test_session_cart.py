@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Session cart tests."""
+import pytest
+from flask import session
+from flask_login import login_user
+
+from flaskshop import database
+from flaskshop.checkout import session_cart
+from flaskshop.corelib import mc
+from flaskshop.checkout.models import Cart, CartLine
+from flaskshop.product.models import Product, ProductVariant
+
+
+@pytest.fixture
+def redis_carts(app, monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    monkeypatch.setitem(app.config, "USE_REDIS", True)
+    monkeypatch.setitem(app.config, "CART_SESSION_ENABLED", True)
+    r = fakeredis.FakeRedis()
+    # the record cache goes to redis as well once USE_REDIS is on
+    for module in (session_cart, mc, database):
+        monkeypatch.setattr(module, "rdb", r)
+    return r
+
+
+@pytest.mark.usefixtures("db")
+class TestSessionCart:
+    """SessionCart tests."""
+
+    def setup_variants(self):
+        product = Product.create(title="shirt", basic_price=10)
+        return [
+            ProductVariant.create(sku=f"1-{i}", product_id=product.id, quantity=9)
+            for i in range(2)
+        ]
+
+    def test_anonymous_cart_is_merged_at_login(self, redis_carts, user):
+        first, second = self.setup_variants()
+        Cart.add_to_currentuser_cart(1, first.id)
+        Cart.add_to_currentuser_cart(2, first.id)
+        Cart.add_to_currentuser_cart(1, second.id)
+        assert "cart_id" in session
+        assert Cart.query.count() == 0
+
+        pending = session_cart.SessionCart.current()
+        assert pending.items() == {first.id: 3, second.id: 1}
+        view = pending.view()
+        assert (view.quantity, view.total) == (4, 40)
+        assert redis_carts.ttl(pending.key) > 0
+
+        login_user(user)
+        cart = Cart.query.filter_by(user_id=user.id).one()
+        lines = {line.variant_id: line.quantity for line in CartLine.query}
+        assert lines == {first.id: 3, second.id: 1}
+        assert cart.quantity == 4
+        assert pending.items() == {}
+
+        # logged in, the adds go to the user hash until the checkout
+        Cart.add_to_currentuser_cart(2, second.id)
+        assert session_cart.SessionCart.current().view(cart).quantity == 6
+        session_cart.merge_into_db(user.id)
+        lines = {line.variant_id: line.quantity for line in CartLine.query}
+        assert lines == {first.id: 3, second.id: 3}
+
+    def test_add_skips_the_sql_cart(self, redis_carts, user, monkeypatch):
+        first, _ = self.setup_variants()
+        login_user(user)
+
+        def lookup():
+            pytest.fail("the sql cart was looked up")
+
+        monkeypatch.setattr(Cart, "get_current_user_cart", lookup)
+        Cart.add_to_currentuser_cart(2, first.id)
+        assert session_cart.SessionCart.current().items() == {first.id: 2}
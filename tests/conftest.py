@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
 """Defines fixtures available to all tests."""
+from contextlib import contextmanager
 
 import pytest
 from webtest import TestApp
 
 from flaskshop.app import create_app
+from flaskshop.corelib import profiler
 from flaskshop.database import db as _db
 from flaskshop.settings import TestConfig
 from flaskshop.random_data import create_menus
@@ -56,3 +58,24 @@ def user(db):
     user = UserFactory(password=TEST_USER_PASSWORD)
     db.session.commit()
     return user
+
+
+@pytest.fixture
+def query_budget():
+    """Fail the test when a block runs more than ``limit`` sql queries::
+
+    with query_budget(3):
+        testapp.get("/")
+    """
+
+    @contextmanager
+    def budget(limit):
+        with profiler.record() as profile:
+            yield profile
+        if profile.queries > limit:
+            statements = "\n".join(
+                f"  {count} x {fp}" for fp, count in profile.fingerprints.most_common()
+            )
+            pytest.fail(f"{profile.queries} queries, budget {limit}:\n{statements}")
+
+    return budget
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Cache codec tests."""
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from flask_sqlalchemy import Pagination
+
+from flaskshop.account.models import User
+from flaskshop.corelib import codec
+from flaskshop.corelib.utils import empty
+
+
+@pytest.mark.parametrize("name", ["json", "msgpack", "pickle"])
+def test_roundtrip_plain_values(name):
+    value = {
+        "list": [1, 2.5, "a", None, True],
+        "tuple": (1, 2),
+        "set": {3},
+        "int_keys": {1: "one"},
+        "when": datetime(2020, 1, 2, 3, 4, 5),
+        "day": date(2020, 1, 2),
+        "price": Decimal("1.10"),
+    }
+    data = codec.encode(value, codec.get_codec(name))
+    assert codec.decode(data) == value
+
+
+def test_compress_above_threshold():
+    value = ["x" * 100] * 10
+    small = codec.encode(value, compress_threshold=0)
+    compressed = codec.encode(value, compress_threshold=100)
+    assert len(compressed) < len(small)
+    assert codec.decode(compressed) == value
+
+
+def test_empty():
+    assert codec.decode(codec.encode(empty)) == empty
+
+
+@pytest.mark.usefixtures("db")
+class TestModelSnapshot:
+    """Model snapshot tests."""
+
+    def test_model_is_revived_detached(self, db):
+        user = User.create(username="foo", email="foo@bar.com", password="123")
+        revived = codec.decode(codec.encode(user))
+
+        assert revived is not user
+        assert revived.id == user.id
+        assert revived.username == "foo"
+        assert revived.created_at == user.created_at
+        revived.nick_name = "bar"
+        db.session.merge(revived)
+        db.session.commit()
+        assert User.query.get(user.id).nick_name == "bar"
+
+    def test_shared_models_stay_shared(self):
+        user = User.create(username="foo", email="foo@bar.com", password="123")
+        pagination = Pagination(None, 1, 16, 1, [user])
+        ctx = {"pagination": pagination, "items": pagination.items, "object": user}
+
+        revived = codec.decode(codec.encode(ctx))
+        assert revived["pagination"].total == 1
+        assert revived["items"][0] is revived["object"]
+        assert revived["pagination"].items[0] is revived["object"]
+
+
+def test_unavailable_codec_warns(caplog, monkeypatch):
+    monkeypatch.setattr(codec, "_missing", set())
+    assert codec.get_codec("missing") is codec.CODECS["json"]
+    codec.get_codec("missing")
+    assert caplog.text.count("cache codec missing is not available") == 1
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Local cache tests."""
+import time
+
+from flaskshop.corelib.local_cache import LRUCache, LocalCache, approx_sizeof
+
+
+class TestLRUCache:
+    """LRUCache tests."""
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+
+    def test_expires_after_ttl(self):
+        cache = LRUCache()
+        cache.set("a", 1, ttl=0.01)
+        cache.set("b", 2)
+        time.sleep(0.02)
+        assert cache.get("a") is None
+        assert cache.get("b") == 2
+
+    def test_counts_hits_and_misses(self):
+        cache = LRUCache()
+        cache.set("a", 1)
+        cache.get("a")
+        cache.get("b")
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_bounded_by_bytes(self):
+        cache = LRUCache(size=100, max_bytes=approx_sizeof("x" * 100) * 2)
+        for key in "abc":
+            cache.set(key, "x" * 100)
+        assert len(cache) == 2
+        assert cache.get("a") is None
+        assert cache.stats()["evictions"] == 1
+
+
+class TestLocalCache:
+    """LocalCache tests."""
+
+    def test_does_not_drop_everything_when_full(self):
+        cache = LocalCache(size=3)
+        for key in "abcd":
+            cache.set(key, key)
+        assert cache.get_list("abcd") == [None, "b", "c", "d"]
+
+    def test_multi(self):
+        cache = LocalCache()
+        cache.set_multi({"a": 1, "b": 2})
+        assert cache.get_multi(["a", "b", "c"]) == {"a": 1, "b": 2, "c": None}
+        cache.delete_multi(["a", "c"])
+        assert cache.get_multi(["a", "b"]) == {"a": None, "b": 2}
+
+    def test_default_ttl(self):
+        cache = LocalCache(ttl=0.01)
+        cache.set("a", 1)
+        time.sleep(0.02)
+        assert cache.get("a") is None
+        assert cache.stats()["expirations"] == 1
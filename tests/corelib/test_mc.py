@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""Cache fetch tests: stale while revalidate and single flight."""
+import pickle
+import threading
+import time
+
+import pytest
+
+from flaskshop.corelib import mc
+
+KEY = "test:fetch"
+LOCK = mc.MC_KEY_LOCK.format(KEY)
+
+
+@pytest.fixture
+def rdb(app, monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    monkeypatch.setitem(app.config, "USE_REDIS", True)
+    r = fakeredis.FakeRedis()
+    monkeypatch.setattr(mc, "rdb", r)
+    return r
+
+
+def _in_thread(app, f, results):
+    def run():
+        with app.app_context():
+            results.append(f())
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+class TestFetch:
+    """mc.fetch tests."""
+
+    def test_stale_value_served_while_one_recomputes(self, app, rdb):
+        stale = mc.dump_value({"v": 1})
+        # soft deadline passed
+        rdb.set(KEY, pickle.dumps((time.time() - 1, 0.01, stale)))
+        computing = threading.Event()
+        release = threading.Event()
+
+        def compute():
+            computing.set()
+            release.wait(5)
+            return {"v": 2}
+
+        results = []
+        thread = _in_thread(
+            app, lambda: mc.fetch(KEY, compute, soft_expire=60), results
+        )
+        assert computing.wait(5)
+        # the lock is taken, the others get the stale value at once
+        assert mc.fetch(KEY, pytest.fail, soft_expire=60) == stale
+        release.set()
+        thread.join(5)
+
+        assert mc.load_value(results[0]) == {"v": 2}
+        assert mc.load_value(mc.fetch(KEY, pytest.fail, soft_expire=60)) == {"v": 2}
+        assert not rdb.exists(LOCK)
+
+    def test_concurrent_misses_compute_once(self, app, rdb):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"v": 1}
+
+        results = []
+        threads = [
+            _in_thread(app, lambda: mc.fetch(KEY, compute, single_flight=True), results)
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.join(5)
+
+        assert len(calls) == 1
+        assert [mc.load_value(r) for r in results] == [{"v": 1}] * 5
+
+    def test_lock_released_when_the_loader_raises(self, rdb):
+        def compute():
+            raise ValueError
+
+        with pytest.raises(ValueError):
+            mc.fetch(KEY, compute, single_flight=True)
+        assert not rdb.exists(LOCK)
+        assert mc.load_value(mc.fetch(KEY, lambda: {"v": 1}, single_flight=True)) == {
+            "v": 1
+        }
+
+    def test_waiters_give_up_after_the_lock_timeout(self, rdb, monkeypatch):
+        monkeypatch.setattr(mc, "LOCK_TIMEOUT", 0.2)
+        # a lock owner that never stores the key
+        rdb.set(LOCK, "other", px=10000)
+
+        started = time.monotonic()
+        assert mc._wait_for(KEY, None) is None
+        assert 0.2 <= time.monotonic() - started < 2
+        # then the waiter computes the value itself
+        value = mc.fetch(KEY, lambda: {"v": 1}, single_flight=True)
+        assert mc.load_value(value) == {"v": 1}
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Metrics tests."""
+import json
+
+import pytest
+
+from flaskshop.corelib import metrics
+
+
+def test_key_family():
+    assert metrics.key_family("product:category:12:products:v3") == "product:category:*"
+    assert metrics.key_family("global:Product:7") == "global:Product:*"
+    assert metrics.key_family("checkout:cart:user_id:1") == "checkout:cart:*"
+    assert metrics.key_family("stock:12") == "stock:*"
+
+
+@pytest.mark.usefixtures("db")
+class TestMetrics:
+    """/metrics tests."""
+
+    def test_exposes_request_metrics(self, testapp):
+        testapp.get("/account/login")
+        res = testapp.get("/metrics")
+        assert res.content_type == "text/plain"
+        assert "# TYPE flaskshop_http_requests_total counter" in res
+        assert (
+            'flaskshop_http_requests_total{endpoint="account.login",'
+            'method="GET",status="200"}'
+        ) in res
+        assert (
+            'flaskshop_http_request_duration_seconds_bucket{endpoint="account.login",'
+            'le="+Inf"}'
+        ) in res
+
+    def test_sums_the_workers(self, app, testapp, tmp_path, monkeypatch):
+        app.config["METRICS_DIR"] = str(tmp_path)
+        monkeypatch.setitem(metrics._flush, "pid", None)
+        testapp.get("/account/login")
+        before = metrics.collect()["flaskshop_http_requests_total"]
+        key = ("account.login", "GET", "200")
+        other = {"flaskshop_http_requests_total": [[list(key), 5]]}
+        (tmp_path / "1.json").write_text(json.dumps(other))
+
+        after = metrics.collect()["flaskshop_http_requests_total"]
+        assert after[key] == before[key] + 5
+        testapp.get("/account/login")
+        assert list(tmp_path.glob("*.json"))
+
+    def test_dead_workers_keep_their_counters_only(self, app, tmp_path):
+        app.config["METRICS_DIR"] = str(tmp_path)
+        key = ("account.login", "GET", "200")
+        dead = {
+            "flaskshop_http_requests_total": [[list(key), 5]],
+            "flaskshop_local_cache_entries": [[["props"], 7]],
+        }
+        before = metrics.collect()
+        for pid in (1001, 1002):
+            (tmp_path / f"{pid}.json").write_text(json.dumps(dead))
+            metrics.mark_dead(str(tmp_path), pid)
+
+        assert [path.name for path in tmp_path.glob("*.json")] == ["dead.json"]
+        after = metrics.collect()
+        requests = after["flaskshop_http_requests_total"]
+        assert requests[key] == before["flaskshop_http_requests_total"].get(key, 0) + 10
+        assert (
+            after["flaskshop_local_cache_entries"]
+            == before["flaskshop_local_cache_entries"]
+        )
+
+    def test_times_the_pool_checkouts(self, testapp):
+        testapp.get("/account/login")
+        res = testapp.get("/metrics")
+        assert "flaskshop_db_pool_wait_seconds_count" in res
+
+    def test_token(self, app, testapp, monkeypatch):
+        monkeypatch.setitem(app.config, "METRICS_TOKEN", "secret")
+        testapp.get("/metrics", status=401)
+        headers = {"Authorization": "Bearer secret"}
+        assert "flaskshop_http" in testapp.get("/metrics", headers=headers)
+
+    def test_exposes_the_local_caches(self, testapp):
+        from flaskshop.corelib.local_cache import lc
+
+        lc.set("metrics:test", 1)
+        lc.get("metrics:test")
+        res = testapp.get("/metrics")
+        assert "# TYPE flaskshop_local_cache_entries gauge" in res
+        assert 'flaskshop_local_cache_requests_total{cache="props",result="hit"}' in res
+        assert (
+            'flaskshop_local_cache_removals_total{cache="l1",reason="evicted"}' in res
+        )
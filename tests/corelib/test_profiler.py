@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Profiler tests."""
+import pytest
+
+from flaskshop.corelib import profiler
+from flaskshop.database import db
+from flaskshop.product.models import ProductVariant
+
+
+def test_fingerprint_folds_literals_and_in_lists():
+    assert profiler.fingerprint(
+        "SELECT * FROM product_variant\n WHERE id = 42 AND sku = 'a''b'"
+    ) == profiler.fingerprint(
+        "SELECT * FROM product_variant WHERE id = 7 AND sku = 'c'"
+    )
+    assert (
+        profiler.fingerprint("SELECT * FROM t WHERE id IN (?, ?, ?)")
+        == profiler.fingerprint("SELECT * FROM t WHERE id IN (?)")
+        == "SELECT * FROM t WHERE id IN (?)"
+    )
+    assert profiler.fingerprint("SELECT a_1 FROM t_2") == "SELECT a_1 FROM t_2"
+
+
+@pytest.mark.usefixtures("db")
+class TestProfiler:
+    """Request profiles."""
+
+    def test_records_repeated_statements(self):
+        query = ProductVariant.__table__.select().where(ProductVariant.id == 1)
+        with profiler.record() as profile:
+            for _ in range(5):
+                db.session.execute(query)
+        assert profile.queries == 5
+        ((fp, count),) = profile.repeated(5)
+        assert count == 5
+        assert "FROM product_variant" in fp
+
+    def test_counts_redis_calls(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        profiler.instrument_redis()
+        rdb = fakeredis.FakeRedis()
+        with profiler.record() as profile:
+            rdb.set("a", 1)
+            pipe = rdb.pipeline()
+            pipe.get("a")
+            pipe.get("b")
+            pipe.execute()
+        assert profile.redis_calls == 2
+
+    def test_response_headers(self, app, testapp):
+        app.config["PROFILER_HEADERS"] = True
+        res = testapp.get("/account/login")
+        assert int(res.headers["X-Profile-Queries"]) >= 0
+        assert "X-Profile-Redis-Calls" in res.headers
+
+    def test_query_budget(self, testapp, query_budget):
+        testapp.get("/account/login")
+        with pytest.raises(pytest.fail.Exception, match="budget 0"):
+            with query_budget(0):
+                db.session.execute(ProductVariant.__table__.select())
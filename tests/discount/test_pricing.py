@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""Effective price tests."""
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+from flaskshop.constant import DiscountValueTypeKinds
+from flaskshop.discount import models as discount_models
+from flaskshop.discount.models import Sale, SaleCategory, SaleProduct, update_prices
+from flaskshop.product import models as product_models
+from flaskshop.product.models import (
+    MC_NS_CATEGORY_PRODUCTS,
+    MC_NS_PRICES,
+    Category,
+    Product,
+)
+
+
+def _product(price, category_id=1):
+    return Product.create(title="foo", basic_price=price, category_id=category_id)
+
+
+@pytest.mark.usefixtures("db")
+class TestUpdatePrices:
+    """update_prices tests."""
+
+    def test_without_sale(self):
+        product = _product(10)
+        assert product.price == 10
+        assert product.effective_price == Decimal("10.00")
+        assert not product.is_discounted
+
+    def test_product_sale_wins_over_category_sale(self):
+        product = _product(10)
+        other = _product(20)
+        percent = Sale.create(
+            title="half",
+            discount_value_type=DiscountValueTypeKinds.percent.value,
+            discount_value=50,
+        )
+        fixed = Sale.create(
+            title="one off",
+            discount_value_type=DiscountValueTypeKinds.fixed.value,
+            discount_value=1,
+        )
+        SaleCategory.create(sale_id=percent.id, category_id=1)
+        SaleProduct.create(sale_id=fixed.id, product_id=product.id)
+
+        assert product.price == Decimal("9.00")
+        assert other.price == Decimal("10.00")
+
+        fixed.delete()
+        assert product.price == Decimal("5.00")
+
+    def test_follows_basic_price_and_sorts(self):
+        cheap = _product(10)
+        expensive = _product(5)
+        expensive.update(basic_price=30)
+
+        assert expensive.price == 30
+        query = Product.query.order_by(Product.effective_price.desc())
+        assert query.all() == [expensive, cheap]
+
+    def test_recompute_all(self):
+        _product(10)
+        Product.query.update({"effective_price": None})
+
+        assert update_prices() == 1
+        assert Product.query.first().effective_price == Decimal("10.00")
+
+    def test_product_edit_bumps_its_listings_only(self, monkeypatch):
+        parent = Category.create(title="clothes")
+        child = Category.create(title="shirts", parent_id=parent.id)
+        product = _product(10, category_id=child.id)
+        sale = Sale.create(
+            title="half",
+            discount_value_type=DiscountValueTypeKinds.percent.value,
+            discount_value=50,
+        )
+        bumped = []
+        for module in (product_models, discount_models):
+            monkeypatch.setattr(module, "bump_ns", bumped.append)
+
+        product.update(basic_price=20)
+        assert MC_NS_PRICES not in bumped
+        assert MC_NS_CATEGORY_PRODUCTS.format(child.id) in bumped
+        assert MC_NS_CATEGORY_PRODUCTS.format(parent.id) in bumped
+
+        bumped.clear()
+        SaleCategory.create(sale_id=sale.id, category_id=child.id)
+        assert MC_NS_PRICES in bumped
+
+    def test_percent_sale_sql_runs_on_postgres(self):
+        product = _product(10)
+        sale = Sale.create(
+            title="third",
+            discount_value_type=DiscountValueTypeKinds.percent.value,
+            discount_value=33,
+        )
+        statements = []
+
+        def record(state):
+            statements.append(state.statement)
+
+        event.listen(Session, "do_orm_execute", record)
+        try:
+            SaleProduct.create(sale_id=sale.id, product_id=product.id)
+        finally:
+            event.remove(Session, "do_orm_execute", record)
+
+        assert product.price == Decimal("6.70")
+        # postgres has no round(double precision, integer)
+        sql = [str(s.compile(dialect=postgresql.dialect())) for s in statements]
+        rounds = [line for line in sql if "round(" in line]
+        assert rounds
+        assert all("round(CAST(" in line for line in rounds)
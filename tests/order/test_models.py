@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""Order model tests."""
+from datetime import datetime, timedelta
+
+import pytest
+from flask_login import login_user
+
+from flaskshop import commands, database
+from flaskshop.checkout.models import Cart, CartLine
+from flaskshop.constant import OrderEvents, OrderStatusKinds, PaymentStatusKinds
+from flaskshop.corelib import mc, metrics
+from flaskshop.database import db
+from flaskshop.order.models import Order, OrderEvent, OrderLine, OrderPayment
+from flaskshop.product import stock
+from flaskshop.product.models import Product, ProductType, ProductVariant
+
+
+def _order(variants, quantity=1):
+    order = Order.create(
+        token=str(len(Order.query.all())),
+        user_id=1,
+        status=OrderStatusKinds.unfulfilled.value,
+    )
+    for variant in variants:
+        OrderLine.create(order_id=order.id, variant_id=variant.id, quantity=quantity)
+    return order
+
+
+def _variant(id):
+    db.session.expire_all()
+    return ProductVariant.query.get(id)
+
+
+@pytest.mark.usefixtures("db")
+class TestCloseOrders:
+    """Order.pay_success_many and Order.cancel_many tests."""
+
+    def setup_variants(self):
+        return [
+            ProductVariant.create(
+                sku=f"1-{i}", product_id=1, quantity=10, quantity_allocated=6
+            )
+            for i in range(2)
+        ]
+
+    def test_pay_success_many(self):
+        first, second = self.setup_variants()
+        orders = [_order([first, second], 2), _order([first]), _order([second])]
+        orders[2].update(status=OrderStatusKinds.canceled.value)
+
+        ids = [order.id for order in orders]
+        assert Order.pay_success_many(ids + ids[:1]) == ids[:2]
+        assert Order.pay_success_many(ids) == []
+        first, second = _variant(first.id), _variant(second.id)
+        assert (first.quantity, first.quantity_allocated) == (7, 3)
+        assert (second.quantity, second.quantity_allocated) == (8, 4)
+        statuses = [Order.query.get(id).status for id in ids]
+        assert statuses == [
+            OrderStatusKinds.fulfilled.value,
+            OrderStatusKinds.fulfilled.value,
+            OrderStatusKinds.canceled.value,
+        ]
+        events = OrderEvent.query.filter_by(
+            type_=OrderEvents.payment_captured.value
+        ).all()
+        assert sorted(event.order_id for event in events) == ids[:2]
+
+    def test_cancel(self):
+        first, _ = self.setup_variants()
+        order = _order([first], 4)
+        order.cancel()
+        assert order.status == OrderStatusKinds.canceled.value
+        assert _variant(first.id).quantity == 10
+        assert _variant(first.id).quantity_allocated == 2
+
+    def test_payment_pay_success_many(self):
+        first, _ = self.setup_variants()
+        order = _order([first])
+        OrderPayment.create(
+            order_id=order.id,
+            payment_no="no-1",
+            status=PaymentStatusKinds.waiting.value,
+        )
+        paid_at = datetime(2020, 1, 1)
+        assert OrderPayment.pay_success_many(["no-1"], paid_at) == [order.id]
+        assert OrderPayment.pay_success_many(["no-1"], paid_at) == []
+        db.session.expire_all()
+        payment = OrderPayment.query.filter_by(payment_no="no-1").one()
+        assert payment.status == PaymentStatusKinds.confirmed.value
+        assert payment.paid_at == paid_at
+        assert Order.query.get(order.id).status == OrderStatusKinds.fulfilled.value
+
+    def test_expire_unpaid(self):
+        first, _ = self.setup_variants()
+        stale = [_order([first]) for _ in range(3)]
+        fresh = _order([first])
+        long_ago = datetime.utcnow() - timedelta(hours=1)
+        for order in stale:
+            order.update(created_at=long_ago)
+
+        metrics = Order.expire_unpaid(timedelta(minutes=30), batch_size=2)
+        assert (metrics["expired"], metrics["batches"]) == (3, 2)
+        assert metrics["lag"] >= 30 * 60
+        db.session.expire_all()
+        assert [Order.query.get(order.id).status for order in stale + [fresh]] == [
+            OrderStatusKinds.canceled.value
+        ] * 3 + [OrderStatusKinds.unfulfilled.value]
+        assert _variant(first.id).quantity_allocated == 3
+        assert (
+            OrderEvent.query.filter_by(type_=OrderEvents.order_expired.value).count()
+            == 3
+        )
+
+    def test_expiry_and_late_payment(self, caplog):
+        first, _ = self.setup_variants()
+        order = _order([first])
+        payment = OrderPayment.create(
+            order_id=order.id,
+            payment_no="no-1",
+            status=PaymentStatusKinds.waiting.value,
+        )
+        long_ago = datetime.utcnow() - timedelta(hours=1)
+        order.update(created_at=long_ago)
+
+        # the customer is paying, the gateway may still notify
+        assert Order.expire_unpaid(timedelta(minutes=30))["expired"] == 0
+        payment.update(updated_at=long_ago)
+        assert Order.expire_unpaid(timedelta(minutes=30))["expired"] == 1
+
+        paid_at = datetime(2020, 1, 1)
+        assert OrderPayment.pay_success_many(["no-1"], paid_at) == []
+        db.session.expire_all()
+        payment = OrderPayment.query.filter_by(payment_no="no-1").one()
+        assert payment.status == PaymentStatusKinds.waiting.value
+        assert payment.paid_at == paid_at
+        assert Order.query.get(order.id).status == OrderStatusKinds.canceled.value
+        assert "payment no-1 of the closed order" in caplog.text
+
+    def test_expire_orders_command(self, app):
+        first, _ = self.setup_variants()
+        order_id = _order([first]).id
+        before = metrics.ORDERS_EXPIRED.values.get((), 0)
+
+        # a zero ttl is not the configured one
+        result = app.test_cli_runner().invoke(commands.expire_orders, ["--ttl", "0"])
+        assert "expired 1 orders" in result.output
+        assert metrics.ORDERS_EXPIRED.values[()] == before + 1
+        assert Order.query.get(order_id).status == OrderStatusKinds.canceled.value
+
+
+@pytest.mark.usefixtures("db")
+class TestCreateOrder:
+    """Order.create_whole_order tests."""
+
+    def test_failed_commit_gives_the_hot_stock_back(self, app, user, monkeypatch):
+        fakeredis = pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")
+        monkeypatch.setitem(app.config, "USE_REDIS", True)
+        monkeypatch.setitem(app.config, "STOCK_HOT_SKUS_ENABLED", True)
+        r = fakeredis.FakeRedis()
+        for module in (stock, mc, database):
+            monkeypatch.setattr(module, "rdb", r)
+        ProductType.create(title="shipped", is_shipping_required=True)
+        product = Product.create(title="shirt", basic_price=10, product_type_id=1)
+        variant = ProductVariant.create(sku="1-1", product_id=product.id, quantity=5)
+        stock.flag_hot([variant.id])
+        login_user(user)
+        cart = Cart.query.filter_by(user_id=user.id).first() or Cart.create(
+            user_id=user.id, quantity=2
+        )
+        CartLine.create(cart_id=cart.id, variant_id=variant.id, quantity=2)
+
+        def deadlock():
+            raise RuntimeError("deadlock")
+
+        with monkeypatch.context() as m:
+            m.setattr(db.session, "commit", deadlock)
+            assert Order.create_whole_order(cart) == (False, "deadlock")
+        assert stock.available(variant) == 5
+        assert Order.query.count() == 0
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Product facet index tests."""
+import pytest
+
+from flaskshop.product.models import Product, ProductFacet
+
+
+def _facets(product):
+    rows = ProductFacet.query.filter_by(product_id=product.id).all()
+    return {row.attribute_id: row.value_id for row in rows}
+
+
+def _product(**attributes):
+    return Product.create(
+        title="foo", basic_price=10, category_id=1, attributes=attributes
+    )
+
+
+@pytest.mark.usefixtures("db")
+class TestProductFacet:
+    """ProductFacet tests."""
+
+    def test_follows_product_attributes(self):
+        product = _product(**{"1": "10", "2": "20"})
+        assert _facets(product) == {1: 10, 2: 20}
+
+        product.attributes["2"] = "21"
+        product.save()
+        assert _facets(product) == {1: 10, 2: 21}
+
+        product.delete()
+        assert ProductFacet.query.count() == 0
+
+    def test_filter_and_count(self):
+        blue_s = _product(**{"1": "10", "2": "20"})
+        blue_m = _product(**{"1": "10", "2": "21"})
+        _product(**{"1": "11", "2": "20"})
+        query = Product.query.filter(Product.category_id == 1)
+
+        found = ProductFacet.filter_products(query, {1: 10}).all()
+        assert set(found) == {blue_s, blue_m}
+        assert ProductFacet.filter_products(query, {1: 10, 2: 21}).all() == [blue_m]
+
+        # the selected attribute keeps the counts of its other values
+        assert ProductFacet.count_values(query, {1: 10}) == {10: 2, 11: 1, 20: 1, 21: 1}
+
+    def test_rebuild(self):
+        product = _product(**{"1": "10"})
+        ProductFacet.query.delete()
+
+        assert ProductFacet.rebuild() == 1
+        assert _facets(product) == {1: 10}
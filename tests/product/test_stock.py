@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""Stock reservation tests."""
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from flaskshop.database import db
+from flaskshop.product import stock
+from flaskshop.product.models import ProductVariant
+
+
+def _variant(sku, quantity):
+    return ProductVariant.create(sku=sku, product_id=1, quantity=quantity)
+
+
+def _allocated(variant_id):
+    db.session.expire_all()
+    return ProductVariant.query.get(variant_id).quantity_allocated
+
+
+@pytest.mark.usefixtures("db")
+class TestReserve:
+    """stock.reserve tests."""
+
+    def test_all_or_nothing(self):
+        enough = _variant("1-1", 5)
+        short = _variant("1-2", 1)
+
+        failures = stock.reserve({enough.id: 2, short.id: 2})
+        db.session.commit()
+        assert failures == {short.id: 2}
+        assert _allocated(enough.id) == 0
+        assert _allocated(short.id) == 0
+
+        assert stock.reserve({enough.id: 2, short.id: 1}) == {}
+        db.session.commit()
+        assert _allocated(enough.id) == 2
+        assert _allocated(short.id) == 1
+
+    def test_release(self):
+        variant = _variant("1-1", 5)
+        stock.reserve({variant.id: 3})
+        stock.release({variant.id: 2})
+        db.session.commit()
+        assert _allocated(variant.id) == 1
+
+    def test_no_oversell_under_concurrent_checkouts(self, app):
+        variants = [_variant(f"1-{i}", 40) for i in range(3)]
+        ids = [variant.id for variant in variants]
+        rng = random.Random(0)
+        carts = [
+            {id: rng.randint(1, 3) for id in rng.sample(ids, rng.randint(1, 3))}
+            for _ in range(300)
+        ]
+
+        def checkout(cart):
+            with app.app_context():
+                failures = stock.reserve(cart)
+                db.session.commit()
+                db.session.remove()
+                return cart if not failures else None
+
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            accepted = [cart for cart in pool.map(checkout, carts) if cart]
+
+        assert accepted
+        for id in ids:
+            expected = sum(cart.get(id, 0) for cart in accepted)
+            assert _allocated(id) == expected <= 40
+
+
+@pytest.fixture
+def hot_redis(app, monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    monkeypatch.setitem(app.config, "USE_REDIS", True)
+    monkeypatch.setitem(app.config, "STOCK_HOT_SKUS_ENABLED", True)
+    r = fakeredis.FakeRedis()
+    monkeypatch.setattr(stock, "rdb", r)
+    return r
+
+
+@pytest.mark.usefixtures("db")
+class TestHotSkus:
+    """Variants counted in redis."""
+
+    def test_reserve_reconcile_rebuild(self, hot_redis):
+        hot = _variant("1-1", 5)
+        cold = _variant("1-2", 5)
+        stock.flag_hot([hot.id])
+
+        assert stock.reserve({hot.id: 2, cold.id: 1}) == {}
+        db.session.commit()
+        assert stock.available(hot) == 3
+        assert _allocated(hot.id) == 0
+        # the cold variant is short, the hot one gets its stock back
+        assert stock.reserve({hot.id: 1, cold.id: 9}) == {cold.id: 9}
+        assert stock.reserve({hot.id: 4}) == {hot.id: 4}
+        assert stock.available(hot) == 3
+
+        assert stock.reconcile() == 1
+        assert _allocated(hot.id) == 2
+        assert stock.reconcile() == 0
+        stock.release({hot.id: 1})
+        stock.reconcile()
+        assert _allocated(hot.id) == 1
+        assert stock.available(hot) == 4
+
+        # no unpaid order holds it, redis and the row restart from zero
+        hot_redis.flushdb()
+        stock.flag_hot([hot.id])
+        assert stock.rebuild() == [hot.id]
+        assert _allocated(hot.id) == 0
+        assert stock.available(hot) == 5
+
+    def test_no_oversell_under_concurrent_checkouts(self, app, hot_redis):
+        variant = _variant("1-1", 40)
+        stock.flag_hot([variant.id])
+        carts = [{variant.id: random.Random(i).randint(1, 3)} for i in range(100)]
+
+        def checkout(cart):
+            with app.app_context():
+                return cart if not stock.reserve(cart) else None
+
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            accepted = [cart for cart in pool.map(checkout, carts) if cart]
+
+        expected = sum(cart[variant.id] for cart in accepted)
+        assert 0 <= stock.available(variant) == 40 - expected
+        stock.reconcile()
+        assert _allocated(variant.id) == expected
+
+    def test_reconcile_after_a_crash_writes_the_deltas_once(
+        self, hot_redis, monkeypatch
+    ):
+        variant = _variant("1-1", 5)
+        stock.flag_hot([variant.id])
+        assert stock.reserve({variant.id: 2}) == {}
+
+        def crash(*keys):
+            raise ConnectionError
+
+        # committed, then the deltas could not be deleted
+        with monkeypatch.context() as m, pytest.raises(ConnectionError):
+            m.setattr(hot_redis, "delete", crash)
+            stock.reconcile()
+        assert _allocated(variant.id) == 2
+        assert hot_redis.exists(stock.MC_KEY_DELTAS_FLUSHING)
+
+        assert stock.reserve({variant.id: 1}) == {}
+        assert stock.reconcile() == 0
+        assert _allocated(variant.id) == 2
+        assert not hot_redis.exists(stock.MC_KEY_DELTAS_FLUSHING)
+        # the new deltas come in the next batch
+        assert stock.reconcile() == 1
+        assert _allocated(variant.id) == 3
+        assert stock.available(variant) == 2
+
+    def test_reconcile_runs_one_at_a_time(self, hot_redis):
+        variant = _variant("1-1", 5)
+        stock.flag_hot([variant.id])
+        assert stock.reserve({variant.id: 2}) == {}
+
+        hot_redis.set(stock.MC_KEY_RECONCILE_LOCK, "other")
+        assert stock.reconcile() == 0
+        assert _allocated(variant.id) == 0
+        hot_redis.delete(stock.MC_KEY_RECONCILE_LOCK)
+        assert stock.reconcile() == 1
+        assert _allocated(variant.id) == 2
+        assert not hot_redis.exists(stock.MC_KEY_RECONCILE_LOCK)
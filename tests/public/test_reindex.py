@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""Search reindex tests."""
+import pytest
+
+from flaskshop.product.models import Product, ProductImage
+from flaskshop.public import search
+
+
+class FakeIndices:
+    """The part of the indices api ``search.reindex`` uses."""
+
+    def __init__(self):
+        self.indexes = {}
+
+    def create(self, index, body):
+        self.indexes[index] = dict(aliases=set(), meta={}, docs={}, body=body)
+
+    def delete(self, index, ignore=None):
+        self.indexes.pop(index)
+
+    def exists(self, index):
+        return index in self.indexes or self.exists_alias(index)
+
+    def exists_alias(self, name):
+        return any(name in i["aliases"] for i in self.indexes.values())
+
+    def get_alias(self, index=None, name=None):
+        prefix = index.rstrip("*") if index else ""
+        return {
+            key: {"aliases": {alias: {} for alias in i["aliases"]}}
+            for key, i in self.indexes.items()
+            if key.startswith(prefix) and (name is None or name in i["aliases"])
+        }
+
+    def get_mapping(self, index):
+        return {index: {"mappings": {"_meta": self.indexes[index]["meta"]}}}
+
+    def put_mapping(self, index, body):
+        self.indexes[index]["meta"] = body["_meta"]
+
+    def put_settings(self, index, body):
+        pass
+
+    def refresh(self, index):
+        pass
+
+    def update_aliases(self, body):
+        for action in body["actions"]:
+            ((op, args),) = action.items()
+            if op == "add":
+                self.indexes[args["index"]]["aliases"].add(args["alias"])
+            elif op == "remove":
+                self.indexes[args["index"]]["aliases"].discard(args["alias"])
+            else:
+                self.indexes.pop(args["index"])
+
+
+@pytest.fixture
+def es(monkeypatch):
+    """A fake elasticsearch, the product ids in ``es.failing`` fail."""
+
+    def parallel_bulk(client, actions, **kwargs):
+        for action in actions:
+            docs = es.indices.indexes[action["_index"]]["docs"]
+            id, status = action["_id"], 201
+            if int(id) in es.failing:
+                status = 500
+            elif id in docs:
+                status = 409
+            else:
+                docs[id] = action["_source"]
+            yield status == 201, {"create": {"_id": id, "status": status}}
+
+    es.indices = FakeIndices()
+    es.failing = set()
+    monkeypatch.setattr(search, "parallel_bulk", parallel_bulk)
+    monkeypatch.setattr(search.Item, "get_es", classmethod(lambda cls: es))
+    return es
+
+
+def _products(count):
+    products = [
+        Product.create(title=f"p{n}", basic_price=10, category_id=1)
+        for n in range(count)
+    ]
+    for product in products[::2]:
+        ProductImage.create(image="placeholders/1.png", product_id=product.id)
+    return products
+
+
+@pytest.mark.usefixtures("db")
+class TestReindex:
+    """search.reindex tests."""
+
+    def test_bulk_item_data(self):
+        products = _products(3)
+        assert list(search.get_items_data(products)) == [
+            search.get_item_data(product) for product in products
+        ]
+
+    def test_swap_and_resume(self, es):
+        ids = [product.id for product in _products(4)]
+        # the index made before the aliases
+        es.indices.create("flaskshop", {})
+        es.failing = {ids[2]}
+        with pytest.raises(RuntimeError):
+            for _ in search.reindex(window=1):
+                pass
+        (building,) = search.building_indexes(es)
+        assert es.indices.exists_alias("flaskshop") is False
+        assert es.indices.get_mapping(building)[building]["mappings"]["_meta"] == {
+            "checkpoint": ids[1]
+        }
+
+        es.failing = set()
+        messages = list(search.reindex(resume=True, window=1))
+        assert messages[0] == f"Resuming {building} after product {ids[1]}"
+        assert list(es.indices.get_alias(name="flaskshop")) == [building]
+        docs = es.indices.indexes[building]["docs"]
+        assert sorted(docs) == sorted(f"{id}" for id in ids)
+        assert search.building_indexes(es) == []
+
+        # a new build replaces it
+        list(search.reindex())
+        (live,) = es.indices.get_alias(name="flaskshop")
+        assert live != building
+        assert list(es.indices.indexes) == [live]
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Search outbox tests."""
+import pytest
+
+from flaskshop.product.models import Product, SearchOutbox
+from flaskshop.public import search
+
+
+def _queued():
+    return sorted(row.product_id for row in SearchOutbox.query)
+
+
+@pytest.fixture
+def use_es(app, monkeypatch):
+    monkeypatch.setitem(app.config, "USE_ES", True)
+
+
+@pytest.fixture
+def bulk(monkeypatch):
+    """A fake ``parallel_bulk``, the ids in ``bulk.failing`` fail."""
+
+    def parallel_bulk(client, actions, **kwargs):
+        for action in actions:
+            bulk.actions.append(action)
+            op_type, id = action["_op_type"], action["_id"]
+            status = 500 if int(id) in bulk.failing else 200
+            yield status == 200, {op_type: {"_id": id, "status": status}}
+
+    bulk.actions = []
+    bulk.failing = set()
+    monkeypatch.setattr(search, "parallel_bulk", parallel_bulk)
+    monkeypatch.setattr(search.Item, "get_es", classmethod(lambda cls: None))
+    monkeypatch.setattr(search, "building_indexes", lambda es: [])
+    return bulk
+
+
+@pytest.mark.usefixtures("db", "use_es")
+class TestSearchOutbox:
+    """Product changes queued for elasticsearch."""
+
+    def test_changes_are_queued_with_the_product(self):
+        product = Product.create(title="foo", basic_price=10, category_id=1)
+        assert product.id in _queued()
+
+        SearchOutbox.query.delete()
+        product.update(title="bar")
+        assert _queued() == [product.id]
+        product.delete()
+        assert _queued() == [product.id, product.id]
+
+    def test_index_dedupes_and_retries(self, bulk):
+        kept = Product.create(title="kept", basic_price=10, category_id=1)
+        broken = Product.create(title="broken", basic_price=10, category_id=1)
+        kept.update(title="kept again")
+        SearchOutbox.record([404])
+        bulk.failing = {broken.id}
+
+        run = search.index_outbox()
+        assert run["indexed"] == 2
+        assert run["failed"] == 1
+        assert run["merged"] > 0
+        ops = {int(a["_id"]): a["_op_type"] for a in bulk.actions}
+        assert ops == {kept.id: "index", broken.id: "index", 404: "delete"}
+        assert len(bulk.actions) == 3
+
+        rows = SearchOutbox.query.all()
+        assert {row.product_id for row in rows} == {broken.id}
+        assert all(row.attempts == 1 and row.retry_at for row in rows)
+        # backing off, nothing to send until the retry time
+        bulk.actions = []
+        assert search.index_outbox()["indexed"] == 0
+        assert bulk.actions == []
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""Site snapshot tests."""
+import pytest
+
+from flaskshop.dashboard.models import Setting
+from flaskshop.public.models import MenuItem
+
+
+@pytest.mark.usefixtures("db")
+class TestSiteSnapshot:
+    """Settings and menus of the context processors."""
+
+    def test_page_render_runs_no_query_for_the_site(self, testapp, query_budget):
+        testapp.get("/account/login")
+        with query_budget(0):
+            res = testapp.get("/account/login")
+        assert "Simple2B Store" in res
+
+    def test_writes_reload_the_snapshot(self, testapp):
+        testapp.get("/account/login")
+        Setting.update({"project_title": "Other Store"})
+        footer = MenuItem.query.filter_by(position=2, parent_id=0).first()
+        MenuItem.create(title="Fresh child", parent_id=footer.id, url_="/fresh")
+
+        res = testapp.get("/account/login")
+        assert "Other Store" in res
+        assert "Fresh child" in res
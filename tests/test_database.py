@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""Database mixin tests."""
+import threading
+
+import pytest
+from flask import g
+
+from flaskshop.account.models import User
+from flaskshop.database import db, forget_loaded_records
+from flaskshop.product.models import Product
+
+
+@pytest.mark.usefixtures("db")
+class TestGetMulti:
+    """CRUDMixin.get_multi tests."""
+
+    def test_keeps_order_of_ids(self):
+        users = [
+            User.create(username=f"foo{i}", email=f"foo{i}@bar.com", password="123")
+            for i in range(3)
+        ]
+        ids = [users[2].id, users[0].id, str(users[1].id)]
+
+        retrieved = User.get_multi(ids)
+        assert retrieved == [users[2], users[0], users[1]]
+
+    def test_unknown_ids_give_none(self):
+        user = User.create(username="foo", email="foo@bar.com", password="123")
+
+        assert User.get_multi([user.id, 9999, "abc"]) == [user, None, None]
+
+    def test_records_are_kept_for_the_request_only(self, app):
+        user = User.create(username="foo", email="foo@bar.com", password="123")
+        User.get_multi([user.id])
+        assert g.loaded_records == {("User", user.id): user}
+        forget_loaded_records()
+        assert "loaded_records" not in g
+
+        # the app context of a long running command keeps nothing
+        def command():
+            with app.app_context():
+                User.get_multi([user.id])
+                kept.append("loaded_records" in g)
+
+        kept = []
+        thread = threading.Thread(target=command)
+        thread.start()
+        thread.join(5)
+        assert kept == [False]
+
+
+@pytest.mark.usefixtures("db")
+class TestAfterFlush:
+    """Work of the flush events, run after the flush."""
+
+    def test_runs_once_with_the_ids_of_the_flush(self, monkeypatch):
+        calls = []
+
+        def update_prices(product_ids):
+            # the session is usable again
+            calls.append((product_ids, Product.query.count()))
+
+        monkeypatch.setattr(Product, "update_prices", update_prices)
+        products = [Product(title="foo", basic_price=10) for _ in range(3)]
+        db.session.add_all(products)
+        db.session.commit()
+
+        assert calls == [([product.id for product in products], 3)]